@@ -0,0 +1,144 @@
+# benchmark-stats.py -- the integer and numpy fast paths of simplestat.stats
+# against the plain sort/Counter paths, and the thresholds that pick them
+
+# libraries
+import argparse, os, random, sys, timeit
+from array import array
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from simplestat import _optional, stats
+
+
+def seconds(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def sorted_median(numbers):
+    values = sorted(numbers)
+    mid = len(values) // 2
+    if len(values) % 2 == 0:
+        return (values[mid - 1] + values[mid]) / 2
+    return values[mid]
+
+
+def counting_median(numbers):
+    return stats._counting_median(Counter(numbers), len(numbers))
+
+
+def counting_ratio(n, repeat):
+    # _COUNTING_RATIO: counting beats sorting while the value range stays
+    # below n // ratio
+    print(f"\nmedian of {n} ints, range = n / ratio")
+    print(f"{'ratio':>6} {'sort':>8} {'counting':>9} {'speedup':>8}")
+    for ratio in [128, 64, 32, 16, 8, 4]:
+        numbers = [random.randrange(n // ratio) for _ in range(n)]
+        sort = seconds(lambda: sorted_median(numbers), repeat)
+        counting = seconds(lambda: counting_median(numbers), repeat)
+        marker = "  <- _COUNTING_RATIO" if ratio == stats._COUNTING_RATIO else ""
+        print(
+            f"{ratio:>6} {sort:>8.3f} {counting:>9.3f} {sort / counting:>7.1f}x{marker}"
+        )
+
+
+def sample_size(n, repeat):
+    # _SAMPLE_SIZE: what turning away wide or mixed data costs before the
+    # sort, relative to the sort itself; a full type scan is shown for scale
+    print(f"\nmedian of {n} ints the sample turns away, cost relative to the sort")
+    print(f"{'sample':>7} {'wide':>8} {'mixed':>8} {'full scan':>10}")
+    wide = [random.randrange(10**9) for _ in range(n)]
+    mixed = [x + 0.5 if i % 100 == 1 else x for i, x in enumerate(wide)]
+    sort = seconds(lambda: sorted(wide), repeat)
+    scan = seconds(lambda: set(map(type, wide)), repeat) / sort
+    default = stats._SAMPLE_SIZE
+    for size in [256, 1024, 4096, 16384]:
+        stats._SAMPLE_SIZE = size
+        costs = [
+            seconds(lambda: stats._dense_int_counts(numbers), repeat) / sort
+            for numbers in [wide, mixed]
+        ]
+        marker = "  <- _SAMPLE_SIZE" if size == default else ""
+        print(f"{size:>7} {costs[0]:>8.2%} {costs[1]:>8.2%} {scan:>10.2%}{marker}")
+    stats._SAMPLE_SIZE = default
+
+
+def numpy_paths(n, repeat):
+    # each numpy or integer path against the path it replaces
+    np = _optional.numpy()
+    dense = [random.randrange(1000) for _ in range(n)]
+    wide = [random.randrange(-(10**12), 10**12) for _ in range(n)]
+    # (label, plain path, its input, fast path, its input)
+    cases = [
+        (
+            "variance, integer vs float",
+            stats.variance,
+            [float(x) for x in dense],
+            stats.variance,
+            dense,
+        ),
+    ]
+    if np is not None:
+        cases += [
+            (
+                "median, partition vs sort",
+                sorted_median,
+                wide,
+                stats.median,
+                np.array(wide),
+            ),
+            (
+                "median, array('q') vs sort",
+                sorted_median,
+                wide,
+                stats.median,
+                array("q", wide),
+            ),
+            (
+                "mode, bincount vs Counter",
+                stats.mode,
+                dense,
+                stats.mode,
+                np.array(dense),
+            ),
+            (
+                "mode, unique vs Counter",
+                stats.mode,
+                wide + [7, 7],
+                stats.mode,
+                np.array(wide + [7, 7]),
+            ),
+            ("mean, exact int64 vs sum", stats.mean, wide, stats.mean, np.array(wide)),
+            (
+                "variance, exact int64 vs int",
+                stats.variance,
+                dense,
+                stats.variance,
+                np.array(dense),
+            ),
+            # the squares overflow int64, so the exact sums fall back to
+            # Python ints; this should cost about the same as the plain path
+            (
+                "variance, int64 overflow",
+                stats.variance,
+                wide,
+                stats.variance,
+                np.array(wide),
+            ),
+        ]
+    print(f"\n{n} values")
+    print(f"{'path':<32} {'plain':>8} {'fast':>8} {'speedup':>8}")
+    for label, plain, plain_data, fast, fast_data in cases:
+        before = seconds(lambda: plain(plain_data), repeat)
+        after = seconds(lambda: fast(fast_data), repeat)
+        print(f"{label:<32} {before:>8.3f} {after:>8.3f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python benchmark-stats.py")
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    random.seed(0)
+    counting_ratio(args.size, args.repeat)
+    sample_size(args.size, args.repeat)
+    numpy_paths(args.size, args.repeat)
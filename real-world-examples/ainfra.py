@@ -0,0 +1,401 @@
+# ainfra.py -- asyncio interface to infra
+
+# libraries
+import os, time, random
+import asyncio, threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import infra
+
+# boto3 has no asyncio transport, so blocking infra calls run on one shared,
+# bounded executor; what waits between calls (backoff, polling) happens on the
+# event loop, holds no thread and can be cancelled right away
+
+# global variables
+
+# threads for blocking calls; as many as infra's clients have pooled
+# connections, so calls never queue for a connection
+AIO_WORKERS = 32
+
+executor = None
+executor_lock = threading.Lock()
+
+
+# executor
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=AIO_WORKERS, thread_name_prefix="ainfra"
+            )
+        return executor
+
+
+def shutdown():
+    # calls that have not started yet are cancelled
+    global executor
+    with executor_lock:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = None
+
+
+async def run(function, *args, timeout=None, **kwargs):
+    # runs a blocking function on the executor. When the awaiting task is
+    # cancelled or times out, a call that has not started is dropped; one that
+    # has started finishes in its thread (boto3 calls cannot be interrupted)
+    # and its result is thrown away.
+    future = get_executor().submit(function, *args, **kwargs)
+    return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+
+def close_after(future, iterator):
+    # a generator can only be closed once its running next() has returned
+    if future is not None:
+        wait([future])
+    iterator.close()
+
+
+async def iterate(iterator, timeout=None):
+    # async version of a blocking infra generator; each item is read on the
+    # executor, and leaving the loop early closes the generator
+    done = object()
+    future = None
+    try:
+        while True:
+            future = get_executor().submit(next, iterator, done)
+            item = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            if item is done:
+                return
+            yield item
+    finally:
+        # closing waits for the generator's own calls to finish, so it happens
+        # on a thread of its own: not on the event loop, and not on the
+        # executor, where it could hold a worker the pending next() needs
+        threading.Thread(
+            target=close_after,
+            args=(future, iterator),
+            name="ainfra-close",
+            daemon=True,
+        ).start()
+
+
+# listings
+async def list_instances(
+    name=None, instance_id=None, refresh=False, regions=None, timeout=None
+):
+    return await run(
+        infra.list_instances,
+        name=name,
+        instance_id=instance_id,
+        refresh=refresh,
+        regions=regions,
+        timeout=timeout,
+    )
+
+
+async def list_instance(name=None, instance_id=None, refresh=False, timeout=None):
+    return await run(
+        infra.list_instance,
+        name=name,
+        instance_id=instance_id,
+        refresh=refresh,
+        timeout=timeout,
+    )
+
+
+async def list_volumes(volume_id=None, refresh=False, regions=None, timeout=None):
+    return await run(
+        infra.list_volumes,
+        volume_id=volume_id,
+        refresh=refresh,
+        regions=regions,
+        timeout=timeout,
+    )
+
+
+async def list_buckets(
+    name=None, fields=None, refresh=False, regions=None, timeout=None
+):
+    return await run(
+        infra.list_buckets,
+        name=name,
+        fields=fields,
+        refresh=refresh,
+        regions=regions,
+        timeout=timeout,
+    )
+
+
+def iter_instances(
+    name=None,
+    instance_id=None,
+    instance_ids=None,
+    name_prefix=None,
+    regions=None,
+    ordered=True,
+    timeout=None,
+):
+    # async for instance in iter_instances(): ...
+    return iterate(
+        infra.iter_instances(
+            name=name,
+            instance_id=instance_id,
+            instance_ids=instance_ids,
+            name_prefix=name_prefix,
+            regions=regions,
+            ordered=ordered,
+        ),
+        timeout=timeout,
+    )
+
+
+def iter_volumes(
+    volume_id=None, volume_ids=None, regions=None, states=None, timeout=None
+):
+    return iterate(
+        infra.iter_volumes(
+            volume_id=volume_id, volume_ids=volume_ids, regions=regions, states=states
+        ),
+        timeout=timeout,
+    )
+
+
+def iter_buckets(
+    name=None,
+    fields=infra.DEFAULT_BUCKET_FIELDS,
+    regions=None,
+    ordered=True,
+    timeout=None,
+):
+    return iterate(
+        infra.iter_buckets(name=name, fields=fields, regions=regions, ordered=ordered),
+        timeout=timeout,
+    )
+
+
+# waiters
+async def wait_until(probe, timeout=300, delay=1, max_delay=15):
+    # infra.wait_until() for an async probe
+    deadline = time.time() + timeout
+    attempt = 0
+    while True:
+        attempt += 1
+        if await probe():
+            return attempt
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError(f"Condition not met after {timeout} sec.")
+        backoff = min(max_delay, delay * 2 ** (attempt - 1))
+        await asyncio.sleep(
+            min(remaining, backoff / 2 + random.uniform(0, backoff / 2))
+        )
+
+
+async def wait_for_instances(
+    instance_ids,
+    state="running",
+    status_ok=False,
+    timeout=300,
+    max_delay=15,
+    failures=None,
+):
+    # infra.wait_for_instances(), polling from the event loop
+    pending = set(instance_ids)
+
+    async def probe():
+        return await run(infra.poll_instances, pending, state, status_ok, failures)
+
+    try:
+        return await wait_until(probe, timeout=timeout, max_delay=max_delay)
+    except TimeoutError:
+        message = (
+            f"Instances {sorted(pending)} did not become {state} in {timeout} sec."
+        )
+        if failures is None:
+            raise Exception(message)
+        for instance_id in pending:
+            failures[instance_id] = message
+        return None
+
+
+async def wait_for_volumes_deleted(volume_ids, region=None, timeout=300, max_delay=15):
+    # infra.wait_for_volumes_deleted(), polling from the event loop
+    pending = set(volume_ids)
+
+    async def probe():
+        return await run(infra.poll_volumes_deleted, pending, region)
+
+    try:
+        await wait_until(probe, timeout=timeout, max_delay=max_delay)
+    except TimeoutError:
+        pass
+    return sorted(pending)
+
+
+# instances
+async def create_instance(
+    name,
+    instance_type="t2.micro",
+    image_id="ami-097a2df4ac947655f",
+    zone="us-east-2c",
+    key_name=None,
+    security_group_id="sg-0364d234122df6a66",
+    device="/dev/sda1",
+    disk_size=0,
+    delete_on_termination=True,
+    termination_protection=True,
+    timeout=120,
+):
+    # infra.create_instance(). Cancelling it after the launch leaves the
+    # instance running.
+    assert len(await list_instances(name)) == 0, f"Instance '{name}' already exists."
+    print(f"Creating instance {name}.")
+    assert type(name) is str and len(name) > 2, f"Illegal instance name {name}."
+    assert disk_size > 0, f"Disk_size={disk_size} is too small."
+    assert key_name, "Key name (key_name) argument must be provided."
+    start = time.time()
+    spec = (
+        name,
+        instance_type,
+        image_id,
+        zone,
+        key_name,
+        security_group_id,
+        device,
+        disk_size,
+        delete_on_termination,
+        termination_protection,
+    )
+    instance_id = await run(infra.run_instance, *spec)
+    await wait_for_instances([instance_id], state="running", timeout=timeout)
+    instance = await run(infra.verify_instance, instance_id, *spec)
+    print(f"Instance {name} was created in {time.time() - start:.1f} sec.")
+    return instance
+
+
+async def terminate_instance(instance_id, timeout=180):
+    volumes = await run(infra.start_termination, instance_id)
+    await wait_for_instances([instance_id], state="terminated", timeout=timeout)
+    return await run(infra.verify_termination, instance_id, volumes)
+
+
+async def set_termination_protection(instance_id, value, timeout=None):
+    return await run(
+        infra.set_termination_protection, instance_id, value, timeout=timeout
+    )
+
+
+# tests
+def test_concurrent_calls():
+    import fixtures
+
+    print("test_concurrent_calls")
+
+    async def main():
+        instances = await list_instances()
+        start = time.time()
+        results = await asyncio.gather(
+            *(
+                run(infra.fetch_instances, instance_ids=[i["instance_id"]])
+                for i in instances
+            )
+        )
+        assert [r[0] for r in results] == instances
+        return time.time() - start
+
+    with fixtures.synthetic(
+        instances=200, volumes=0, buckets=0, latency=0.05, limits=False
+    ):
+        seconds = asyncio.run(main())
+    # three calls per instance, sequentially about 30 sec.
+    assert seconds < 200 * 3 * 0.05 / 4, seconds
+
+
+def test_cancellation_and_timeouts():
+    import fixtures
+
+    print("test_cancellation_and_timeouts")
+    region = os.environ["AWS_REGION"]
+
+    async def main(instance_id):
+        # the waiter never succeeds, but stops as soon as it is cancelled
+        task = asyncio.create_task(
+            wait_for_instances([instance_id], state="stopped", max_delay=1)
+        )
+        await asyncio.sleep(0.5)
+        start = time.time()
+        task.cancel()
+        try:
+            await task
+            assert False, "Waiter was not cancelled."
+        except asyncio.CancelledError:
+            pass
+        assert time.time() - start < 0.1
+        try:
+            await list_instances(refresh=True, timeout=0.01)
+            assert False, "Listing did not time out."
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await wait_for_instances([instance_id], state="stopped", timeout=1)
+            assert False, "Waiter did not time out."
+        except Exception as e:
+            assert "did not become stopped" in str(e)
+        # leaving an iteration early closes the generator, without blocking
+        # the event loop while its in-flight calls finish
+        generator = infra.iter_instances(ordered=False)
+        iteration = iterate(generator)
+        async for instance in iteration:
+            break
+        assert instance["state"] in ["running", "stopped", "terminated"]
+        start = time.time()
+        await iteration.aclose()
+        assert time.time() - start < 0.02
+        while generator.gi_frame is not None:
+            assert time.time() - start < 5, "The generator was not closed."
+            await asyncio.sleep(0.01)
+
+    with fixtures.synthetic(
+        instances=100, volumes=0, buckets=0, latency=0.05, limits=False
+    ) as aws:
+        with aws.lock:
+            instance_id = aws.launch(region)
+        asyncio.run(main(instance_id))
+
+
+def test_create_and_terminate_instances():
+    import fixtures
+
+    print("test_create_and_terminate_instances")
+
+    async def main():
+        names = [f"test-{n}-async" for n in range(5)]
+        instances = await asyncio.gather(
+            *(
+                create_instance(
+                    name,
+                    key_name="synthetic",
+                    disk_size=8,
+                    termination_protection=False,
+                )
+                for name in names
+            )
+        )
+        assert [i["name"] for i in instances] == names
+        instances = await asyncio.gather(
+            *(terminate_instance(i["instance_id"]) for i in instances)
+        )
+        assert all(i["state"] == "terminated" for i in instances)
+
+    with fixtures.synthetic(instances=10, volumes=0, buckets=0, limits=False):
+        asyncio.run(main())
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("AWS_REGION", "us-east-2")
+    test_concurrent_calls()
+    test_cancellation_and_timeouts()
+    test_create_and_terminate_instances()
+    shutdown()
+    print("done.")
@@ -0,0 +1,150 @@
+# benchmark-infra.py -- wall time and API calls of infra functions on a large inventory
+
+# libraries
+import argparse, os, tempfile, time
+from contextlib import nullcontext
+
+os.environ.setdefault("AWS_REGION", "us-east-2")
+import infra, inventory, fixtures
+
+
+def benchmark(label, function, cold=True):
+    # cold runs start without cached listings
+    if cold:
+        infra.invalidate_inventory()
+    with infra.metrics() as m:
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+    calls = m.calls()
+    summary = ", ".join(f"{op.split('.')[1]}={n}" for op, n in sorted(calls.items()))
+    print(f"{label:<36} {seconds:>8.2f} {sum(calls.values()):>7}  {summary}")
+    return seconds
+
+
+def read_benchmarks(regions):
+    instances = infra.list_instances()
+    instance_ids = [i["instance_id"] for i in instances]
+    name = instances[0]["name"]
+    benchmark("list_instances()", infra.list_instances)
+    benchmark("list_instances() cached", infra.list_instances, cold=False)
+    benchmark("list_instance(name)", lambda: infra.list_instance(name=name))
+    benchmark(
+        "fetch_instances(100 ids)",
+        lambda: infra.fetch_instances(instance_ids=instance_ids[:100]),
+    )
+    benchmark(
+        "get_instance_statuses(all ids)",
+        lambda: infra.get_instance_statuses(instance_ids),
+    )
+    benchmark("list_volumes()", infra.list_volumes)
+    benchmark("find_orphaned_volumes()", infra.find_orphaned_volumes)
+    benchmark("list_buckets()", infra.list_buckets)
+    benchmark("list_buckets(fields=[])", lambda: infra.list_buckets(fields=[]))
+    if len(regions) > 1:
+        benchmark(
+            "list_instances(all regions)", lambda: infra.list_instances(regions="all")
+        )
+        benchmark(
+            "list_volumes(all regions)", lambda: infra.list_volumes(regions="all")
+        )
+    with tempfile.TemporaryDirectory() as directory:
+        db = inventory.open_inventory(os.path.join(directory, "inventory.db"))
+        all_regions = regions if len(regions) > 1 else None
+        benchmark(
+            "inventory.refresh() first",
+            lambda: inventory.refresh(db, regions=all_regions),
+        )
+        benchmark(
+            "inventory.refresh() again",
+            lambda: inventory.refresh(db, regions=all_regions),
+        )
+        db.close()
+
+
+def write_benchmarks():
+    specs = [
+        {"name": f"bench-{n:03d}", "key_name": "synthetic", "disk_size": 8}
+        for n in range(10)
+    ]
+    created = {}
+    benchmark(
+        "create_instance()",
+        lambda: created.update(
+            one=infra.create_instance(
+                "bench-one",
+                key_name="synthetic",
+                disk_size=8,
+                termination_protection=False,
+            )
+        ),
+    )
+    benchmark(
+        "terminate_instance()",
+        lambda: infra.terminate_instance(created["one"]["instance_id"]),
+    )
+    benchmark(
+        "create_instances(10)",
+        lambda: created.update(many=infra.create_instances(specs)),
+    )
+    instance_ids = [r["instance_id"] for r in created["many"]]
+    for instance_id in instance_ids:
+        infra.set_termination_protection(instance_id, False)
+    benchmark(
+        "terminate_instances(10)", lambda: infra.terminate_instances(instance_ids)
+    )
+    volume_ids = [v["volume_id"] for v in infra.find_orphaned_volumes()[:50]]
+    benchmark(
+        f"delete_volumes({len(volume_ids)})", lambda: infra.delete_volumes(volume_ids)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python benchmark-infra.py")
+    parser.add_argument("--instances", type=int, default=2000)
+    parser.add_argument("--volumes", type=int, default=200, help="unattached volumes")
+    parser.add_argument("--buckets", type=int, default=500)
+    parser.add_argument("--regions", type=int, default=1)
+    # seconds per call; AWS typically answers in 50-200 ms
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument(
+        "--no-limits", action="store_true", help="skip client-side rate limits"
+    )
+    parser.add_argument("--replay", help="serve responses recorded with --record")
+    parser.add_argument("--record", help="save the responses of this run")
+    parser.add_argument(
+        "--live", action="store_true", help="use AWS (read-only benchmarks)"
+    )
+    args = parser.parse_args()
+
+    limits = not args.no_limits
+    if args.live:
+        source = nullcontext()
+    elif args.replay:
+        source = fixtures.replay(args.replay, latency=args.latency, limits=limits)
+    else:
+        regions = [os.environ["AWS_REGION"]] + [
+            r
+            for r in ["us-east-1", "us-west-2", "eu-west-1", "ap-southeast-2"]
+            if r != os.environ["AWS_REGION"]
+        ]
+        source = fixtures.synthetic(
+            instances=args.instances,
+            volumes=args.volumes,
+            buckets=args.buckets,
+            regions=regions[: args.regions],
+            latency=args.latency,
+            limits=limits,
+        )
+    record = fixtures.recording(args.record) if args.record else nullcontext()
+
+    print(f"{'function':<36} {'seconds':>8} {'calls':>7}  calls per operation")
+    with source, record:
+        regions = (
+            infra.get_regions("all")
+            if args.regions > 1 or args.live
+            else infra.get_regions()
+        )
+        read_benchmarks(regions)
+        if not (args.live or args.replay):
+            write_benchmarks()
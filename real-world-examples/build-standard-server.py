@@ -1,8 +1,7 @@
 import argparse
-import time
 
 from server import Server
-import infra
+import infra, tracker
 
 
 def get_instance(name, instance_type):
@@ -22,18 +21,18 @@ def get_instance(name, instance_type):
         disk_size=disk_size,
     )
     print(f"Server {name} has been created.")
-    for i in range(0, 12 * 5):
-        time.sleep(5)
-        instance = infra.list_instance(name=name)
-        if (instance["instance_status"] == "ok") and (
-            instance["system_status"] == "ok"
-        ):
-            break
-        print(f"Waiting for {name} to finish startup. (sec={i*5})")
-    if (instance["instance_status"] != "ok") and (instance["system_status"] != "ok"):
-        print(f"Test server {name} did not finish startup.")
+    # the shared tracker polls every watched instance with one call per
+    # interval, instead of this script listing the instance every 5 sec.
+    print(f"Waiting for {name} to finish startup.")
+    try:
+        tracker.get_tracker().wait(
+            [instance["instance_id"]], status_ok=True, timeout=300
+        )
+    except Exception as e:
+        print(f"Test server {name} did not finish startup. ({e})")
         print(instance)
         assert False, "Error in server startup."
+    instance = infra.list_instance(name=name, refresh=True)
     return instance
 
 
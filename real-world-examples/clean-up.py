@@ -1,32 +1,39 @@
 import infra
-from pprint import pprint
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
-def clean_up(instance_id):
-    instance = infra.list_instance(instance_id=instance_id)
-    assert instance["name"].startswith("test-")
-    print(f"Terminating instance {instance['name']}/{instance_id}")
-    if instance["state"] == "terminated":
-        print(f"Instance {instance_id} is already terminated.")
-    if instance["termination_protection"]:
-        infra.set_termination_protection(instance_id=instance_id, value=False)
-    print(instance["volumes"])
-    assert len(instance["volumes"]) == 1
-    volume_id = instance["volumes"][0]["volume_id"]
-    volume = infra.list_volume(volume_id=volume_id)
-    infra.terminate_instance(instance_id=instance_id)
-    instance = infra.list_instance(instance_id=instance_id)
-    assert (
-        instance["state"] == "terminated"
-    ), f"Instance {instance_id} was not terminated."
-    print(f"Instance {instance_id} was terminated")
-    volumes = infra.list_volumes(volume_id=volume_id)
-    assert len(volumes) == 0, f"Volume {volume_id} was not deleted."
-    print(f"Volume {volume_id} was deleted.")
+def report(results):
+    for result in results.values():
+        if result["error"]:
+            print(
+                f"Instance {result['name']}/{result['instance_id']}: {result['error']}"
+            )
+        else:
+            print(f"Instance {result['name']}/{result['instance_id']} was terminated.")
 
 
 if __name__ == "__main__":
-    instances = [i for i in infra.list_instances() if i["state"] != "terminated"]
-    for i in instances:
-        if (i["name"]).startswith("test-"):
-            clean_up(i["instance_id"])
+    # instances are terminated in batches while the rest are still being
+    # listed, instead of after the full listing
+    batch_size = 20
+    live = ["pending", "running", "stopping", "stopped"]
+    batch = []
+    futures = []
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for i in infra.iter_instances(name_prefix="test-", ordered=False):
+            if i["state"] not in live:
+                continue
+            # only test instances are ever touched, whatever the listing returns
+            assert i["name"].startswith("test-"), f"Not a test instance: {i['name']}."
+            if i["termination_protection"]:
+                infra.set_termination_protection(
+                    instance_id=i["instance_id"], value=False
+                )
+            batch.append(i["instance_id"])
+            if len(batch) == batch_size:
+                futures.append(executor.submit(infra.terminate_instances, batch))
+                batch = []
+        if batch:
+            futures.append(executor.submit(infra.terminate_instances, batch))
+        for future in as_completed(futures):
+            report(future.result())
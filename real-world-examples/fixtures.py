@@ -0,0 +1,739 @@
+# fixtures.py -- recorded and synthetic AWS responses for offline runs of infra
+
+# libraries
+import os, time
+import copy, datetime, fnmatch, itertools, json, pickle, random, threading
+from contextlib import contextmanager
+import infra
+
+# global variables
+
+# parameters that differ on every call and are left out of recording keys
+VOLATILE_PARAMETERS = ["ClientToken"]
+
+# EC2 returns at most this many results per page when MaxResults is not given
+PAGE_SIZE = 1000
+
+# instance state codes, as reported by EC2
+STATE_CODES = {
+    "pending": 0,
+    "running": 16,
+    "shutting-down": 32,
+    "terminated": 48,
+    "stopping": 64,
+    "stopped": 80,
+}
+
+
+# hooks
+@contextmanager
+def hooked(register):
+    # register(client) returns [(event, handler)] pairs; they are added to
+    # every infra client, including clients created inside the block, and
+    # removed when it ends. Cached listings are dropped on the way in and out.
+    installed = []
+
+    def hook(client):
+        for event, handler in register(client):
+            # last, so infra's own before-call hooks (metrics) still run
+            client.meta.events.register_last(event, handler)
+            installed.append((client, event, handler))
+
+    with infra.clients_lock:
+        infra.client_hooks.append(hook)
+        existing = list(infra.clients.values())
+    for client in existing:
+        hook(client)
+    infra.invalidate_inventory()
+    try:
+        yield
+    finally:
+        with infra.clients_lock:
+            infra.client_hooks.remove(hook)
+        for client, event, handler in installed:
+            client.meta.events.unregister(event, handler)
+        infra.invalidate_inventory()
+
+
+def call_key(service, region, operation, params):
+    params = {k: v for k, v in params.items() if k not in VOLATILE_PARAMETERS}
+    return (service, region, operation, json.dumps(params, sort_keys=True, default=str))
+
+
+def error(status, code, message):
+    return status, {
+        "Error": {"Code": code, "Message": message},
+        "ResponseMetadata": {"HTTPStatusCode": status, "RetryAttempts": 0},
+    }
+
+
+@contextmanager
+def serving(respond, latency=0, limits=True):
+    # answers the calls of infra's clients with
+    # respond(service, region, operation, params) -> (status, parsed response)
+    # instead of sending them. Each call takes latency seconds on average,
+    # and with limits it waits for infra's client-side rate limiter, as a
+    # request to AWS would.
+    def register(client):
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name
+
+        def before_parameter_build(params, context, **kwargs):
+            context["fixture_params"] = dict(params)
+
+        def before_call(model, context, **kwargs):
+            import botocore.awsrequest
+
+            if limits:
+                family = infra.api_family(model.name)
+                infra.get_limiter(service, region, family).acquire()
+            if latency:
+                time.sleep(latency * random.uniform(0.5, 1.5))
+            status, parsed = respond(
+                service, region, model.name, context["fixture_params"]
+            )
+            http = botocore.awsrequest.AWSResponse(None, status, {}, None)
+            return http, parsed
+
+        return [
+            ("before-parameter-build", before_parameter_build),
+            ("before-call", before_call),
+        ]
+
+    with hooked(register):
+        yield
+
+
+# recording and replay
+@contextmanager
+def recording(path):
+    # saves the response of every call made by infra's clients while the
+    # block runs, for replay(); calls with streamed bodies (get_object) are
+    # not recorded
+    responses = {}
+    lock = threading.Lock()
+
+    def register(client):
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name
+
+        def before_parameter_build(params, context, **kwargs):
+            context["fixture_params"] = dict(params)
+
+        def after_call(http_response, parsed, model, context, **kwargs):
+            if model.has_streaming_output or "fixture_params" not in context:
+                return
+            key = call_key(service, region, model.name, context["fixture_params"])
+            response = copy.deepcopy((http_response.status_code, parsed))
+            with lock:
+                responses.setdefault(key, []).append(response)
+
+        return [
+            ("before-parameter-build", before_parameter_build),
+            ("after-call", after_call),
+        ]
+
+    try:
+        with hooked(register):
+            yield responses
+    finally:
+        with open(path, "wb") as f:
+            pickle.dump(responses, f)
+        calls = sum(len(r) for r in responses.values())
+        print(f"Recorded {calls} responses to {len(responses)} calls in {path}.")
+
+
+def replay(path, latency=0, limits=True):
+    # serves the responses saved by recording(); a call recorded several
+    # times gets its responses in order, then the last one again
+    with open(path, "rb") as f:
+        responses = pickle.load(f)
+    served = {}
+    lock = threading.Lock()
+
+    def respond(service, region, operation, params):
+        key = call_key(service, region, operation, params)
+        if key not in responses:
+            return error(
+                400, "NotRecorded", f"No recorded response for {key} in {path}."
+            )
+        with lock:
+            n = served.get(key, 0)
+            served[key] = n + 1
+        recorded = responses[key]
+        return copy.deepcopy(recorded[min(n, len(recorded) - 1)])
+
+    return serving(respond, latency=latency, limits=limits)
+
+
+# synthetic inventory
+class SyntheticAWS:
+    # an in-memory account with a large inventory, answering the EC2 and S3
+    # calls infra makes. Results are never changed in place (changes replace
+    # them), so responses can share them with the inventory.
+    def __init__(self, instances=2000, volumes=200, buckets=500, regions=None, seed=0):
+        self.random = random.Random(seed)
+        self.regions = list(regions or [os.environ["AWS_REGION"]])
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.instances = {region: {} for region in self.regions}
+        self.volumes = {region: {} for region in self.regions}
+        self.protection = {}
+        self.statuses = {}
+        self.buckets = {}
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for n in range(instances):
+            region = self.regions[n % len(self.regions)]
+            prefix = "test" if self.random.random() < 0.05 else "server"
+            instance_id = self.launch(
+                region,
+                name=f"{prefix}-{n:05d}",
+                instance_type=self.random.choice(["t2.micro", "m5.large"]),
+                zone=region + self.random.choice("abc"),
+                disk_size=self.random.choice([8, 30, 100]),
+                protected=self.random.random() < 0.5,
+                launch_time=now
+                - datetime.timedelta(minutes=self.random.randrange(525600)),
+                status="ok",
+            )
+            state = self.random.choices(
+                ["running", "stopped", "terminated"], [85, 10, 5]
+            )[0]
+            if state == "stopped":
+                self.set_state(region, instance_id, "stopped")
+            elif state == "terminated":
+                self.terminate(region, instance_id)
+        for n in range(volumes):
+            region = self.regions[n % len(self.regions)]
+            created = now - datetime.timedelta(minutes=self.random.randrange(525600))
+            self.create_volume(
+                region, region + "a", self.random.choice([8, 100]), created
+            )
+        for n in range(buckets):
+            self.create_bucket(
+                f"bucket-{n:05d}", self.regions[n % len(self.regions)], now
+            )
+
+    def respond(self, service, region, operation, params):
+        handler = getattr(self, "call_" + operation, None)
+        if handler is None:
+            return error(
+                400, "NotSimulated", f"{service}.{operation} is not simulated."
+            )
+        with self.lock:
+            result = handler(region, params)
+        if type(result) is tuple:
+            return result
+        result["ResponseMetadata"] = {"HTTPStatusCode": 200, "RetryAttempts": 0}
+        return 200, result
+
+    # inventory changes
+    def new_id(self, prefix):
+        return f"{prefix}-{next(self.ids):017x}"
+
+    def create_volume(self, region, zone, size, create_time, attachment=None):
+        volume = {
+            "VolumeId": self.new_id("vol"),
+            "VolumeType": "gp2",
+            "Size": size,
+            "CreateTime": create_time,
+            "State": "available",
+            "AvailabilityZone": zone,
+            "Encrypted": False,
+            "Attachments": [],
+        }
+        if attachment:
+            volume["State"] = "in-use"
+            volume["Attachments"] = [{**attachment, "VolumeId": volume["VolumeId"]}]
+        self.volumes[region][volume["VolumeId"]] = volume
+        return volume
+
+    def launch(
+        self,
+        region,
+        name=None,
+        instance_type="t2.micro",
+        image_id="ami-097a2df4ac947655f",
+        zone=None,
+        key_name="synthetic",
+        group_ids=("sg-0364d234122df6a66",),
+        device="/dev/sda1",
+        disk_size=8,
+        delete_on_termination=True,
+        protected=False,
+        launch_time=None,
+        status="initializing",
+    ):
+        instance_id = self.new_id("i")
+        zone = zone or region + "a"
+        launch_time = launch_time or datetime.datetime.now(datetime.timezone.utc)
+        volume = self.create_volume(
+            region,
+            zone,
+            disk_size,
+            launch_time,
+            attachment={
+                "InstanceId": instance_id,
+                "Device": device,
+                "State": "attached",
+                "AttachTime": launch_time,
+                "DeleteOnTermination": delete_on_termination,
+            },
+        )
+        address = ".".join(str(self.random.randrange(1, 255)) for _ in range(4))
+        self.instances[region][instance_id] = {
+            "InstanceId": instance_id,
+            "ImageId": image_id,
+            "InstanceType": instance_type,
+            "KeyName": key_name,
+            "LaunchTime": launch_time,
+            "State": {"Code": STATE_CODES["running"], "Name": "running"},
+            "Placement": {"AvailabilityZone": zone},
+            "SecurityGroups": [
+                {"GroupName": f"group-{g[-4:]}", "GroupId": g} for g in group_ids
+            ],
+            "BlockDeviceMappings": [
+                {
+                    "DeviceName": device,
+                    "Ebs": {
+                        "AttachTime": launch_time,
+                        "DeleteOnTermination": delete_on_termination,
+                        "Status": "attached",
+                        "VolumeId": volume["VolumeId"],
+                    },
+                }
+            ],
+            "NetworkInterfaces": [
+                {
+                    "Association": {
+                        "PublicIp": address,
+                        "PublicDnsName": f"ec2-{address.replace('.', '-')}.{region}.compute.amazonaws.com",
+                    }
+                }
+            ],
+            "Tags": [{"Key": "Name", "Value": name}] if name else [],
+        }
+        self.protection[instance_id] = protected
+        self.statuses[instance_id] = status
+        return instance_id
+
+    def set_state(self, region, instance_id, state):
+        result = self.instances[region][instance_id]
+        result = {**result, "State": {"Code": STATE_CODES[state], "Name": state}}
+        if state != "running":
+            result["NetworkInterfaces"] = []
+        self.instances[region][instance_id] = result
+
+    def terminate(self, region, instance_id):
+        self.set_state(region, instance_id, "terminated")
+        result = self.instances[region][instance_id]
+        for mapping in result["BlockDeviceMappings"]:
+            volume_id = mapping["Ebs"]["VolumeId"]
+            if mapping["Ebs"]["DeleteOnTermination"]:
+                del self.volumes[region][volume_id]
+            else:
+                volume = self.volumes[region][volume_id]
+                self.volumes[region][volume_id] = {
+                    **volume,
+                    "State": "available",
+                    "Attachments": [],
+                }
+        self.instances[region][instance_id] = {**result, "BlockDeviceMappings": []}
+
+    def create_bucket(self, name, region, creation_date):
+        self.buckets[name] = {
+            "CreationDate": creation_date,
+            "Region": region,
+            "Versioning": self.random.choice(["Enabled", "Suspended", None]),
+            "Blocked": self.random.random() < 0.9,
+            "Origins": ["*"] if self.random.random() < 0.5 else None,
+        }
+
+    # EC2
+    def page(self, items, params):
+        start = int(params.get("NextToken") or 0)
+        end = start + params.get("MaxResults", PAGE_SIZE)
+        token = {"NextToken": str(end)} if end < len(items) else {}
+        return items[start:end], token
+
+    def filtered(self, results, filters, fields):
+        for f in filters:
+            if f["Name"] not in fields:
+                return error(
+                    400,
+                    "InvalidParameterValue",
+                    f"Filter {f['Name']} is not simulated.",
+                )
+            # filter values may use the * and ? wildcards
+            patterns = f["Values"]
+            results = [
+                r
+                for r in results
+                if any(
+                    fnmatch.fnmatchcase(value, pattern)
+                    for value in fields[f["Name"]](r)
+                    for pattern in patterns
+                )
+            ]
+        return results
+
+    def known(self, region, kind, ids):
+        table = self.instances if kind == "instance" else self.volumes
+        missing = [i for i in ids if i not in table[region]]
+        if missing:
+            code = "InvalidInstanceID" if kind == "instance" else "InvalidVolume"
+            return error(
+                400, f"{code}.NotFound", f"The {kind} IDs {missing} do not exist"
+            )
+        return None
+
+    def call_DescribeRegions(self, region, params):
+        return {
+            "Regions": [
+                {"RegionName": r, "Endpoint": f"ec2.{r}.amazonaws.com"}
+                for r in self.regions
+            ]
+        }
+
+    def call_DescribeInstances(self, region, params):
+        ids = params.get("InstanceIds")
+        results = list(self.instances[region].values())
+        if ids:
+            failure = self.known(region, "instance", ids)
+            if failure:
+                return failure
+            results = [self.instances[region][i] for i in ids]
+        results = self.filtered(
+            results,
+            params.get("Filters", []),
+            {
+                "tag:Name": lambda r: [
+                    t["Value"] for t in r["Tags"] if t["Key"] == "Name"
+                ],
+                "instance-id": lambda r: [r["InstanceId"]],
+                "instance-state-name": lambda r: [r["State"]["Name"]],
+            },
+        )
+        if type(results) is tuple:
+            return results
+        results, token = self.page(results, params)
+        reservations = [
+            {"ReservationId": "r-" + r["InstanceId"][2:], "Instances": [r]}
+            for r in results
+        ]
+        return {"Reservations": reservations, **token}
+
+    def call_DescribeInstanceStatus(self, region, params):
+        ids = params.get("InstanceIds") or list(self.instances[region])
+        failure = self.known(region, "instance", ids)
+        if failure:
+            return failure
+        statuses = []
+        for instance_id in ids:
+            state = self.instances[region][instance_id]["State"]
+            if state["Name"] != "running" and not params.get("IncludeAllInstances"):
+                continue
+            status = self.statuses[instance_id]
+            if state["Name"] != "running":
+                status = "not-applicable"
+            statuses.append(
+                {
+                    "InstanceId": instance_id,
+                    "InstanceState": state,
+                    "InstanceStatus": {"Status": status},
+                    "SystemStatus": {"Status": status},
+                }
+            )
+        return {"InstanceStatuses": statuses}
+
+    def call_DescribeInstanceAttribute(self, region, params):
+        instance_id = params["InstanceId"]
+        failure = self.known(region, "instance", [instance_id])
+        if failure:
+            return failure
+        assert params["Attribute"] == "disableApiTermination"
+        return {
+            "InstanceId": instance_id,
+            "DisableApiTermination": {"Value": self.protection[instance_id]},
+        }
+
+    def call_ModifyInstanceAttribute(self, region, params):
+        instance_id = params["InstanceId"]
+        failure = self.known(region, "instance", [instance_id])
+        if failure:
+            return failure
+        self.protection[instance_id] = params["DisableApiTermination"]["Value"]
+        return {}
+
+    def call_RunInstances(self, region, params):
+        mapping = params["BlockDeviceMappings"][0]
+        name = None
+        for spec in params.get("TagSpecifications", []):
+            for tag in spec["Tags"]:
+                if tag["Key"] == "Name":
+                    name = tag["Value"]
+        ids = [
+            self.launch(
+                region,
+                name=name,
+                instance_type=params["InstanceType"],
+                image_id=params["ImageId"],
+                zone=params["Placement"]["AvailabilityZone"],
+                key_name=params["KeyName"],
+                group_ids=params["SecurityGroupIds"],
+                device=mapping["DeviceName"],
+                disk_size=mapping["Ebs"]["VolumeSize"],
+                delete_on_termination=mapping["Ebs"]["DeleteOnTermination"],
+                protected=params.get("DisableApiTermination", False),
+            )
+            for _ in range(params["MaxCount"])
+        ]
+        return {
+            "ReservationId": "r-" + ids[0][2:],
+            "Instances": [self.instances[region][i] for i in ids],
+        }
+
+    def call_CreateTags(self, region, params):
+        for resource_id in params["Resources"]:
+            table = self.instances if resource_id.startswith("i-") else self.volumes
+            result = table[region][resource_id]
+            keys = {t["Key"] for t in params["Tags"]}
+            tags = [t for t in result.get("Tags", []) if t["Key"] not in keys]
+            table[region][resource_id] = {**result, "Tags": tags + params["Tags"]}
+        return {}
+
+    def call_TerminateInstances(self, region, params):
+        ids = params["InstanceIds"]
+        failure = self.known(region, "instance", ids)
+        if failure:
+            return failure
+        protected = [i for i in ids if self.protection[i]]
+        if protected:
+            return error(
+                400,
+                "OperationNotPermitted",
+                f"The instances {protected} may not be terminated.",
+            )
+        changes = []
+        for instance_id in ids:
+            previous = self.instances[region][instance_id]["State"]
+            self.terminate(region, instance_id)
+            current = self.instances[region][instance_id]["State"]
+            changes.append(
+                {
+                    "InstanceId": instance_id,
+                    "PreviousState": previous,
+                    "CurrentState": current,
+                }
+            )
+        return {"TerminatingInstances": changes}
+
+    def call_DescribeVolumes(self, region, params):
+        ids = params.get("VolumeIds")
+        results = list(self.volumes[region].values())
+        if ids:
+            failure = self.known(region, "volume", ids)
+            if failure:
+                return failure
+            results = [self.volumes[region][i] for i in ids]
+        results = self.filtered(
+            results,
+            params.get("Filters", []),
+            {
+                "volume-id": lambda r: [r["VolumeId"]],
+                "status": lambda r: [r["State"]],
+                "attachment.instance-id": lambda r: [
+                    a["InstanceId"] for a in r["Attachments"]
+                ],
+            },
+        )
+        if type(results) is tuple:
+            return results
+        results, token = self.page(results, params)
+        return {"Volumes": results, **token}
+
+    def call_DeleteVolume(self, region, params):
+        volume_id = params["VolumeId"]
+        failure = self.known(region, "volume", [volume_id])
+        if failure:
+            return failure
+        if self.volumes[region][volume_id]["State"] != "available":
+            return error(400, "VolumeInUse", f"Volume {volume_id} is in use.")
+        del self.volumes[region][volume_id]
+        return {}
+
+    # S3
+    def bucket(self, params):
+        bucket = self.buckets.get(params["Bucket"])
+        if bucket is None:
+            return None, error(
+                404, "NoSuchBucket", "The specified bucket does not exist"
+            )
+        return bucket, None
+
+    def call_ListBuckets(self, region, params):
+        prefix = params.get("Prefix", "")
+        return {
+            "Buckets": [
+                {"Name": name, "CreationDate": b["CreationDate"]}
+                for name, b in sorted(self.buckets.items())
+                if name.startswith(prefix)
+            ],
+            "Owner": {"ID": "synthetic"},
+        }
+
+    def call_GetBucketLocation(self, region, params):
+        bucket, failure = self.bucket(params)
+        if failure:
+            return failure
+        location = bucket["Region"]
+        return {"LocationConstraint": None if location == "us-east-1" else location}
+
+    def call_GetBucketEncryption(self, region, params):
+        bucket, failure = self.bucket(params)
+        if failure:
+            return failure
+        default = {"ApplyServerSideEncryptionByDefault": {"SSEAlgorithm": "AES256"}}
+        return {"ServerSideEncryptionConfiguration": {"Rules": [default]}}
+
+    def call_GetBucketVersioning(self, region, params):
+        bucket, failure = self.bucket(params)
+        if failure:
+            return failure
+        if bucket["Versioning"] is None:
+            return {}
+        return {"Status": bucket["Versioning"]}
+
+    def call_GetPublicAccessBlock(self, region, params):
+        bucket, failure = self.bucket(params)
+        if failure:
+            return failure
+        keys = [
+            "BlockPublicAcls",
+            "BlockPublicPolicy",
+            "IgnorePublicAcls",
+            "RestrictPublicBuckets",
+        ]
+        return {"PublicAccessBlockConfiguration": {k: bucket["Blocked"] for k in keys}}
+
+    def call_GetBucketCors(self, region, params):
+        bucket, failure = self.bucket(params)
+        if failure:
+            return failure
+        if bucket["Origins"] is None:
+            return error(
+                404,
+                "NoSuchCORSConfiguration",
+                "The CORS configuration does not exist",
+            )
+        rule = {
+            "AllowedHeaders": ["*"],
+            "AllowedMethods": ["GET"],
+            "AllowedOrigins": bucket["Origins"],
+        }
+        return {"CORSRules": [rule]}
+
+
+@contextmanager
+def synthetic(
+    instances=2000,
+    volumes=200,
+    buckets=500,
+    regions=None,
+    latency=0,
+    limits=True,
+    seed=0,
+):
+    # infra talks to a SyntheticAWS account instead of AWS while the block runs
+    aws = SyntheticAWS(instances, volumes, buckets, regions=regions, seed=seed)
+    with serving(aws.respond, latency=latency, limits=limits):
+        yield aws
+
+
+# tests
+import tempfile
+
+
+def test_synthetic():
+    with synthetic(instances=300, volumes=20, buckets=40, limits=False) as aws:
+        with infra.metrics() as m:
+            instances = infra.list_instances()
+        assert len(instances) == 300
+        calls = m.calls()
+        assert calls["ec2.DescribeInstances"] == 1
+        assert calls["ec2.DescribeInstanceStatus"] == 3
+        assert calls["ec2.DescribeInstanceAttribute"] == 300
+        running = [i for i in instances if i["state"] == "running"]
+        assert all(i["instance_status"] == "ok" for i in running)
+        assert all(i["public_ip"] == "-" for i in instances if i["state"] != "running")
+
+        instance = infra.list_instance(name=instances[0]["name"])
+        assert instance == instances[0]
+        ids = [i["instance_id"] for i in instances[:10]]
+        assert [
+            i["instance_id"] for i in infra.fetch_instances(instance_ids=ids)
+        ] == ids
+
+        volumes = infra.list_volumes()
+        attached = [v for v in volumes if v["attachments"]]
+        assert len(volumes) - len(attached) >= 20
+        with infra.metrics() as m:
+            buckets = infra.list_buckets()
+        # the region is only read when asked for
+        assert "s3.GetBucketLocation" not in m.calls()
+        assert m.calls()["s3.GetBucketEncryption"] == 40
+        assert "region" not in buckets[0]
+        buckets = infra.list_buckets(fields=tuple(infra.BUCKET_FIELDS))
+        assert len(buckets) == 40
+        assert {b["region"] for b in buckets} == {os.environ["AWS_REGION"]}
+        assert {b["encryption"] for b in buckets} == {"AES256"}
+
+        # write calls change the inventory
+        instance = infra.create_instance(
+            "test-synthetic", key_name="synthetic", disk_size=8
+        )
+        assert instance["instance_status"] == "initializing"
+        infra.set_termination_protection(instance["instance_id"], False)
+        instance = infra.terminate_instance(instance["instance_id"])
+        assert instance["state"] == "terminated"
+        assert len(aws.instances[os.environ["AWS_REGION"]]) == 301
+    print("test_synthetic passed.")
+
+
+def test_latency():
+    with synthetic(instances=200, volumes=0, buckets=0, latency=0.01, limits=False):
+        start = time.time()
+        infra.list_instances()
+        seconds = time.time() - start
+    # 200 attribute reads at 10ms each, spread over MAX_WORKERS threads
+    assert 200 * 0.01 / infra.MAX_WORKERS < seconds < 200 * 0.01, seconds
+    print(f"test_latency passed ({seconds:.2f} sec.).")
+
+
+def test_record_and_replay():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "responses.pkl")
+        with synthetic(instances=50, volumes=5, buckets=5, limits=False):
+            with recording(path):
+                instances = infra.list_instances()
+                volumes = infra.list_volumes()
+                buckets = infra.list_buckets()
+        with replay(path, limits=False):
+            assert infra.list_instances() == instances
+            assert infra.list_volumes() == volumes
+            assert infra.list_buckets() == buckets
+            # a call that was never recorded fails
+            try:
+                infra.list_instances(name="server-99999", refresh=True)
+                assert False, "Unrecorded call did not fail."
+            except Exception as e:
+                assert "NotRecorded" in str(e), e
+    print("test_record_and_replay passed.")
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("AWS_REGION", "us-east-2")
+    test_synthetic()
+    test_latency()
+    test_record_and_replay()
+    print("done.")
@@ -2,104 +2,1006 @@
 
 # libraries
 import os, time
-import boto3
+import contextvars, datetime, hashlib, json, pickle, random, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pprint import pprint
 
+# boto3/botocore are imported when the first client is needed, so importing
+# this module is cheap and works without AWS credentials
+
 # global variables
-ec2 = boto3.client(
-    "ec2",
-    aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
-    region_name=os.environ["AWS_REGION"],
-)
 
-s3 = boto3.client(
-    "s3",
-    aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
-    region_name=os.environ["AWS_REGION"],
+# concurrent per-resource API calls
+MAX_WORKERS = 10
+
+# concurrent per-bucket detail requests in list_buckets()
+BUCKET_WORKERS = 32
+
+# artifact transfers: parts are sent and fetched concurrently, and at most
+# about part size x workers bytes are buffered at a time
+TRANSFER_PART_SIZE = 64 * 1024 * 1024
+TRANSFER_WORKERS = 32
+
+# name -> stored artifact, for the content-addressed store
+ARTIFACT_MANIFEST = os.environ.get(
+    "INFRA_ARTIFACTS", os.path.join(os.path.expanduser("~"), ".infra-artifacts.json")
 )
+manifest_lock = threading.Lock()
+
+# (service, region) -> client; clients are thread-safe and shared
+clients = {}
+clients_lock = threading.Lock()
+
+# extra functions called with every new client, e.g. by fixtures.py to serve
+# recorded or synthetic responses
+client_hooks = []
+
+# functions called with (kind, ids) after infra changes resources in place,
+# e.g. by inventory.py to read them again on its next refresh
+change_hooks = []
+
+# metrics() scopes that are collecting; when empty the hooks do nothing
+active_metrics = []
+metrics_lock = threading.Lock()
+# metrics(scoped=True) scopes, which only see calls made in their own context
+scoped_metrics = contextvars.ContextVar("scoped_metrics", default=())
+
+# upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    float("inf"),
+]
+LATENCY_LABELS = [str(b) if b != float("inf") else "+Inf" for b in LATENCY_BUCKETS]
+
+# attempts per call (the first try and its retries)
+RETRY_ATTEMPTS = 5
+
+# client-side rate limits per API family: (requests per second, burst). The
+# EC2 numbers follow its published request token buckets
+RATE_LIMITS = {
+    ("ec2", "read"): (20, 100),
+    ("ec2", "write"): (5, 200),
+    ("s3", "read"): (500, 500),
+    ("s3", "write"): (300, 300),
+}
+
+# retries the whole process may spend; each successful call earns back a
+# fraction of one, so a throttling storm stops retrying instead of piling on
+RETRY_BUDGET = 100
+RETRY_REFUND = 0.1
+
+# error codes AWS uses when it throttles a request
+THROTTLE_CODES = [
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "BandwidthLimitExceeded",
+    "SlowDown",
+    "EC2ThrottledException",
+]
+
+# describe_instance_status accepts at most 100 explicit instance IDs
+STATUS_BATCH_SIZE = 100
+
+# ID lists passed as filter values are split into batches of this size
+FILTER_BATCH_SIZE = 200
+
+# seconds a listing is reused before AWS is asked again
+CACHE_TTL = {"instances": 30, "volumes": 30, "buckets": 300, "regions": 3600}
+
+# (kind, query) -> (expiry time, records)
+inventory_cache = {}
+inventory_lock = threading.Lock()
+
+
+# clients
+def client_config():
+    from botocore.config import Config
+
+    return Config(
+        # enough connections for the largest thread pools in this module;
+        # iter_bucket_details() runs two bucket pools at once
+        max_pool_connections=max(MAX_WORKERS, 2 * BUCKET_WORKERS, TRANSFER_WORKERS),
+        retries={"mode": "standard", "max_attempts": RETRY_ATTEMPTS},
+        tcp_keepalive=True,
+    )
+
+
+def get_client(service, region=None):
+    region = region or os.environ["AWS_REGION"]
+    client = clients.get((service, region))
+    if client is not None:
+        return client
+    with clients_lock:
+        if (service, region) not in clients:
+            import boto3
+
+            # keys from the environment if set, otherwise boto3's default chain
+            client = boto3.client(
+                service,
+                aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+                region_name=region,
+                config=client_config(),
+            )
+            register_metrics_hooks(client)
+            register_limiter_hooks(client)
+            for hook in client_hooks:
+                hook(client)
+            clients[(service, region)] = client
+        return clients[(service, region)]
+
+
+def __getattr__(name):
+    # infra.ec2 and infra.s3 still work, but are created on first access
+    if name in ["ec2", "s3"]:
+        return get_client(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# metrics
+class Metrics:
+    # per-operation counts and latencies of AWS calls, collected by metrics()
+    def __init__(self):
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def entry(self, operation):
+        entry = self.operations.get(operation)
+        if entry is None:
+            entry = {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "throttles": 0,
+                "seconds": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+            }
+            self.operations[operation] = entry
+        return entry
+
+    def record_call(self, operation, seconds, retries, error):
+        with self.lock:
+            entry = self.entry(operation)
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["retries"] += retries
+            entry["seconds"] += seconds
+            for i, limit in enumerate(LATENCY_BUCKETS):
+                if seconds <= limit:
+                    entry["buckets"][i] += 1
+                    break
+
+    def record_throttle(self, operation):
+        with self.lock:
+            self.entry(operation)["throttles"] += 1
+
+    def calls(self):
+        with self.lock:
+            return {op: e["calls"] for op, e in self.operations.items()}
+
+    def to_json(self):
+        with self.lock:
+            return json.dumps(
+                {
+                    op: {**e, "buckets": dict(zip(LATENCY_LABELS, e["buckets"]))}
+                    for op, e in sorted(self.operations.items())
+                },
+                indent=2,
+            )
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            operations = sorted(self.operations.items())
+        for name, kind, help in [
+            ("calls", "counter", "AWS API calls"),
+            ("errors", "counter", "AWS API calls that failed"),
+            ("retries", "counter", "Retried attempts of AWS API calls"),
+            ("throttles", "counter", "Throttled attempts of AWS API calls"),
+        ]:
+            lines.append(f"# HELP infra_aws_{name}_total {help}.")
+            lines.append(f"# TYPE infra_aws_{name}_total {kind}")
+            for op, e in operations:
+                lines.append(f"infra_aws_{name}_total{{{labels(op)}}} {e[name]}")
+        lines.append("# HELP infra_aws_call_seconds Latency of AWS API calls.")
+        lines.append("# TYPE infra_aws_call_seconds histogram")
+        for op, e in operations:
+            total = 0
+            for label, count in zip(LATENCY_LABELS, e["buckets"]):
+                total += count
+                lines.append(
+                    f'infra_aws_call_seconds_bucket{{{labels(op)},le="{label}"}} {total}'
+                )
+            lines.append(f"infra_aws_call_seconds_sum{{{labels(op)}}} {e['seconds']}")
+            lines.append(f"infra_aws_call_seconds_count{{{labels(op)}}} {e['calls']}")
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        lines = [
+            f"{'operation':<40} {'calls':>6} {'errors':>6} {'retries':>7} "
+            f"{'throttles':>9} {'avg msec':>9}"
+        ]
+        with self.lock:
+            operations = sorted(self.operations.items(), key=lambda o: -o[1]["seconds"])
+        for op, e in operations:
+            average = 1000 * e["seconds"] / max(e["calls"], 1)
+            lines.append(
+                f"{op:<40} {e['calls']:>6} {e['errors']:>6} {e['retries']:>7} "
+                f"{e['throttles']:>9} {average:>9.1f}"
+            )
+        return "\n".join(lines)
+
+
+def labels(operation):
+    service, name = operation.split(".", 1)
+    return f'service="{service}",operation="{name}"'
+
+
+@contextmanager
+def metrics(scoped=False):
+    # collects every AWS call made (from any thread) while the block runs;
+    # nested and concurrent scopes each see all calls. A scoped collector only
+    # sees the calls made by this thread or task, and by the pools it uses
+    # here (see ContextExecutor), so concurrent callers are told apart.
+    m = Metrics()
+    if scoped:
+        token = scoped_metrics.set(scoped_metrics.get() + (m,))
+        try:
+            yield m
+        finally:
+            scoped_metrics.reset(token)
+        return
+    with metrics_lock:
+        active_metrics.append(m)
+    try:
+        yield m
+    finally:
+        with metrics_lock:
+            active_metrics.remove(m)
+
+
+def collecting_metrics():
+    # the scopes that see a call made right now, from this thread
+    return active_metrics + list(scoped_metrics.get())
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    # a thread pool whose tasks run in a copy of the submitter's context, so
+    # calls made on its threads count towards the caller's scoped metrics()
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+def register_metrics_hooks(client):
+    # the hooks are always registered, but return right away unless a
+    # metrics() scope is active
+    def operation_name(model):
+        return f"{model.service_model.service_name}.{model.name}"
+
+    def before_call(model, context, **kwargs):
+        if active_metrics or scoped_metrics.get():
+            context["infra_started"] = time.perf_counter()
+            context["infra_operation"] = operation_name(model)
+            context["infra_metrics"] = collecting_metrics()
+
+    def after_call(context, parsed=None, **kwargs):
+        # after-call-error (no response at all) passes neither model nor parsed
+        started = context.get("infra_started")
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        metadata = (parsed or {}).get("ResponseMetadata", {})
+        error = parsed is None or "Error" in parsed
+        for m in context["infra_metrics"]:
+            m.record_call(
+                context["infra_operation"],
+                seconds,
+                metadata.get("RetryAttempts", 0),
+                error,
+            )
+
+    def needs_retry(response, operation, **kwargs):
+        # called after every attempt; only throttled attempts are counted
+        if not (active_metrics or scoped_metrics.get()) or response is None:
+            return None
+        code = response[1].get("Error", {}).get("Code")
+        if code in THROTTLE_CODES:
+            for m in collecting_metrics():
+                m.record_throttle(operation_name(operation))
+        return None
+
+    events = client.meta.events
+    events.register("before-call", before_call)
+    events.register("after-call", after_call)
+    events.register("after-call-error", after_call)
+    events.register("needs-retry", needs_retry)
+
+
+# rate limiting
+class TokenBucket:
+    # requests wait for a token; the refill rate is halved when AWS throttles
+    # and grows back a little with every call that is not throttled (AIMD)
+    def __init__(self, rate, burst, min_rate=0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            # stop the burst that caused the throttling
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+
+class RetryBudget:
+    def __init__(self, capacity=RETRY_BUDGET, refund=RETRY_REFUND):
+        self.capacity = capacity
+        self.tokens = capacity
+        self.refund = refund
+        self.lock = threading.Lock()
+
+    def spend(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def earn(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + self.refund)
+
+
+# (service, region, family) -> TokenBucket, shared by all threads and modules
+limiters = {}
+limiters_lock = threading.Lock()
+retry_budget = RetryBudget()
+
+
+def get_limiter(service, region, family):
+    with limiters_lock:
+        if (service, region, family) not in limiters:
+            rate, burst = RATE_LIMITS.get((service, family), (50, 50))
+            limiters[(service, region, family)] = TokenBucket(rate, burst)
+        return limiters[(service, region, family)]
+
+
+def api_family(operation_name):
+    if operation_name.startswith(("Describe", "Get", "List", "Head")):
+        return "read"
+    return "write"
+
+
+def register_limiter_hooks(client):
+    service = client.meta.service_model.service_name
+    region = client.meta.region_name
+
+    def request_created(operation_name, **kwargs):
+        # every attempt, including retries, takes a token
+        get_limiter(service, region, api_family(operation_name)).acquire()
+
+    def needs_retry(response, attempts, caught_exception, operation, **kwargs):
+        # registered first, so it sees every attempt before botocore's retry
+        # handler; it never schedules a retry itself (always returns None)
+        import botocore.exceptions
+
+        limiter = get_limiter(service, region, api_family(operation.name))
+        code = status = None
+        if response is not None:
+            status = response[0].status_code
+            code = response[1].get("Error", {}).get("Code")
+        if code in THROTTLE_CODES:
+            limiter.throttled()
+        elif caught_exception is None:
+            limiter.succeeded()
+            if status < 500:
+                retry_budget.earn()
+                return None
+        if attempts >= RETRY_ATTEMPTS or retry_budget.spend():
+            return None
+        print(f"Retry budget exhausted, not retrying {service}.{operation.name}.")
+        if caught_exception is not None:
+            raise caught_exception
+        raise botocore.exceptions.ClientError(response[1], operation.name)
+
+    events = client.meta.events
+    events.register("request-created", request_created)
+    events.register_first("needs-retry", needs_retry)
+
+
+# inventory cache
+def get_cached(kind, query):
+    with inventory_lock:
+        entry = inventory_cache.get((kind, query))
+        if entry is None or entry[0] < time.time():
+            return None
+        # records are immutable, so callers can share them
+        return list(entry[1])
+
+
+def put_cached(kind, query, records):
+    with inventory_lock:
+        inventory_cache[(kind, query)] = (time.time() + CACHE_TTL[kind], list(records))
+
+
+def invalidate_inventory(*kinds):
+    # with no kinds, everything is invalidated
+    with inventory_lock:
+        for key in list(inventory_cache):
+            if len(kinds) == 0 or key[0] in kinds:
+                del inventory_cache[key]
+
+
+def save_inventory(path):
+    with inventory_lock:
+        entries = dict(inventory_cache)
+    with open(path, "wb") as f:
+        pickle.dump(entries, f)
+
+
+def load_inventory(path):
+    # restore a snapshot from save_inventory(), dropping expired entries
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        entries = pickle.load(f)
+    now = time.time()
+    with inventory_lock:
+        for key, entry in entries.items():
+            if entry[0] > now:
+                inventory_cache[key] = entry
+
+
+# records
+class Record:
+    # read-only dict-style access, so code written for the dict records that
+    # infra used to return (record["name"], "name" in record) keeps working
+    __slots__ = ()
+    KEYS = ()
+
+    def keys(self):
+        return self.KEYS
+
+    def __getitem__(self, key):
+        if key not in self.keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        return self[key] if key in self.keys() else default
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.keys()}
+
+
+@dataclass(frozen=True, slots=True)
+class Instance(Record):
+    image_id: str
+    instance_id: str
+    instance_type: str
+    key_name: str
+    launch_time: datetime.datetime
+    state: str
+    zone: str
+    name: str
+    public_ip: str
+    public_dns_name: str
+    # ((group name, group ID), ...)
+    security_groups: tuple
+    # ((device, delete_on_termination, status, volume ID), ...)
+    block_devices: tuple
+    region: str
+    termination_protection: bool
+    instance_status: str = "-"
+    system_status: str = "-"
+
+    KEYS = (
+        "image_id",
+        "instance_id",
+        "instance_type",
+        "key_name",
+        "launch_time",
+        "state",
+        "zone",
+        "name",
+        "public_ip",
+        "public_dns_name",
+        "security_group_name",
+        "security_group_id",
+        "volumes",
+        "region",
+        "termination_protection",
+        "instance_status",
+        "system_status",
+    )
+
+    # derived fields are only built when they are asked for
+    @property
+    def security_group_name(self):
+        return ",".join(name for name, _ in self.security_groups)
+
+    @property
+    def security_group_id(self):
+        return ",".join(group_id for _, group_id in self.security_groups)
+
+    @property
+    def volumes(self):
+        return [
+            {
+                "name": device,
+                "delete_on_termination": delete_on_termination,
+                "status": status,
+                "volume_id": volume_id,
+            }
+            for device, delete_on_termination, status, volume_id in self.block_devices
+        ]
+
+
+@dataclass(frozen=True, slots=True)
+class Volume(Record):
+    volume_id: str
+    type: str
+    size: int
+    create_time: datetime.datetime
+    state: str
+    zone: str
+    encrypted: bool
+    name: str
+    # ((instance ID, device, state), ...)
+    attached_to: tuple
+    region: str
+
+    KEYS = (
+        "volume_id",
+        "type",
+        "size",
+        "create_time",
+        "state",
+        "zone",
+        "encrypted",
+        "name",
+        "attachments",
+        "region",
+    )
+
+    @property
+    def attachments(self):
+        return [
+            {"instance_id": instance_id, "device": device, "state": state}
+            for instance_id, device, state in self.attached_to
+        ]
+
+
+@dataclass(frozen=True, slots=True)
+class Bucket(Record):
+    name: str
+    creation_date: datetime.datetime
+    # details that were not fetched are None and are left out of keys()
+    region: str = None
+    encryption: str = None
+    versioning: str = None
+    public_access_blocked: str = None
+    # a tuple of origins, or an error message
+    allowed_origins: object = None
+
+    KEYS = (
+        "name",
+        "creation_date",
+        "region",
+        "encryption",
+        "versioning",
+        "public_access_blocked",
+        "cors_allowed_origins",
+    )
+
+    @classmethod
+    def from_dict(cls, bucket):
+        details = dict(bucket)
+        origins = details.pop("cors_allowed_origins", None)
+        if type(origins) is list:
+            origins = tuple(origins)
+        return cls(**details, allowed_origins=origins)
+
+    @property
+    def cors_allowed_origins(self):
+        if type(self.allowed_origins) is tuple:
+            return list(self.allowed_origins)
+        return self.allowed_origins
+
+    def keys(self):
+        return tuple(key for key in self.KEYS if getattr(self, key) is not None)
+
+
+# regions
+def get_regions(regions=None):
+    # None is the default region, "all" is every region enabled for the account
+    if regions is None:
+        return [os.environ["AWS_REGION"]]
+    if type(regions) is str and regions != "all":
+        return [regions]
+    if regions != "all":
+        return list(regions)
+    names = get_cached("regions", None)
+    if names is None:
+        response = get_client("ec2").describe_regions()
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in describe_regions() response: {response}"
+        names = sorted(r["RegionName"] for r in response["Regions"])
+        put_cached("regions", None, names)
+    return names
+
+
+def sweep_regions(fetch, regions=None):
+    # calls fetch(region) for all regions at once, so a sweep takes as long as
+    # the slowest region; the records are merged in region order
+    regions = get_regions(regions)
+    if len(regions) == 1:
+        return fetch(regions[0])
+    with ContextExecutor(max_workers=len(regions)) as executor:
+        return [
+            record for records in executor.map(fetch, regions) for record in records
+        ]
 
 
 # functions
-def list_instances(name=None, instance_id=None):
-    response = ec2.describe_instances()
-    assert (
-        response["ResponseMetadata"]["HTTPStatusCode"] == 200
-    ), f"Error in describe_instances() response: {response}."
-    assert "Reservations" in response, "Response missing 'Reservations' information."
-    for r in response["Reservations"]:
-        assert len(r["Instances"]) == 1, "Wrong number of reservations in instance."
-    results = [r["Instances"][0] for r in response["Reservations"]]
-    instances = []
-    for result in results:
-        instance = {
-            "image_id": result["ImageId"],
-            "instance_id": result["InstanceId"],
-            "instance_type": result["InstanceType"],
-            "key_name": result.get("KeyName", "-"),
-            "launch_time": result["LaunchTime"],
-            "state": result["State"]["Name"],
-            "zone": result["Placement"]["AvailabilityZone"],
-        }
-        instance_name = "-"
-        if "Tags" in result:
-            for tag in result["Tags"]:
-                if "Key" in tag:
-                    instance_name = tag["Value"]
-        instance["name"] = instance_name
-        if (len(result["NetworkInterfaces"]) > 0) and (
-            "Association" in result["NetworkInterfaces"][0]
-        ):
-            instance["public_ip"] = result["NetworkInterfaces"][0]["Association"][
-                "PublicIp"
-            ]
-            instance["public_dns_name"] = result["NetworkInterfaces"][0]["Association"][
-                "PublicDnsName"
-            ]
-        else:
-            instance["public_ip"] = "-"
-            instance["public_dns_name"] = "-"
-        instance["security_group_name"] = ",".join(
-            [g["GroupName"] for g in result["SecurityGroups"]]
-        )
-        instance["security_group_id"] = ",".join(
-            [g["GroupId"] for g in result["SecurityGroups"]]
+def get_instance_statuses(instance_ids, region=None):
+    # one call per 100 instances instead of one call per instance
+    statuses = {}
+    for i in range(0, len(instance_ids), STATUS_BATCH_SIZE):
+        response = get_client("ec2", region).describe_instance_status(
+            InstanceIds=instance_ids[i : i + STATUS_BATCH_SIZE],
+            IncludeAllInstances=True,
         )
-        instance["volumes"] = []
-        for mapping in result["BlockDeviceMappings"]:
-            volume = {
-                "name": mapping["DeviceName"],
-                "delete_on_termination": mapping["Ebs"]["DeleteOnTermination"],
-                "status": mapping["Ebs"]["Status"],
-                "volume_id": mapping["Ebs"]["VolumeId"],
-            }
-            instance["volumes"].append(volume)
-        r = ec2.describe_instance_attribute(
-            Attribute="disableApiTermination", InstanceId=result["InstanceId"]
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in describe_instance_status() response: {response}"
+        for status in response["InstanceStatuses"]:
+            # only running instances report health checks
+            if status["InstanceState"]["Name"] == "running":
+                statuses[status["InstanceId"]] = {
+                    "instance_status": status["InstanceStatus"]["Status"],
+                    "system_status": status["SystemStatus"]["Status"],
+                }
+    return statuses
+
+
+def read_termination_protection(instance_id, region=None):
+    response = get_client("ec2", region).describe_instance_attribute(
+        Attribute="disableApiTermination", InstanceId=instance_id
+    )
+    return response["DisableApiTermination"]["Value"]
+
+
+def get_termination_protection(instance_ids, region=None):
+    # the attribute can only be read one instance at a time, so read concurrently
+    def fetch(instance_id):
+        return read_termination_protection(instance_id, region)
+
+    if len(instance_ids) == 0:
+        return {}
+    with ContextExecutor(max_workers=MAX_WORKERS) as executor:
+        return dict(zip(instance_ids, executor.map(fetch, instance_ids)))
+
+
+# waiters
+def wait_until(probe, timeout=300, delay=1, max_delay=15):
+    # call probe() with exponential backoff (plus jitter) until it returns
+    # True; returns the number of attempts
+    deadline = time.time() + timeout
+    attempt = 0
+    while True:
+        attempt += 1
+        if probe():
+            return attempt
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError(f"Condition not met after {timeout} sec.")
+        backoff = min(max_delay, delay * 2 ** (attempt - 1))
+        time.sleep(min(remaining, backoff / 2 + random.uniform(0, backoff / 2)))
+
+
+def get_instance_states(instance_ids):
+    # one targeted describe call per 1000 instances
+    import botocore.exceptions
+
+    states = {}
+    for i in range(0, len(instance_ids), 1000):
+        try:
+            paginator = get_client("ec2").get_paginator("describe_instances")
+            for response in paginator.paginate(InstanceIds=instance_ids[i : i + 1000]):
+                for r in response["Reservations"]:
+                    for result in r["Instances"]:
+                        states[result["InstanceId"]] = result["State"]["Name"]
+        except botocore.exceptions.ClientError as e:
+            # just-launched instances can be briefly unknown to describe calls
+            if e.response["Error"]["Code"] != "InvalidInstanceID.NotFound":
+                raise
+    return states
+
+
+def poll_instances(pending, state="running", status_ok=False, failures=None):
+    # one poll of wait_for_instances(): removes the instances that are done
+    # from the pending set; returns True when none are left
+    failed = {"running": ["shutting-down", "terminated"], "stopped": ["terminated"]}
+    states = get_instance_states(sorted(pending))
+    for instance_id in sorted(pending):
+        if states.get(instance_id) in failed.get(state, []):
+            message = f"Instance {instance_id} is {states[instance_id]}, not {state}."
+            assert failures is not None, message
+            failures[instance_id] = message
+            pending.remove(instance_id)
+    done = {i for i in pending if states.get(i) == state}
+    if status_ok and len(done) > 0:
+        statuses = get_instance_statuses(sorted(done))
+        done = {
+            i
+            for i in done
+            if statuses.get(i) == {"instance_status": "ok", "system_status": "ok"}
+        }
+    pending.difference_update(done)
+    if len(pending) > 0:
+        print(f"Waiting on {len(pending)} instance(s) to be {state}.")
+    return len(pending) == 0
+
+
+def wait_for_instances(
+    instance_ids,
+    state="running",
+    status_ok=False,
+    timeout=300,
+    max_delay=15,
+    failures=None,
+):
+    # wait until every instance is in `state` (and, with status_ok, passes
+    # both health checks); returns the number of polls. If a `failures` dict
+    # is given, instances that fail or time out are recorded there instead
+    # of raising.
+    pending = set(instance_ids)
+
+    def probe():
+        return poll_instances(pending, state, status_ok, failures)
+
+    try:
+        return wait_until(probe, timeout=timeout, max_delay=max_delay)
+    except TimeoutError:
+        message = (
+            f"Instances {sorted(pending)} did not become {state} in {timeout} sec."
         )
-        instance["termination_protection"] = r["DisableApiTermination"]["Value"]
-        r = ec2.describe_instance_status(InstanceIds=[result["InstanceId"]])
-        instance_statuses = r["InstanceStatuses"]
-        if len(instance_statuses) > 0:
-            instance["instance_status"] = instance_statuses[0]["InstanceStatus"][
-                "Status"
-            ]
-            instance["system_status"] = instance_statuses[0]["SystemStatus"]["Status"]
-        else:
-            instance["instance_status"] = "-"
-            instance["system_status"] = "-"
-        instances.append(instance)
+        if failures is None:
+            raise Exception(message)
+        for instance_id in pending:
+            failures[instance_id] = message
+        return None
+
+
+def id_filter_sets(filters, filter_name, ids):
+    # one filter set per batch of IDs; None means "no ID restriction"
+    if ids is None:
+        return [filters]
+    return [
+        filters + [{"Name": filter_name, "Values": ids[i : i + FILTER_BATCH_SIZE]}]
+        for i in range(0, len(ids), FILTER_BATCH_SIZE)
+    ]
+
+
+def describe_instance_pages(
+    name=None, instance_id=None, instance_ids=None, region=None, name_prefix=None
+):
+    # filters are applied by EC2, and every page of results is fetched
+    filters = []
     if name:
-        instances = [i for i in instances if i["name"] == name]
+        filters.append({"Name": "tag:Name", "Values": [name]})
+    if name_prefix:
+        filters.append({"Name": "tag:Name", "Values": [name_prefix + "*"]})
     if instance_id:
-        instances = [i for i in instances if i["instance_id"] == instance_id]
-    return instances
+        # a filter (not InstanceIds) so unknown IDs give no results, not an error
+        filters.append({"Name": "instance-id", "Values": [instance_id]})
+    paginator = get_client("ec2", region).get_paginator("describe_instances")
+    for filter_set in id_filter_sets(filters, "instance-id", instance_ids):
+        for response in paginator.paginate(Filters=filter_set):
+            assert (
+                response["ResponseMetadata"]["HTTPStatusCode"] == 200
+            ), f"Error in describe_instances() response: {response}."
+            assert (
+                "Reservations" in response
+            ), "Response missing 'Reservations' information."
+            # instances launched together (MinCount > 1) share a reservation
+            yield [
+                result for r in response["Reservations"] for result in r["Instances"]
+            ]
 
 
-def list_instance(name=None, instance_id=None):
+def instance_from_result(
+    result, region=None, termination_protection=False, status=None
+):
+    instance_name = "-"
+    if "Tags" in result:
+        for tag in result["Tags"]:
+            if "Key" in tag:
+                instance_name = tag["Value"]
+    public_ip = public_dns_name = "-"
+    if (len(result["NetworkInterfaces"]) > 0) and (
+        "Association" in result["NetworkInterfaces"][0]
+    ):
+        association = result["NetworkInterfaces"][0]["Association"]
+        public_ip = association["PublicIp"]
+        public_dns_name = association["PublicDnsName"]
+    return Instance(
+        image_id=result["ImageId"],
+        instance_id=result["InstanceId"],
+        instance_type=result["InstanceType"],
+        key_name=result.get("KeyName", "-"),
+        launch_time=result["LaunchTime"],
+        state=result["State"]["Name"],
+        zone=result["Placement"]["AvailabilityZone"],
+        name=instance_name,
+        public_ip=public_ip,
+        public_dns_name=public_dns_name,
+        security_groups=tuple(
+            (g["GroupName"], g["GroupId"]) for g in result["SecurityGroups"]
+        ),
+        block_devices=tuple(
+            (
+                mapping["DeviceName"],
+                mapping["Ebs"]["DeleteOnTermination"],
+                mapping["Ebs"]["Status"],
+                mapping["Ebs"]["VolumeId"],
+            )
+            for mapping in result["BlockDeviceMappings"]
+        ),
+        region=region or os.environ["AWS_REGION"],
+        termination_protection=termination_protection,
+        **(status or {}),
+    )
+
+
+def list_instances(name=None, instance_id=None, refresh=False, regions=None):
+    # regions is a list of region names or "all"; by default only AWS_REGION
+    def list_region(region):
+        if not refresh:
+            # a fresh full listing answers any query
+            instances = get_cached("instances", (region, None, None))
+            if instances is None:
+                instances = get_cached("instances", (region, name, instance_id))
+            if instances is not None:
+                if name:
+                    instances = [i for i in instances if i["name"] == name]
+                if instance_id:
+                    instances = [
+                        i for i in instances if i["instance_id"] == instance_id
+                    ]
+                return instances
+        instances = fetch_instances(name=name, instance_id=instance_id, region=region)
+        put_cached("instances", (region, name, instance_id), instances)
+        return instances
+
+    return sweep_regions(list_region, regions)
+
+
+def fetch_instances(name=None, instance_id=None, instance_ids=None, region=None):
+    return list(
+        iter_instances(
+            name=name,
+            instance_id=instance_id,
+            instance_ids=instance_ids,
+            regions=region,
+        )
+    )
+
+
+def iter_instances(
+    name=None,
+    instance_id=None,
+    instance_ids=None,
+    name_prefix=None,
+    regions=None,
+    ordered=True,
+):
+    # yields each instance as soon as its details have been read, instead of
+    # building the whole list first. Regions are read one after another; with
+    # ordered=False instances come in the order their details arrive. Always
+    # asks AWS (list_instances() is the cached version).
+    def detail(result, region, statuses):
+        protection = read_termination_protection(result["InstanceId"], region)
+        return instance_from_result(
+            result,
+            region=region,
+            termination_protection=protection,
+            status=statuses.result().get(result["InstanceId"]),
+        )
+
+    executor = ContextExecutor(max_workers=MAX_WORKERS)
+    try:
+        for region in get_regions(regions):
+            for results in describe_instance_pages(
+                name=name,
+                instance_id=instance_id,
+                instance_ids=instance_ids,
+                region=region,
+                name_prefix=name_prefix,
+            ):
+                futures = []
+                for i in range(0, len(results), STATUS_BATCH_SIZE):
+                    batch = results[i : i + STATUS_BATCH_SIZE]
+                    # queued ahead of the batch's details, so it is always
+                    # running before they wait on it
+                    statuses = executor.submit(
+                        get_instance_statuses,
+                        [result["InstanceId"] for result in batch],
+                        region,
+                    )
+                    futures.extend(
+                        executor.submit(detail, result, region, statuses)
+                        for result in batch
+                    )
+                for future in futures if ordered else as_completed(futures):
+                    instance = future.result()
+                    if name and instance["name"] != name:
+                        continue
+                    if instance_id and instance["instance_id"] != instance_id:
+                        continue
+                    yield instance
+    finally:
+        # a caller that stops early does not wait for the rest of the page
+        executor.shutdown(cancel_futures=True)
+
+
+def list_instance(name=None, instance_id=None, refresh=False):
     assert type(name) is str or type(instance_id) is str
-    instances = list_instances(name=name, instance_id=instance_id)
+    instances = list_instances(name=name, instance_id=instance_id, refresh=refresh)
     assert len(instances) > 0, f"Instance {name} does not exist."
     assert (
         len(instances) == 1
@@ -107,53 +1009,168 @@ def list_instance(name=None, instance_id=None):
     return instances[0]
 
 
-def list_volumes(volume_id=None):
-    response = ec2.describe_volumes()
-    assert (
-        response["ResponseMetadata"]["HTTPStatusCode"] == 200
-    ), f"Error in describe_volumes() response: {response}"
-    assert "Volumes" in response, "Response missing 'Volumes' information."
-    results = response["Volumes"]
-    volumes = []
-    for result in results:
-        volume = {
-            "volume_id": result["VolumeId"],
-            "type": result["VolumeType"],
-            "size": result.get("Size"),
-            "create_time": result["CreateTime"],
-            "state": result["State"],
-            "zone": result["AvailabilityZone"],
-            "encrypted": result["Encrypted"],
-        }
-        volume["name"] = "-"
-        if "Tags" in result:
-            for tag in result["Tags"]:
-                if "Key" in tag:
-                    volume["name"] = tag["Value"]
-        volume["attachments"] = []
-        for item in result["Attachments"]:
-            volume["attachments"].append(
-                {
-                    "instance_id": item["InstanceId"],
-                    "device": item["Device"],
-                    "state": item["State"],
-                }
-            )
-        volumes.append(volume)
+def describe_volume_pages(volume_id=None, volume_ids=None, region=None, states=None):
+    # up to FILTER_BATCH_SIZE IDs per call; states (e.g. ["available"]) are
+    # filtered by EC2
+    filters = []
     if volume_id:
-        volumes = [v for v in volumes if v["volume_id"] == volume_id]
-    return volumes
+        filters.append({"Name": "volume-id", "Values": [volume_id]})
+    if states:
+        filters.append({"Name": "status", "Values": list(states)})
+    paginator = get_client("ec2", region).get_paginator("describe_volumes")
+    for filter_set in id_filter_sets(filters, "volume-id", volume_ids):
+        for response in paginator.paginate(Filters=filter_set):
+            assert (
+                response["ResponseMetadata"]["HTTPStatusCode"] == 200
+            ), f"Error in describe_volumes() response: {response}"
+            assert "Volumes" in response, "Response missing 'Volumes' information."
+            yield response["Volumes"]
+
+
+def volume_from_result(result, region=None):
+    volume_name = "-"
+    if "Tags" in result:
+        for tag in result["Tags"]:
+            if "Key" in tag:
+                volume_name = tag["Value"]
+    return Volume(
+        volume_id=result["VolumeId"],
+        type=result["VolumeType"],
+        size=result.get("Size"),
+        create_time=result["CreateTime"],
+        state=result["State"],
+        zone=result["AvailabilityZone"],
+        encrypted=result["Encrypted"],
+        name=volume_name,
+        attached_to=tuple(
+            (item["InstanceId"], item["Device"], item["State"])
+            for item in result["Attachments"]
+        ),
+        region=region or os.environ["AWS_REGION"],
+    )
+
+
+def list_volumes(volume_id=None, refresh=False, regions=None):
+    def list_region(region):
+        if not refresh:
+            volumes = get_cached("volumes", (region, None))
+            if volumes is None:
+                volumes = get_cached("volumes", (region, volume_id))
+            if volumes is not None:
+                if volume_id:
+                    volumes = [v for v in volumes if v["volume_id"] == volume_id]
+                return volumes
+        volumes = fetch_volumes(volume_id=volume_id, region=region)
+        put_cached("volumes", (region, volume_id), volumes)
+        return volumes
+
+    return sweep_regions(list_region, regions)
+
+
+def fetch_volumes(volume_id=None, volume_ids=None, region=None):
+    return list(
+        iter_volumes(volume_id=volume_id, volume_ids=volume_ids, regions=region)
+    )
+
+
+def iter_volumes(volume_id=None, volume_ids=None, regions=None, states=None):
+    # yields volumes page by page, region by region, always asking AWS
+    for region in get_regions(regions):
+        for results in describe_volume_pages(
+            volume_id=volume_id, volume_ids=volume_ids, region=region, states=states
+        ):
+            for result in results:
+                if volume_id and result["VolumeId"] != volume_id:
+                    continue
+                yield volume_from_result(result, region=region)
 
 
-def list_volume(volume_id=None):
+def list_volume(volume_id=None, refresh=False):
     assert type(volume_id) is str
-    volumes = list_volumes(volume_id=volume_id)
+    volumes = list_volumes(volume_id=volume_id, refresh=refresh)
     assert (
         len(volumes) == 1
     ), f"Volume does not exist or specifies more than one volume. (N={len(volumes)})"
     return volumes[0]
 
 
+def find_orphaned_volumes(regions=None, min_age=3600):
+    # volumes nothing is attached to (e.g. left behind by instances without
+    # delete_on_termination), found with a server-side status filter. Volumes
+    # younger than min_age seconds may be about to be attached, so are skipped.
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=min_age
+    )
+    return [
+        v
+        for v in iter_volumes(regions=regions, states=["available"])
+        if v["create_time"] <= cutoff
+    ]
+
+
+def poll_volumes_deleted(pending, region=None):
+    # one poll of wait_for_volumes_deleted(): removes deleted volumes from the
+    # pending set; returns True when none are left
+    remaining = {
+        v["volume_id"]
+        for v in iter_volumes(volume_ids=sorted(pending), regions=region)
+        if v["state"] != "deleted"
+    }
+    pending.intersection_update(remaining)
+    if len(pending) > 0:
+        print(f"Waiting on {len(pending)} volume(s) to be deleted.")
+    return len(pending) == 0
+
+
+def wait_for_volumes_deleted(volume_ids, region=None, timeout=300, max_delay=15):
+    # one describe call per FILTER_BATCH_SIZE volumes per poll; returns the
+    # IDs of volumes that still exist at the timeout
+    pending = set(volume_ids)
+
+    def probe():
+        return poll_volumes_deleted(pending, region)
+
+    try:
+        wait_until(probe, timeout=timeout, max_delay=max_delay)
+    except TimeoutError:
+        pass
+    return sorted(pending)
+
+
+def delete_volumes(volume_ids, region=None, timeout=300):
+    # EC2 deletes one volume per call, so the calls are made concurrently,
+    # then all deletions are waited on together. Returns a result per volume
+    # ID; volumes that are attached or unknown are reported as errors.
+    import botocore.exceptions
+
+    def delete(volume_id):
+        try:
+            response = get_client("ec2", region).delete_volume(VolumeId=volume_id)
+            assert (
+                response["ResponseMetadata"]["HTTPStatusCode"] == 200
+            ), f"Error in delete_volume() response: {response}"
+            return None
+        except botocore.exceptions.ClientError as e:
+            return f"Volume {volume_id} not deleted: {e.response['Error']['Code']}."
+
+    print(f"Deleting {len(volume_ids)} volumes.")
+    with ContextExecutor(max_workers=MAX_WORKERS) as executor:
+        errors = list(executor.map(delete, volume_ids))
+    invalidate_inventory("volumes")
+    results = {
+        volume_id: {"volume_id": volume_id, "error": error}
+        for volume_id, error in zip(volume_ids, errors)
+    }
+    deleting = [r["volume_id"] for r in results.values() if r["error"] is None]
+    for volume_id in wait_for_volumes_deleted(deleting, region, timeout):
+        results[volume_id][
+            "error"
+        ] = f"Volume {volume_id} was not deleted in {timeout} sec."
+    errors = len([r for r in results.values() if r["error"]])
+    print(f"Deleted {len(results) - errors} of {len(results)} volumes.")
+    return results
+
+
 def set_termination_protection(instance_id, value):
     # verify that the name goes with the instance ID
     instances = list_instances(instance_id=instance_id)
@@ -162,13 +1179,16 @@ def set_termination_protection(instance_id, value):
     print(
         f"Setting termination_protection for {instance_id}/{instance['name']} to {value}."
     )
-    response = ec2.modify_instance_attribute(
+    response = get_client("ec2").modify_instance_attribute(
         DisableApiTermination={"Value": value}, InstanceId=instance_id
     )
+    invalidate_inventory("instances")
+    for hook in change_hooks:
+        hook("instances", [instance_id])
     assert (
         response["ResponseMetadata"]["HTTPStatusCode"] == 200
     ), f"Error in modify_instance_attribute() response: {response}"
-    response = ec2.describe_instance_attribute(
+    response = get_client("ec2").describe_instance_attribute(
         Attribute="disableApiTermination", InstanceId=instance["instance_id"]
     )
     assert response["DisableApiTermination"]["Value"] == value
@@ -193,7 +1213,83 @@ def create_instance(
     assert type(name) is str and len(name) > 2, f"Illegal instance name {[str]}."
     assert disk_size > 0, f"Disk_size={disk_size} is too small."
     assert key_name, f"Key name (key_name) argument must be provided."
-    response = ec2.run_instances(
+    start = time.time()
+    # only this launch's calls, also when others run in parallel
+    with metrics(scoped=True) as m:
+        instance = launch_instance(
+            name,
+            instance_type,
+            image_id,
+            zone,
+            key_name,
+            security_group_id,
+            device,
+            disk_size,
+            delete_on_termination,
+            termination_protection,
+        )
+    seconds = time.time() - start
+    print(
+        f"Instance {name} was created in {seconds:.1f} sec. "
+        f"with {sum(m.calls().values())} API calls ({m.calls()})."
+    )
+    return instance
+
+
+def launch_instance(
+    name,
+    instance_type,
+    image_id,
+    zone,
+    key_name,
+    security_group_id,
+    device,
+    disk_size,
+    delete_on_termination,
+    termination_protection,
+):
+    instance_id = run_instance(
+        name,
+        instance_type,
+        image_id,
+        zone,
+        key_name,
+        security_group_id,
+        device,
+        disk_size,
+        delete_on_termination,
+        termination_protection,
+    )
+    wait_for_instances([instance_id], state="running", timeout=120)
+    return verify_instance(
+        instance_id,
+        name,
+        instance_type,
+        image_id,
+        zone,
+        key_name,
+        security_group_id,
+        device,
+        disk_size,
+        delete_on_termination,
+        termination_protection,
+    )
+
+
+def run_instance(
+    name,
+    instance_type,
+    image_id,
+    zone,
+    key_name,
+    security_group_id,
+    device,
+    disk_size,
+    delete_on_termination,
+    termination_protection,
+):
+    # starts the launch; returns the new instance's ID
+    response = get_client("ec2").run_instances(
         BlockDeviceMappings=[
             {
                 "DeviceName": device,
@@ -212,6 +1308,8 @@ def create_instance(
         Placement={"AvailabilityZone": zone},
         KeyName=key_name,
         SecurityGroupIds=[security_group_id],
+        # set at launch instead of with a separate modify call
+        DisableApiTermination=termination_protection,
         TagSpecifications=[
             {
                 "ResourceType": "instance",
@@ -219,71 +1317,82 @@ def create_instance(
             }
         ],
     )
+    invalidate_inventory("instances", "volumes")
     assert (
         response["ResponseMetadata"]["HTTPStatusCode"] == 200
     ), f"Error in run_instances() response: {response}"
-    instance = None
-    instance_state = "unknown"
-    for i in range(1, 120):
-        time.sleep(1)
-        if i % 5 == 0:
-            instance = list_instance(name=name)
-            instance_id = instance["instance_id"]
-            instance_state = instance["state"]
-            if instance_state == "running":
-                break
-            print(f"Waiting on start of instance {instance_id}/{name}. ({i} sec)")
-
-    if instance_state != "running":
-        raise Exception(f"Instance {name} did not start {instance}.")
-
-    # set the termination protection
-    set_termination_protection(instance_id, termination_protection)
-
-    # make sure the instance was created correctly
-    instance = list_instance(instance_id=instance_id)
+    instance_id = response["Instances"][0]["InstanceId"]
+    return instance_id
+
+
+def verify_instance(
+    instance_id,
+    name,
+    instance_type,
+    image_id,
+    zone,
+    key_name,
+    security_group_id,
+    device,
+    disk_size,
+    delete_on_termination,
+    termination_protection,
+):
+    # checks a launched (running) instance against its spec and returns it,
+    # with targeted calls: one describe each for the instance, its status and
+    # its protection attribute, and one for its own volume
+    instances = fetch_instances(instance_ids=[instance_id])
+    assert len(instances) == 1, f"Instance {instance_id} not found."
+    instance = instances[0]
 
     # check some things about the instance
     assert instance["name"] == name
     assert instance["instance_id"] == instance_id
     assert instance["state"] == "running"
     assert instance["instance_type"] == instance_type
-    assert instance["image_id"] == "ami-097a2df4ac947655f"
+    assert instance["image_id"] == image_id
     assert instance["key_name"] == key_name
-    assert instance["security_group_id"] == "sg-0364d234122df6a66"
+    assert instance["security_group_id"] == security_group_id
     assert instance["termination_protection"] == termination_protection
     assert instance["instance_status"] == "initializing"
     assert instance["system_status"] == "initializing"
-    instance_id = instance["instance_id"]
 
     # check storage
     volumes = instance["volumes"]
     assert len(volumes) == 1
-    assert volumes[0]["delete_on_termination"] == True
+    assert volumes[0]["delete_on_termination"] == delete_on_termination
     assert volumes[0]["status"] == "attached"
     volume_id = volumes[0]["volume_id"]
     assert volume_id.startswith("vol-")
     assert volumes[0]["name"] == device
 
     # verify the volume info
-    volume = list_volumes(volume_id=volume_id)[0]
+    volumes = fetch_volumes(volume_ids=[volume_id])
+    assert len(volumes) == 1, f"Volume {volume_id} not found."
+    volume = volumes[0]
     assert volume["volume_id"] == volume_id
     assert volume["size"] == disk_size
     assert volume["type"] == "gp2"
     assert len(volume["attachments"]) == 1
     assert volume["attachments"][0]["instance_id"] == instance_id
     assert volume["attachments"][0]["device"] == device
-    print(f"Instance {name} was created.")
-
     return instance
 
 
 def terminate_instance(instance_id):
+    volumes = start_termination(instance_id)
+    wait_for_instances([instance_id], state="terminated", timeout=180)
+    return verify_termination(instance_id, volumes)
+
+
+def start_termination(instance_id):
+    # returns the volumes the instance had, for verify_termination()
     # verify that the name goes with the instance ID
     instance = list_instance(instance_id=instance_id)
     volumes = instance["volumes"]
     print(f"Terminating instance {instance_id}/{instance['name']}.")
-    response = ec2.terminate_instances(InstanceIds=[instance_id])
+    response = get_client("ec2").terminate_instances(InstanceIds=[instance_id])
+    invalidate_inventory("instances", "volumes")
     try:
         assert (
             response["ResponseMetadata"]["HTTPStatusCode"] == 200
@@ -291,26 +1400,21 @@ def terminate_instance(instance_id):
     except Exception as e:
         print("raising error in termination.")
         raise (e)
-    instance_state = "unknown"
-    for i in range(1, 180):
-        time.sleep(1)
-        if i % 5 == 0:
-            instance = list_instance(instance_id=instance_id)
-            instance_state = instance["state"]
-            if instance_state == "terminated":
-                break
-            print(
-                f"Waiting on termination of instance {instance_id}/{instance['name']}. ({i} sec)"
-            )
-    if instance_state != "terminated":
-        raise Exception(f"Instance {instance_id} did not terminate: {instance}")
+    return volumes
+
 
-    # verify that the volumes ae gone
-    for volume in volumes:  # here was are going over the -old- instance volume list
+def verify_termination(instance_id, volumes):
+    instance = list_instance(instance_id=instance_id, refresh=True)
+
+    # verify that the volumes are gone, with one describe call for all of
+    # them (this goes over the -old- instance volume list)
+    deleted = [v["volume_id"] for v in volumes if v["delete_on_termination"]]
+    remaining = {v["volume_id"] for v in fetch_volumes(volume_ids=deleted)}
+    for volume in volumes:
         if volume["delete_on_termination"]:
             assert (
-                len(list_volumes(volume_id=volume["volume_id"])) == 0
-            ), f"Volume {volume_id} not deleted: {volume}"
+                volume["volume_id"] not in remaining
+            ), f"Volume {volume['volume_id']} not deleted: {volume}"
             print(f"Volume {volume['volume_id']} was deleted at instance termination.")
         else:
             print(
@@ -319,8 +1423,355 @@ def terminate_instance(instance_id):
     return instance
 
 
-def list_buckets(name=None):
-    response = s3.list_buckets()
+def get_existing_names(names, region=None):
+    # the names in `names` that instances which are not terminated carry; one
+    # describe call per batch of names, no attribute or status lookups
+    filters = [
+        {
+            "Name": "instance-state-name",
+            "Values": ["pending", "running", "shutting-down", "stopping", "stopped"],
+        }
+    ]
+    existing = set()
+    paginator = get_client("ec2", region).get_paginator("describe_instances")
+    for filter_set in id_filter_sets(filters, "tag:Name", list(names)):
+        for response in paginator.paginate(Filters=filter_set):
+            assert (
+                response["ResponseMetadata"]["HTTPStatusCode"] == 200
+            ), f"Error in describe_instances() response: {response}."
+            for r in response["Reservations"]:
+                for result in r["Instances"]:
+                    for tag in result.get("Tags", []):
+                        if tag["Key"] == "Name":
+                            existing.add(tag["Value"])
+    return existing
+
+
+def create_instances(specs, timeout=300):
+    # specs are lists of create_instance() keyword arguments. Specs that only
+    # differ by name are launched with a single run_instances call, then all
+    # instances are waited on together. Returns one result per spec, in order;
+    # a spec whose launch failed has an error, and its instance ID if the
+    # instance was started before the failure.
+    defaults = {
+        "instance_type": "t2.micro",
+        "image_id": "ami-097a2df4ac947655f",
+        "zone": "us-east-2c",
+        "key_name": None,
+        "security_group_id": "sg-0364d234122df6a66",
+        "device": "/dev/sda1",
+        "disk_size": 0,
+        "delete_on_termination": True,
+        "termination_protection": True,
+    }
+    specs = [{**defaults, **spec} for spec in specs]
+    names = [spec["name"] for spec in specs]
+    assert len(set(names)) == len(names), f"Instance names are not unique: {names}."
+    existing = get_existing_names(names)
+    for spec in specs:
+        assert (
+            spec["name"] not in existing
+        ), f"Instance '{spec['name']}' already exists."
+        assert (
+            type(spec["name"]) is str and len(spec["name"]) > 2
+        ), f"Illegal instance name {spec['name']}."
+        assert spec["disk_size"] > 0, f"Disk_size={spec['disk_size']} is too small."
+        assert spec["key_name"], "Key name (key_name) argument must be provided."
+
+    groups = {}
+    for spec in specs:
+        key = tuple(sorted((k, v) for k, v in spec.items() if k != "name"))
+        groups.setdefault(key, []).append(spec)
+
+    def launch(group):
+        # returns the IDs started so far and the error that stopped the launch
+        launched = []
+        try:
+            launch_group(group, launched)
+        except Exception as e:
+            return launched, f"Launch failed: {type(e).__name__}: {e}"
+        return launched, None
+
+    def launch_group(group, launched):
+        spec = group[0]
+        print(f"Creating instances {[s['name'] for s in group]}.")
+        response = get_client("ec2").run_instances(
+            BlockDeviceMappings=[
+                {
+                    "DeviceName": spec["device"],
+                    "Ebs": {
+                        "DeleteOnTermination": spec["delete_on_termination"],
+                        "VolumeSize": spec["disk_size"],
+                        "VolumeType": "gp2",
+                    },
+                }
+            ],
+            ImageId=spec["image_id"],
+            InstanceType=spec["instance_type"],
+            MaxCount=len(group),
+            MinCount=len(group),
+            Monitoring={"Enabled": False},
+            Placement={"AvailabilityZone": spec["zone"]},
+            KeyName=spec["key_name"],
+            SecurityGroupIds=[spec["security_group_id"]],
+            DisableApiTermination=spec["termination_protection"],
+        )
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in run_instances() response: {response}"
+        # names differ per instance, so they are tagged after the launch
+        launched.extend(i["InstanceId"] for i in response["Instances"])
+        for s, instance_id in zip(group, launched):
+            get_client("ec2").create_tags(
+                Resources=[instance_id], Tags=[{"Key": "Name", "Value": s["name"]}]
+            )
+
+    with ContextExecutor(max_workers=MAX_WORKERS) as executor:
+        outcomes = list(executor.map(launch, groups.values()))
+    invalidate_inventory("instances", "volumes")
+    instance_ids = {}
+    launch_errors = {}
+    for group, (ids, error) in zip(groups.values(), outcomes):
+        for spec, instance_id in zip(group, ids):
+            instance_ids[spec["name"]] = instance_id
+        if error is not None:
+            for spec in group:
+                launch_errors[spec["name"]] = error
+
+    # instances of a failed group are left alone, so they are not waited on
+    waiting = [i for name, i in instance_ids.items() if name not in launch_errors]
+    failures = {}
+    if waiting:
+        wait_for_instances(waiting, state="running", timeout=timeout, failures=failures)
+    instances = {i["instance_id"]: i for i in fetch_instances(instance_ids=waiting)}
+    results = []
+    for name in names:
+        instance_id = instance_ids.get(name)
+        error = launch_errors.get(name) or failures.get(instance_id)
+        results.append(
+            {
+                "name": name,
+                "instance_id": instance_id,
+                "instance": instances.get(instance_id) if error is None else None,
+                "error": error,
+            }
+        )
+    created = sum(r["error"] is None for r in results)
+    print(f"Created {created} of {len(results)} instances.")
+    return results
+
+
+def terminate_instances(instance_ids, timeout=300):
+    # terminates many instances with one call and waits on them together.
+    # Returns a result per instance ID; instances that are protected or
+    # unknown are reported as errors and left alone.
+    instances = {
+        i["instance_id"]: i for i in fetch_instances(instance_ids=instance_ids)
+    }
+    results = {}
+    for instance_id in instance_ids:
+        instance = instances.get(instance_id)
+        results[instance_id] = {
+            "instance_id": instance_id,
+            "name": instance["name"] if instance else "-",
+            "state": instance["state"] if instance else "-",
+            "error": None,
+        }
+        if instance is None:
+            results[instance_id]["error"] = f"Instance {instance_id} not found."
+        elif instance["termination_protection"]:
+            results[instance_id][
+                "error"
+            ] = f"Instance {instance_id} has termination protection enabled."
+    to_terminate = [i for i in instance_ids if results[i]["error"] is None]
+    print(f"Terminating {len(to_terminate)} instances.")
+    for i in range(0, len(to_terminate), 1000):
+        response = get_client("ec2").terminate_instances(
+            InstanceIds=to_terminate[i : i + 1000]
+        )
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in terminate_instances() response: {response}"
+    invalidate_inventory("instances", "volumes")
+
+    failures = {}
+    wait_for_instances(
+        to_terminate, state="terminated", timeout=timeout, failures=failures
+    )
+    # volumes marked delete_on_termination must be gone
+    volume_ids = [
+        v["volume_id"]
+        for i in to_terminate
+        for v in instances[i]["volumes"]
+        if v["delete_on_termination"]
+    ]
+    remaining = {v["volume_id"] for v in fetch_volumes(volume_ids=volume_ids)}
+    for instance_id in to_terminate:
+        result = results[instance_id]
+        result["error"] = failures.get(instance_id)
+        if result["error"] is None:
+            result["state"] = "terminated"
+            for v in instances[instance_id]["volumes"]:
+                if v["volume_id"] in remaining:
+                    result["error"] = f"Volume {v['volume_id']} not deleted."
+    errors = len([r for r in results.values() if r["error"]])
+    print(f"Terminated {len(results) - errors} of {len(results)} instances.")
+    return results
+
+
+def get_bucket_encryption(name, region=None):
+    try:
+        response = get_client("s3", region).get_bucket_encryption(Bucket=name)
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in get_bucket_encryption() response: {response}"
+        response = response["ServerSideEncryptionConfiguration"]["Rules"][0]
+        return response["ApplyServerSideEncryptionByDefault"]["SSEAlgorithm"]
+    except Exception as e:
+        error = str(e)
+        if "not found" in error:
+            return "Not Found"
+        else:
+            return "Error" + str(e)
+
+
+def get_bucket_versioning(name, region=None):
+    try:
+        response = get_client("s3", region).get_bucket_versioning(Bucket=name)
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in get_bucket_versioning() response: {response}"
+        return response["Status"]
+    except Exception as e:
+        if str(e) == "'Status'":
+            return "Not Found"
+        else:
+            return "Error:" + str(e)
+
+
+def get_bucket_public_access_blocked(name, region=None):
+    try:
+        response = get_client("s3", region).get_public_access_block(Bucket=name)
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in get_public_access_block() response: {response}"
+        blocked = "Blocked"
+        for key in [
+            "BlockPublicAcls",
+            "BlockPublicPolicy",
+            "IgnorePublicAcls",
+            "RestrictPublicBuckets",
+        ]:
+            if response["PublicAccessBlockConfiguration"][key] != True:
+                blocked = "Not Blocked"
+        return blocked
+    except Exception as e:
+        error = str(e)
+        if "not found" in error:
+            return "Not Found"
+        else:
+            return "Error:" + str(e)
+
+
+def get_bucket_cors_allowed_origins(name, region=None):
+    try:
+        response = get_client("s3", region).get_bucket_cors(Bucket=name)
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in get_bucket_cors() response: {response}"
+        cors_rules = response["CORSRules"][0]
+        assert cors_rules["AllowedHeaders"] == ["*"]
+        assert cors_rules["AllowedMethods"] == ["GET"]
+        return cors_rules["AllowedOrigins"]
+    except Exception as e:
+        error = str(e)
+        if "does not exist" in error:
+            return []
+        else:
+            return "Error:" + str(e)
+
+
+def get_bucket_region(name, region=None):
+    try:
+        response = get_client("s3", region).get_bucket_location(Bucket=name)
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in get_bucket_location() response: {response}"
+        # us-east-1 has no location constraint, and "EU" is the old eu-west-1
+        location = response["LocationConstraint"] or "us-east-1"
+        return "eu-west-1" if location == "EU" else location
+    except Exception as e:
+        return "Error:" + str(e)
+
+
+# the per-bucket details list_buckets() can fetch
+BUCKET_FIELDS = {
+    "region": get_bucket_region,
+    "encryption": get_bucket_encryption,
+    "versioning": get_bucket_versioning,
+    "public_access_blocked": get_bucket_public_access_blocked,
+    "cors_allowed_origins": get_bucket_cors_allowed_origins,
+}
+
+# the details read when no fields are given; the region costs another call
+# per bucket, so it is only read when asked for
+DEFAULT_BUCKET_FIELDS = (
+    "encryption",
+    "versioning",
+    "public_access_blocked",
+    "cors_allowed_origins",
+)
+
+
+def list_buckets(name=None, fields=None, refresh=False, regions=None):
+    # bucket names are global, so regions only selects which buckets are listed
+    fields = tuple(DEFAULT_BUCKET_FIELDS if fields is None else fields)
+    for field in fields:
+        assert field in BUCKET_FIELDS, f"Unknown bucket field {field}."
+    if regions is not None:
+        regions = tuple(get_regions(regions))
+    if not refresh:
+        # a fresh full listing answers any query, and the default listing
+        # any query for fewer fields in every region
+        buckets = get_cached("buckets", (None, tuple(BUCKET_FIELDS), None))
+        if (
+            buckets is None
+            and regions is None
+            and set(fields) <= set(DEFAULT_BUCKET_FIELDS)
+        ):
+            buckets = get_cached("buckets", (None, DEFAULT_BUCKET_FIELDS, None))
+        if buckets is None:
+            buckets = get_cached("buckets", (name, fields, regions))
+        if buckets is not None:
+            if name:
+                buckets = [b for b in buckets if b["name"] == name]
+            if regions is not None:
+                buckets = [b for b in buckets if b["region"] in regions]
+            keys = ("name", "creation_date") + fields
+            if regions is not None:
+                keys += ("region",)
+            return [
+                Bucket.from_dict({k: v for k, v in b.items() if k in keys})
+                for b in buckets
+            ]
+    buckets = fetch_buckets(name=name, fields=fields, regions=regions)
+    put_cached("buckets", (name, fields, regions), buckets)
+    return buckets
+
+
+def fetch_buckets(name=None, fields=DEFAULT_BUCKET_FIELDS, regions=None):
+    return list(iter_buckets(name=name, fields=fields, regions=regions))
+
+
+def iter_buckets(name=None, fields=DEFAULT_BUCKET_FIELDS, regions=None, ordered=True):
+    # yields each bucket as soon as its details have been read; with
+    # ordered=False in the order they complete. Always asks AWS
+    # (list_buckets() is the cached version).
+    if name:
+        # only the buckets starting with the name, not every bucket
+        response = get_client("s3").list_buckets(Prefix=name)
+    else:
+        response = get_client("s3").list_buckets()
     assert (
         response["ResponseMetadata"]["HTTPStatusCode"] == 200
     ), f"Error in list_buckets() response: {response}"
@@ -331,79 +1782,57 @@ def list_buckets(name=None):
     ]
     if name:
         buckets = [b for b in buckets if b["name"] == name]
-    for b in buckets:
-        # get encryption
-        try:
-            response = s3.get_bucket_encryption(Bucket=b["name"])
-            assert (
-                response["ResponseMetadata"]["HTTPStatusCode"] == 200
-            ), f"Error in get_bucket_encryption() response: {response}"
-            response = response["ServerSideEncryptionConfiguration"]["Rules"][0]
-            response = response["ApplyServerSideEncryptionByDefault"]["SSEAlgorithm"]
-            b["encryption"] = response
-        except Exception as e:
-            error = str(e)
-            if "not found" in error:
-                b["encryption"] = "Not Found"
-            else:
-                b["encryption"] = "Error" + str(e)
-
-        # get versioning
-        try:
-            response = s3.get_bucket_versioning(Bucket=b["name"])
-            assert (
-                response["ResponseMetadata"]["HTTPStatusCode"] == 200
-            ), f"Error in get_bucket_versioning() response: {response}"
-            b["versioning"] = response["Status"]
-        except Exception as e:
-            if str(e) == "'Status'":
-                b["versioning"] = "Not Found"
-            else:
-                b["versioning"] = "Error:" + str(e)
-
-        # get public access blocking status
-        try:
-            response = s3.get_public_access_block(Bucket=b["name"])
-            assert (
-                response["ResponseMetadata"]["HTTPStatusCode"] == 200
-            ), f"Error in get_public_access_block() response: {response}"
-            b["public_access_blocked"] = "Blocked"
-            for key in [
-                "BlockPublicAcls",
-                "BlockPublicPolicy",
-                "IgnorePublicAcls",
-                "RestrictPublicBuckets",
-            ]:
-                if response["PublicAccessBlockConfiguration"][key] != True:
-                    b["public_access_blocked"] = "Not Blocked"
-        except Exception as e:
-            error = str(e)
-            if "not found" in error:
-                b["public_access_blocked"] = "Not Found"
-            else:
-                b["public_access_blocked"] = "Error:" + str(e)
+    yield from iter_bucket_details(
+        buckets, fields=fields, regions=regions, ordered=ordered
+    )
 
-        try:
-            response = s3.get_bucket_cors(Bucket=b["name"])
-            assert (
-                response["ResponseMetadata"]["HTTPStatusCode"] == 200
-            ), f"Error in get_bucket_cors() response: {response}"
-            cors_rules = response["CORSRules"][0]
-            assert cors_rules["AllowedHeaders"] == ["*"]
-            assert cors_rules["AllowedMethods"] == ["GET"]
-            b["cors_allowed_origins"] = cors_rules["AllowedOrigins"]
-        except Exception as e:
-            error = str(e)
-            if "does not exist" in error:
-                b["cors_allowed_origins"] = []
-            else:
-                b["cors_allowed_origins"] = "Error:" + str(e)
-    return buckets
 
+def iter_bucket_details(
+    buckets, fields=DEFAULT_BUCKET_FIELDS, regions=None, ordered=True
+):
+    # reads the details of buckets that have already been listed (records or
+    # dictionaries with a name and creation_date), without listing again
+    if regions is not None:
+        regions = tuple(get_regions(regions))
+
+    def details(listed):
+        # the region goes first, so the other details can be read from it
+        bucket = {"name": listed["name"], "creation_date": listed["creation_date"]}
+        region = None
+        if "region" in fields or regions is not None:
+            bucket["region"] = get_bucket_region(bucket["name"])
+            if regions is not None and bucket["region"] not in regions:
+                return None
+            if not bucket["region"].startswith("Error"):
+                region = bucket["region"]
+        # the other details are read concurrently, on a pool of their own so
+        # these tasks never wait on work queued behind them
+        probes = {
+            field: probe_executor.submit(BUCKET_FIELDS[field], bucket["name"], region)
+            for field in fields
+            if field != "region"
+        }
+        for field, future in probes.items():
+            bucket[field] = future.result()
+        return Bucket.from_dict(bucket)
 
-def list_bucket(name=None):
+    executor = ContextExecutor(max_workers=BUCKET_WORKERS)
+    probe_executor = ContextExecutor(max_workers=BUCKET_WORKERS)
+    try:
+        futures = [executor.submit(details, b) for b in buckets]
+        for future in futures if ordered else as_completed(futures):
+            bucket = future.result()
+            if bucket is not None:
+                yield bucket
+    finally:
+        # a caller that stops early does not wait for the remaining buckets
+        executor.shutdown(cancel_futures=True)
+        probe_executor.shutdown(cancel_futures=True)
+
+
+def list_bucket(name=None, fields=None, refresh=False):
     assert type(name) is str
-    buckets = list_buckets(name=name)
+    buckets = list_buckets(name=name, fields=fields, refresh=refresh)
     assert (
         len(buckets) == 1
     ), f"Bucket does not exist or specifies more than one bucket. (N={len(buckets)})"
@@ -412,7 +1841,8 @@ def list_bucket(name=None):
 
 def delete_bucket(name=None):
     assert type(name) is str
-    response = s3.delete_bucket(Bucket=name)
+    response = get_client("s3").delete_bucket(Bucket=name)
+    invalidate_inventory("buckets")
     assert response["ResponseMetadata"]["HTTPStatusCode"] in [
         200,
         204,
@@ -426,16 +1856,17 @@ def create_bucket(name=None, cors_allowed_origins=[]):
         assert type(item) is str
 
     # Create the bucket in the default region
-    response = s3.create_bucket(
+    response = get_client("s3").create_bucket(
         Bucket=name,
         CreateBucketConfiguration={"LocationConstraint": os.environ["AWS_REGION"]},
     )
+    invalidate_inventory("buckets")
     assert response["ResponseMetadata"]["HTTPStatusCode"] in [
         200,
         204,
     ], f"Error in create_bucket() response: {response}"
 
-    response = s3.put_bucket_encryption(
+    response = get_client("s3").put_bucket_encryption(
         Bucket=name,
         ServerSideEncryptionConfiguration={
             "Rules": [
@@ -450,7 +1881,7 @@ def create_bucket(name=None, cors_allowed_origins=[]):
         204,
     ], f"Error in put_bucket_encryption() response: {response}"
 
-    response = s3.put_bucket_versioning(
+    response = get_client("s3").put_bucket_versioning(
         Bucket=name, VersioningConfiguration={"Status": "Enabled"}
     )
     assert response["ResponseMetadata"]["HTTPStatusCode"] in [
@@ -458,7 +1889,7 @@ def create_bucket(name=None, cors_allowed_origins=[]):
         204,
     ], f"Error in put_bucket_versioning() response: {response}"
 
-    response = s3.put_public_access_block(
+    response = get_client("s3").put_public_access_block(
         Bucket=name,
         PublicAccessBlockConfiguration={
             "BlockPublicAcls": True,
@@ -472,7 +1903,7 @@ def create_bucket(name=None, cors_allowed_origins=[]):
         204,
     ], f"Error in put_public_access_block() response: {response}"
 
-    response = s3.put_bucket_cors(
+    response = get_client("s3").put_bucket_cors(
         Bucket=name,
         CORSConfiguration={
             "CORSRules": [
@@ -496,10 +1927,231 @@ def create_bucket(name=None, cors_allowed_origins=[]):
     return bucket
 
 
+def empty_bucket(name):
+    # deletes every version of every object, so the bucket can be deleted
+    paginator = get_client("s3").get_paginator("list_object_versions")
+    for response in paginator.paginate(Bucket=name):
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"Error in list_object_versions() response: {response}"
+        objects = [
+            {"Key": v["Key"], "VersionId": v["VersionId"]}
+            for v in response.get("Versions", []) + response.get("DeleteMarkers", [])
+        ]
+        if len(objects) > 0:
+            response = get_client("s3").delete_objects(
+                Bucket=name, Delete={"Objects": objects, "Quiet": True}
+            )
+            assert (
+                response["ResponseMetadata"]["HTTPStatusCode"] == 200
+            ), f"Error in delete_objects() response: {response}"
+
+
+# artifacts
+def transfer_config(part_size, workers):
+    from boto3.s3.transfer import TransferConfig
+
+    assert part_size >= 5 * 1024 * 1024, "S3 parts must be at least 5 MB."
+    assert (
+        0 < workers <= TRANSFER_WORKERS
+    ), f"workers must be between 1 and {TRANSFER_WORKERS} (the connection pool size)."
+    return TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=workers,
+        use_threads=True,
+    )
+
+
+def sha256_of(f):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_artifact(
+    source,
+    bucket,
+    key,
+    part_size=TRANSFER_PART_SIZE,
+    workers=TRANSFER_WORKERS,
+    region=None,
+    sha256=None,
+):
+    # source is a path or a binary file object; it is streamed part by part.
+    # S3 checks a SHA-256 checksum of every part, and for seekable sources the
+    # SHA-256 of the whole artifact is stored in the metadata for downloads
+    # (pass sha256 if it is already known, to skip reading the source twice)
+    f = open(source, "rb") if type(source) is str else source
+    try:
+        extra_args = {"ChecksumAlgorithm": "SHA256"}
+        size = None
+        if f.seekable():
+            start = f.tell()
+            if sha256 is None:
+                sha256 = sha256_of(f)
+            else:
+                f.seek(0, os.SEEK_END)
+            size = f.tell() - start
+            f.seek(start)
+            extra_args["Metadata"] = {"sha256": sha256}
+        started = time.time()
+        get_client("s3", region).upload_fileobj(
+            f,
+            bucket,
+            key,
+            ExtraArgs=extra_args,
+            Config=transfer_config(part_size, workers),
+        )
+    finally:
+        if type(source) is str:
+            f.close()
+    seconds = time.time() - started
+    if size is not None:
+        print(
+            f"Uploaded {size / 1e6:.1f} MB to s3://{bucket}/{key} in {seconds:.1f} sec. "
+            f"({size / 1e6 / max(seconds, 1e-6):.1f} MB/sec.)"
+        )
+    return {"bucket": bucket, "key": key, "size": size, "sha256": sha256}
+
+
+def download_artifact(
+    bucket,
+    key,
+    target,
+    part_size=TRANSFER_PART_SIZE,
+    workers=TRANSFER_WORKERS,
+    region=None,
+    sha256=None,
+):
+    # target is a path or a binary file object; parts are fetched with
+    # concurrent ranged GETs. A path is only replaced once the SHA-256 (the
+    # one given, or else the one from upload_artifact()) matches the data.
+    response = get_client("s3", region).head_object(Bucket=bucket, Key=key)
+    assert (
+        response["ResponseMetadata"]["HTTPStatusCode"] == 200
+    ), f"Error in head_object() response: {response}"
+    expected = sha256 or response.get("Metadata", {}).get("sha256")
+    size = response["ContentLength"]
+    # pin the version that was checked, in case the key is overwritten meanwhile
+    extra_args = {"ChecksumMode": "ENABLED"}
+    if response.get("VersionId") not in [None, "null"]:
+        extra_args["VersionId"] = response["VersionId"]
+    config = transfer_config(part_size, workers)
+    started = time.time()
+    if type(target) is str:
+        partial = target + ".part"
+        try:
+            with open(partial, "wb") as f:
+                get_client("s3", region).download_fileobj(
+                    bucket, key, f, ExtraArgs=extra_args, Config=config
+                )
+            if expected:
+                with open(partial, "rb") as f:
+                    sha256 = sha256_of(f)
+                assert (
+                    sha256 == expected
+                ), f"Checksum mismatch for s3://{bucket}/{key}: {sha256} != {expected}."
+            os.replace(partial, target)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+    else:
+        start = target.tell() if target.seekable() else None
+        get_client("s3", region).download_fileobj(
+            bucket, key, target, ExtraArgs=extra_args, Config=config
+        )
+        # the data can only be checked if it can be read back
+        if expected and start is not None and target.readable():
+            target.seek(start)
+            sha256 = sha256_of(target)
+            assert (
+                sha256 == expected
+            ), f"Checksum mismatch for s3://{bucket}/{key}: {sha256} != {expected}."
+    seconds = time.time() - started
+    print(
+        f"Downloaded {size / 1e6:.1f} MB from s3://{bucket}/{key} in {seconds:.1f} sec. "
+        f"({size / 1e6 / max(seconds, 1e-6):.1f} MB/sec.)"
+    )
+    return {"bucket": bucket, "key": key, "size": size, "sha256": expected}
+
+
+# content-addressed artifact store
+def artifact_key(sha256):
+    return f"sha256/{sha256[:2]}/{sha256}"
+
+
+def artifact_exists(bucket, sha256, region=None):
+    import botocore.exceptions
+
+    try:
+        get_client("s3", region).head_object(Bucket=bucket, Key=artifact_key(sha256))
+        return True
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ["404", "NoSuchKey", "NotFound"]:
+            return False
+        raise
+
+
+def load_manifest(path=ARTIFACT_MANIFEST):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def record_artifact(name, entry, path=ARTIFACT_MANIFEST):
+    # rewrite the manifest atomically, so readers never see a partial file
+    with manifest_lock:
+        manifest = load_manifest(path)
+        manifest[name] = entry
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+
+def store_artifact(source, bucket, name=None, manifest=ARTIFACT_MANIFEST, region=None):
+    # stores a file (path) under its SHA-256 in a bucket made by create_bucket();
+    # content that is already there costs one HEAD request instead of an upload.
+    # The artifact is recorded in the local manifest under name (or the file name).
+    with open(source, "rb") as f:
+        sha256 = sha256_of(f)
+        size = f.tell()
+    key = artifact_key(sha256)
+    uploaded = not artifact_exists(bucket, sha256, region=region)
+    if uploaded:
+        upload_artifact(source, bucket, key, region=region, sha256=sha256)
+    else:
+        print(f"Artifact {sha256[:12]} is already in s3://{bucket}/{key}.")
+    entry = {
+        "bucket": bucket,
+        "key": key,
+        "sha256": sha256,
+        "size": size,
+        "stored": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    record_artifact(name or os.path.basename(source), entry, path=manifest)
+    return {**entry, "uploaded": uploaded}
+
+
+def fetch_artifact(name, target, manifest=ARTIFACT_MANIFEST, region=None):
+    # name is a manifest name or a SHA-256; the download is checked against
+    # the SHA-256 in the manifest
+    entries = load_manifest(manifest)
+    entry = entries.get(name)
+    if entry is None:
+        entry = next((e for e in entries.values() if e["sha256"] == name), None)
+    assert entry is not None, f"Artifact {name} is not in the manifest {manifest}."
+    download_artifact(
+        entry["bucket"], entry["key"], target, region=region, sha256=entry["sha256"]
+    )
+    return entry
+
+
 # test libraries
-import datetime, random
+import io, subprocess, sys
 from pprint import pprint
-import botocore.client
 
 
 # test functions
@@ -507,7 +2159,168 @@ def test_initialization():
     print("test_initializion")
     # Below, normal class assertion (e,g "is botocore.client.EC2") doesn't work
     # See https://stackoverflow.com/questions/72221091/im-trying-to-type-annotate-around-boto3-but-module-botocore-client-has-no-at
-    assert str(type(ec2)) == "<class 'botocore.client.EC2'>"
+    assert str(type(get_client("ec2"))) == "<class 'botocore.client.EC2'>"
+    assert get_client("ec2") is get_client("ec2")
+
+
+def test_import_time():
+    print("test_import_time")
+    # importing infra must not need AWS credentials or build any clients
+    env = {k: v for k, v in os.environ.items() if not k.startswith("AWS_")}
+    code = "import sys, time; t = time.time(); import infra; "
+    code += "print(time.time() - t, 'boto3' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, boto3_imported = result.stdout.split()
+    print(f"import infra took {float(seconds):.3f} sec.")
+    assert boto3_imported == "False"
+    assert float(seconds) < 0.1
+
+
+def test_metrics():
+    print("test_metrics")
+    invalidate_inventory()
+    with metrics() as m:
+        instances = list_instances()
+        with metrics() as inner:
+            list_volumes()
+        # a failing call is counted as an error
+        try:
+            get_client("ec2").describe_instances(InstanceIds=["i-00000000000000000"])
+        except Exception:
+            pass
+    # nothing is recorded outside the scope
+    list_volumes(refresh=True)
+    calls = m.calls()
+    print(m.report())
+    assert calls["ec2.DescribeInstances"] == 2
+    assert calls["ec2.DescribeInstanceAttribute"] == len(instances)
+    assert calls["ec2.DescribeVolumes"] == 1
+    assert inner.calls() == {"ec2.DescribeVolumes": 1}
+    assert m.operations["ec2.DescribeInstances"]["errors"] == 1
+    entry = m.operations["ec2.DescribeInstanceStatus"]
+    assert sum(entry["buckets"]) == entry["calls"]
+    exported = json.loads(m.to_json())
+    assert exported["ec2.DescribeVolumes"]["calls"] == 1
+    assert exported["ec2.DescribeVolumes"]["buckets"]["+Inf"] <= 1
+    text = m.to_prometheus()
+    line = 'infra_aws_calls_total{service="ec2",operation="DescribeVolumes"} 1'
+    assert line in text.splitlines()
+    assert (
+        'infra_aws_call_seconds_bucket{service="ec2",operation="DescribeVolumes",le="+Inf"} 1'
+        in text
+    )
+
+    # scoped collectors in parallel threads each see their own calls only,
+    # including those made on the pools they use
+    def scoped(function):
+        with metrics(scoped=True) as m:
+            function()
+        return m.calls()
+
+    with ContextExecutor(max_workers=2) as executor:
+        volume_calls, instance_calls = executor.map(
+            scoped,
+            [
+                lambda: list_volumes(refresh=True),
+                lambda: list_instances(refresh=True),
+            ],
+        )
+    assert volume_calls == {"ec2.DescribeVolumes": 1}
+    assert "ec2.DescribeVolumes" not in instance_calls
+    assert instance_calls["ec2.DescribeInstanceAttribute"] == len(instances)
+
+
+def test_rate_limiting():
+    print("test_rate_limiting")
+    from botocore.awsrequest import AWSResponse
+    import botocore.exceptions
+
+    # a bucket of 5 tokens refilled at 50/sec hands out 30 tokens in ~0.5 sec
+    bucket = TokenBucket(rate=50, burst=5)
+    start = time.time()
+    for i in range(30):
+        bucket.acquire()
+    assert 0.4 < time.time() - start < 1.0
+    bucket.throttled()
+    assert bucket.rate == 25
+    for i in range(100):
+        bucket.succeeded()
+    assert bucket.rate == 50
+    budget = RetryBudget(capacity=2, refund=0.5)
+    assert budget.spend() and budget.spend() and not budget.spend()
+    budget.earn()
+    budget.earn()
+    assert budget.spend()
+
+    # answer describe_regions with throttling errors, without sending it
+    body = (
+        b'<?xml version="1.0"?><Response><Errors><Error>'
+        b"<Code>RequestLimitExceeded</Code><Message>Request limit exceeded.</Message>"
+        b"</Error></Errors><RequestID>test</RequestID></Response>"
+    )
+    throttles = {"count": 0, "left": 2}
+
+    def throttle(request, **kwargs):
+        if throttles["left"] > 0:
+            throttles["count"] += 1
+            throttles["left"] -= 1
+            response = AWSResponse(request.url, 503, {}, None)
+            response._content = body
+            return response
+
+    client = get_client("ec2")
+    limiter = get_limiter("ec2", client.meta.region_name, "read")
+    rate = limiter.rate
+    client.meta.events.register_first("before-send.ec2.DescribeRegions", throttle)
+    try:
+        # two throttled attempts are retried, and the limiter slows down
+        with metrics() as m:
+            client.describe_regions()
+        assert m.operations["ec2.DescribeRegions"]["throttles"] == 2
+        assert limiter.rate <= rate / 4 + 1
+        # with the budget spent, a throttled call fails at the first attempt
+        tokens = retry_budget.tokens
+        retry_budget.tokens = 0
+        throttles["left"] = 5
+        throttles["count"] = 0
+        try:
+            client.describe_regions()
+            assert False, "Throttled call succeeded."
+        except botocore.exceptions.ClientError as e:
+            assert e.response["Error"]["Code"] == "RequestLimitExceeded"
+        assert throttles["count"] == 1
+        retry_budget.tokens = tokens
+    finally:
+        client.meta.events.unregister("before-send.ec2.DescribeRegions", throttle)
+        limiter.rate = rate
+
+
+def test_wait_until():
+    print("test_wait_until")
+    calls = []
+
+    def probe():
+        calls.append(time.time())
+        return len(calls) == 3
+
+    assert wait_until(probe, timeout=10, delay=0.1, max_delay=0.2) == 3
+    # backoff delays stay between half and all of 0.1 then 0.2 seconds
+    assert 0.05 <= calls[1] - calls[0] <= 0.2
+    assert 0.1 <= calls[2] - calls[1] <= 0.3
+    start = time.time()
+    try:
+        wait_until(lambda: False, timeout=0.5, delay=0.1)
+        assert False, "wait_until() did not time out."
+    except TimeoutError:
+        pass
+    assert time.time() - start < 1.0
 
 
 def test_list_instances():
@@ -516,7 +2329,7 @@ def test_list_instances():
     assert type(instances) is list
     assert len(instances) > 0
     for instance in instances:
-        assert type(instance) is dict
+        assert type(instance) is Instance
         for key in [
             "image_id",
             "instance_id",
@@ -568,13 +2381,107 @@ def test_list_instances():
     assert instances[0]["instance_id"] == random_instance["instance_id"]
 
 
+def test_inventory_cache():
+    print("test_inventory_cache")
+    invalidate_inventory()
+    start = time.time()
+    instances = list_instances()
+    first = time.time() - start
+    start = time.time()
+    assert list_instances() == instances
+    second = time.time() - start
+    assert second < first / 10, f"Cached listing took {second} sec vs {first} sec."
+    # filtered queries are answered from the cached full listing
+    instance = list_instance(instance_id=instances[0]["instance_id"])
+    assert instance == instances[0]
+    # callers can't corrupt the cache, because records are read-only
+    try:
+        instance.name = "changed"
+        assert False, "Instance records can be modified."
+    except AttributeError:
+        pass
+    assert list_instances()[0]["name"] == instances[0]["name"]
+    # snapshots survive a save/load round trip
+    path = f"/tmp/test-inventory-{random.randint(10000000, 99999999)}.pickle"
+    save_inventory(path)
+    invalidate_inventory()
+    assert len(inventory_cache) == 0
+    load_inventory(path)
+    os.remove(path)
+    assert list_instances() == instances
+    invalidate_inventory("instances")
+    assert all(key[0] != "instances" for key in inventory_cache)
+
+
+def test_list_regions():
+    print("test_list_regions")
+    region = os.environ["AWS_REGION"]
+    regions = get_regions("all")
+    assert region in regions
+    instances = list_instances(refresh=True)
+    assert all(i["region"] == region for i in instances)
+    start = time.time()
+    swept = list_instances(refresh=True, regions="all")
+    seconds = time.time() - start
+    print(
+        f"Listed {len(swept)} instances in {len(regions)} regions in {seconds:.1f} sec."
+    )
+    assert {i["region"] for i in swept} <= set(regions)
+    ids = {i["instance_id"] for i in swept if i["region"] == region}
+    assert ids == {i["instance_id"] for i in instances}
+    # a sweep is served from the per-region cache entries it filled
+    assert list_instances(regions=[region]) == instances
+    volumes = list_volumes(refresh=True, regions="all")
+    assert {v["region"] for v in volumes} <= set(regions)
+    buckets = list_buckets(fields=[], refresh=True, regions=[region])
+    assert all(b["region"] == region for b in buckets)
+    assert {b["name"] for b in buckets} <= {b["name"] for b in list_buckets()}
+
+
+def test_records():
+    print("test_records")
+    instance = list_instances()[0]
+    # slotted records carry no per-object __dict__
+    assert not hasattr(instance, "__dict__")
+    record = instance.to_dict()
+    assert type(record) is dict
+    assert list(record) == list(Instance.KEYS)
+    # iterating a record gives its keys, like iterating a dict
+    assert list(instance) == list(Instance.KEYS)
+    assert len(instance) == len(record)
+    assert dict(instance) == record
+    for key, value in record.items():
+        assert instance[key] == value
+        assert instance.get(key) == value
+    assert instance.get("missing") is None
+    try:
+        instance["missing"]
+        assert False, "Unknown keys are accepted."
+    except KeyError:
+        pass
+    assert pickle.loads(pickle.dumps(instance)) == instance
+    volume = list_volumes()[0]
+    assert volume.to_dict()["attachments"] == volume.attachments
+    bucket = Bucket.from_dict(
+        {"name": "b", "creation_date": instance.launch_time, "versioning": "Enabled"}
+    )
+    assert list(bucket.keys()) == ["name", "creation_date", "versioning"]
+    assert set(bucket) == {"name", "creation_date", "versioning"}
+    assert len(bucket) == 3
+    assert "region" not in bucket
+    bucket = Bucket.from_dict(
+        {"name": "b", "creation_date": None, "cors_allowed_origins": ["*"]}
+    )
+    assert bucket["cors_allowed_origins"] == ["*"]
+
+
 def test_list_volumes():
     print("test_list_volumes")
     volumes = list_volumes()
     assert type(volumes) is list
     assert len(volumes) > 0
     for volume in volumes:
-        assert type(volume) is dict
+        assert type(volume) is Volume
         for key in [
             "attachments",
             "create_time",
@@ -608,6 +2515,69 @@ def test_list_volumes():
     assert volumes[0]["volume_id"] == random_volume["volume_id"]
 
 
+def test_iter_listings():
+    print("test_iter_listings")
+    instances = fetch_instances()
+    iterator = iter_instances()
+    assert next(iterator) == instances[0]
+    iterator.close()
+    assert list(iter_instances()) == instances
+    unordered = list(iter_instances(ordered=False))
+    assert sorted(i["instance_id"] for i in unordered) == sorted(
+        i["instance_id"] for i in instances
+    )
+    name = instances[0]["name"]
+    prefixed = list(iter_instances(name_prefix=name[:3]))
+    assert 0 < len(prefixed) <= len(instances)
+    assert all(i["name"].startswith(name[:3]) for i in prefixed)
+    assert [i["name"] for i in iter_instances(name=name)] == [
+        i["name"] for i in instances if i["name"] == name
+    ]
+    assert list(iter_volumes()) == fetch_volumes()
+    buckets = fetch_buckets()
+    assert list(iter_buckets()) == buckets
+    assert sorted(b["name"] for b in iter_buckets(ordered=False)) == sorted(
+        b["name"] for b in buckets
+    )
+
+
+def test_delete_volumes():
+    print("test_delete_volumes")
+    random_token = str(random.randint(10000000, 99999999))
+    volume_ids = []
+    for n in range(3):
+        response = get_client("ec2").create_volume(
+            AvailabilityZone=os.environ["AWS_REGION"] + "c",
+            Size=1,
+            VolumeType="gp2",
+            TagSpecifications=[
+                {
+                    "ResourceType": "volume",
+                    "Tags": [{"Key": "Name", "Value": f"test-{random_token}-{n}"}],
+                }
+            ],
+        )
+        volume_ids.append(response["VolumeId"])
+    wait_until(
+        lambda: all(
+            v["state"] == "available" for v in fetch_volumes(volume_ids=volume_ids)
+        ),
+        timeout=60,
+    )
+    orphaned = {v["volume_id"] for v in find_orphaned_volumes(min_age=0)}
+    assert set(volume_ids) <= orphaned
+    # just created, so too young to count as orphaned by default
+    assert len(set(volume_ids) & {v["volume_id"] for v in find_orphaned_volumes()}) == 0
+    attached = [v["volume_id"] for v in fetch_volumes() if v["attachments"]]
+    assert len(set(attached) & orphaned) == 0
+    results = delete_volumes(volume_ids + attached[:1], timeout=60)
+    for volume_id in volume_ids:
+        assert results[volume_id]["error"] is None
+    if attached:
+        assert results[attached[0]]["error"] is not None
+    assert fetch_volumes(volume_ids=volume_ids) == []
+
+
 def test_create_and_terminate_instance():
     print("test_create_and_terminate_instance")
     # create a random name
@@ -686,6 +2656,54 @@ def test_create_and_terminate_instance():
     assert len(list_volumes(volume_id=volume_id)) == 0
 
 
+def test_create_and_terminate_instances():
+    print("test_create_and_terminate_instances")
+    token = str(random.randint(10000000, 99999999))
+    names = [f"test-{token}-{n}-instance" for n in range(3)]
+    spec = {
+        "instance_type": "t2.micro",
+        "image_id": "ami-097a2df4ac947655f",
+        "security_group_id": "sg-0364d234122df6a66",
+        "key_name": "visionair3d-ec2",
+        "disk_size": 29,
+        "termination_protection": False,
+    }
+    # the first two specs share a launch, the third has its own and the
+    # fourth fails to launch
+    specs = [
+        {**spec, "name": names[0]},
+        {**spec, "name": names[1]},
+        {**spec, "name": names[2], "disk_size": 30},
+        {**spec, "name": f"test-{token}-3-instance", "zone": "us-east-2z"},
+    ]
+    results = create_instances(specs)
+    assert [r["name"] for r in results] == [s["name"] for s in specs]
+    failed = results.pop()
+    assert "Launch failed" in failed["error"], failed
+    assert failed["instance_id"] is None and failed["instance"] is None
+    for result in results:
+        assert result["error"] is None, result["error"]
+        instance = result["instance"]
+        assert instance["name"] == result["name"]
+        assert instance["state"] == "running"
+        assert instance["termination_protection"] == False
+        assert len(instance["volumes"]) == 1
+    try:
+        create_instances([{**spec, "name": names[1]}])
+        assert False, "Duplicate name was not detected."
+    except AssertionError as e:
+        assert "already exists" in str(e), e
+
+    instance_ids = [r["instance_id"] for r in results]
+    results = terminate_instances(instance_ids + ["i-00000000000000000"])
+    for instance_id in instance_ids:
+        assert results[instance_id]["error"] is None, results[instance_id]["error"]
+        assert results[instance_id]["state"] == "terminated"
+    assert "not found" in results["i-00000000000000000"]["error"]
+    for instance in fetch_instances(instance_ids=instance_ids):
+        assert instance["state"] == "terminated"
+
+
 def test_list_buckets():
     print("test_list_buckets")
     buckets = list_buckets()
@@ -704,6 +2722,10 @@ def test_list_buckets():
         assert type(b["cors_allowed_origins"]) is list
         for origin in b["cors_allowed_origins"]:
             assert type(origin) is str
+    if len(buckets) > 0:
+        bucket = list_bucket(buckets[0]["name"], fields=["versioning"], refresh=True)
+        assert set(bucket) == {"name", "creation_date", "versioning"}
+        assert bucket["versioning"] == buckets[0]["versioning"]
 
 
 def test_delete_buckets():
@@ -741,12 +2763,125 @@ def test_create_and_delete_buckets():
     print([names])
 
 
+def test_upload_and_download_artifact():
+    print("test_upload_and_download_artifact")
+    name = f"va3d-test-x-{str(random.randint(10000000,99999999))}-bucket"
+    create_bucket(name=name, cors_allowed_origins=["http://localhost:8081"])
+    path = f"/tmp/test-artifact-{random.randint(10000000, 99999999)}"
+    try:
+        # three parts of 5 MB, the last one short
+        data = os.urandom(12 * 1024 * 1024)
+        with open(path, "wb") as f:
+            f.write(data)
+        part_size = 5 * 1024 * 1024
+        result = upload_artifact(path, name, "artifact.bin", part_size, workers=4)
+        assert result["size"] == len(data)
+        assert result["sha256"] == hashlib.sha256(data).hexdigest()
+        os.remove(path)
+        download_artifact(name, "artifact.bin", path, part_size, workers=4)
+        with open(path, "rb") as f:
+            assert f.read() == data
+        buffer = io.BytesIO()
+        download_artifact(name, "artifact.bin", buffer, part_size, workers=4)
+        assert buffer.getvalue() == data
+
+        # file objects work too, and a corrupted artifact is refused
+        upload_artifact(io.BytesIO(b"good"), name, "small.bin")
+        get_client("s3").put_object(
+            Bucket=name,
+            Key="small.bin",
+            Body=b"evil",
+            Metadata={"sha256": hashlib.sha256(b"good").hexdigest()},
+        )
+        try:
+            download_artifact(name, "small.bin", path)
+            assert False, "Corrupted artifact was accepted."
+        except AssertionError as e:
+            assert "Checksum mismatch" in str(e)
+        with open(path, "rb") as f:
+            assert f.read() == data, "Corrupted download replaced the file."
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        empty_bucket(name)
+        delete_bucket(name)
+
+
+def test_artifact_store():
+    print("test_artifact_store")
+    # runs against a local S3 stand-in (such as moto_server) when
+    # AWS_ENDPOINT_URL is set, since boto3 clients pick up that variable
+    name = f"va3d-test-x-{str(random.randint(10000000,99999999))}-bucket"
+    create_bucket(name=name, cors_allowed_origins=["http://localhost:8081"])
+    token = random.randint(10000000, 99999999)
+    path = f"/tmp/test-artifact-{token}.tar"
+    manifest = f"/tmp/test-artifacts-{token}.json"
+    try:
+        data = os.urandom(1024 * 1024)
+        with open(path, "wb") as f:
+            f.write(data)
+        first = store_artifact(path, name, name="build", manifest=manifest)
+        assert first["uploaded"]
+        assert first["sha256"] == hashlib.sha256(data).hexdigest()
+        assert artifact_exists(name, first["sha256"])
+        # an identical build is one HEAD request
+        with metrics() as m:
+            second = store_artifact(path, name, name="build-2", manifest=manifest)
+        assert not second["uploaded"]
+        assert second["key"] == first["key"]
+        assert m.calls() == {"s3.HeadObject": 1}, f"Unexpected calls {m.calls()}."
+        entries = load_manifest(manifest)
+        assert set(entries) == {"build", "build-2"}
+        os.remove(path)
+        fetch_artifact("build-2", path, manifest=manifest)
+        with open(path, "rb") as f:
+            assert f.read() == data
+        # by digest, into a file object
+        buffer = io.BytesIO()
+        assert (
+            fetch_artifact(first["sha256"], buffer, manifest=manifest)
+            == entries["build"]
+        )
+        assert buffer.getvalue() == data
+        # a manifest entry that does not match the data leaves the file alone
+        record_artifact(
+            "wrong",
+            {**entries["build"], "sha256": hashlib.sha256(b"other").hexdigest()},
+            path=manifest,
+        )
+        try:
+            fetch_artifact("wrong", path + ".wrong", manifest=manifest)
+            assert False, "A checksum mismatch is accepted."
+        except AssertionError as e:
+            assert "Checksum mismatch" in str(e), e
+        assert not os.path.exists(path + ".wrong")
+        assert not artifact_exists(name, hashlib.sha256(b"missing").hexdigest())
+    finally:
+        for p in [path, manifest]:
+            if os.path.exists(p):
+                os.remove(p)
+        empty_bucket(name)
+        delete_bucket(name)
+
+
 if __name__ == "__main__":
     test_initialization()
+    test_import_time()
+    test_metrics()
+    test_rate_limiting()
+    test_wait_until()
     test_list_instances()
+    test_inventory_cache()
+    test_list_regions()
+    test_records()
     test_list_volumes()
+    test_iter_listings()
+    test_delete_volumes()
     test_create_and_terminate_instance()
+    test_create_and_terminate_instances()
     test_list_buckets()
     test_create_and_delete_buckets()
+    test_upload_and_download_artifact()
+    test_artifact_store()
     test_delete_buckets()
     print("done.")
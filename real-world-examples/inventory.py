@@ -0,0 +1,465 @@
+# inventory.py -- local SQLite index of instances, volumes and buckets
+
+# libraries
+import os, time, datetime
+import pickle, sqlite3, threading
+from concurrent.futures import ThreadPoolExecutor
+import infra
+
+# global variables
+INVENTORY_PATH = os.environ.get(
+    "INFRA_INVENTORY", os.path.join(os.path.expanduser("~"), ".infra-inventory.db")
+)
+
+# instances changed in place through infra since they were last read, e.g.
+# by set_termination_protection(); refresh_instances() reads them again
+changed_instances = set()
+changed_lock = threading.Lock()
+
+
+def mark_changed(kind, ids):
+    if kind == "instances":
+        with changed_lock:
+            changed_instances.update(ids)
+
+
+infra.change_hooks.append(mark_changed)
+
+# each table keeps the full record (pickled, like infra.save_inventory) next
+# to the columns that queries filter on
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    instance_id TEXT PRIMARY KEY,
+    region TEXT NOT NULL,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    launch_time TEXT NOT NULL,
+    termination_protection INTEGER NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS instances_region ON instances (region);
+CREATE INDEX IF NOT EXISTS instances_name ON instances (name);
+CREATE INDEX IF NOT EXISTS instances_state ON instances (state);
+CREATE INDEX IF NOT EXISTS instances_launch_time ON instances (launch_time);
+CREATE TABLE IF NOT EXISTS volumes (
+    volume_id TEXT PRIMARY KEY,
+    region TEXT NOT NULL,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    create_time TEXT NOT NULL,
+    attached INTEGER NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS volumes_region ON volumes (region);
+CREATE INDEX IF NOT EXISTS volumes_state ON volumes (state);
+CREATE INDEX IF NOT EXISTS volumes_attached ON volumes (attached);
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    region TEXT NOT NULL,
+    creation_date TEXT NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_region ON buckets (region);
+CREATE TABLE IF NOT EXISTS refreshes (
+    kind TEXT NOT NULL,
+    region TEXT NOT NULL,
+    refreshed REAL NOT NULL,
+    PRIMARY KEY (kind, region)
+);
+"""
+
+
+def open_inventory(path=INVENTORY_PATH):
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    # reports can read while a refresh is writing
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def timestamp(value):
+    # UTC ISO strings sort in time order, so range queries can use an index
+    return value.astimezone(datetime.timezone.utc).isoformat()
+
+
+def mark_refreshed(db, kind, region):
+    db.execute(
+        "INSERT OR REPLACE INTO refreshes (kind, region, refreshed) VALUES (?, ?, ?)",
+        (kind, region, time.time()),
+    )
+
+
+def inventory_age(db, kind, region=None):
+    # seconds since the kind was last refreshed (in the region), None if never
+    region = "global" if kind == "buckets" else region or os.environ["AWS_REGION"]
+    row = db.execute(
+        "SELECT refreshed FROM refreshes WHERE kind = ? AND region = ?",
+        (kind, region),
+    ).fetchone()
+    return None if row is None else time.time() - row["refreshed"]
+
+
+# refresh
+def refresh_instances(db, regions=None, full=False):
+    # the describe calls are always made, so names, tags and states are
+    # always current. Termination protection (one call per instance) is only
+    # read again for instances that are new, whose state or launch time
+    # changed, or that were changed through infra in this process; a change
+    # made elsewhere (another process, the console) is only seen with
+    # full=True, which reads it for every instance
+    with changed_lock:
+        marked = set(changed_instances)
+    known = {
+        row["instance_id"]: row
+        for row in db.execute(
+            "SELECT instance_id, state, launch_time, termination_protection FROM instances"
+        )
+    }
+
+    def fetch(region):
+        results = []
+        for page in infra.describe_instance_pages(region=region):
+            results.extend(page)
+        changed = []
+        for result in results:
+            row = known.get(result["InstanceId"])
+            if (
+                full
+                or row is None
+                or result["InstanceId"] in marked
+                or row["state"] != result["State"]["Name"]
+                or row["launch_time"] != timestamp(result["LaunchTime"])
+            ):
+                changed.append(result["InstanceId"])
+        protection = infra.get_termination_protection(changed, region=region)
+        running = [r["InstanceId"] for r in results if r["State"]["Name"] == "running"]
+        statuses = infra.get_instance_statuses(running, region=region)
+        instances = []
+        for result in results:
+            instance_id = result["InstanceId"]
+            if instance_id in protection:
+                termination_protection = protection[instance_id]
+            else:
+                termination_protection = bool(
+                    known[instance_id]["termination_protection"]
+                )
+            instances.append(
+                infra.instance_from_result(
+                    result,
+                    region=region,
+                    termination_protection=termination_protection,
+                    status=statuses.get(instance_id),
+                )
+            )
+        return region, instances, len(changed)
+
+    regions = infra.get_regions(regions)
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        fetched = list(executor.map(fetch, regions))
+    # marks made while this refresh was reading, or for instances in other
+    # regions, are kept for the next one
+    read = {i["instance_id"] for _, instances, _ in fetched for i in instances}
+    with changed_lock:
+        changed_instances.difference_update(marked & read)
+
+    counts = {"instances": 0, "changed": 0, "removed": 0}
+    with db:
+        for region, instances, changed in fetched:
+            ids = {i["instance_id"] for i in instances}
+            stale = [
+                row["instance_id"]
+                for row in db.execute(
+                    "SELECT instance_id FROM instances WHERE region = ?", (region,)
+                )
+                if row["instance_id"] not in ids
+            ]
+            db.executemany(
+                "DELETE FROM instances WHERE instance_id = ?",
+                [(instance_id,) for instance_id in stale],
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        i["instance_id"],
+                        region,
+                        i["name"],
+                        i["state"],
+                        timestamp(i["launch_time"]),
+                        int(i["termination_protection"]),
+                        pickle.dumps(i),
+                    )
+                    for i in instances
+                ],
+            )
+            mark_refreshed(db, "instances", region)
+            counts["instances"] += len(instances)
+            counts["changed"] += changed
+            counts["removed"] += len(stale)
+    print(
+        f"Refreshed {counts['instances']} instances "
+        f"({counts['changed']} changed, {counts['removed']} removed)."
+    )
+    return counts
+
+
+def refresh_volumes(db, regions=None):
+    # volumes need no per-volume calls, so each region is simply replaced
+    known = {
+        row["volume_id"]: (row["state"], row["attached"])
+        for row in db.execute("SELECT volume_id, state, attached FROM volumes")
+    }
+    regions = infra.get_regions(regions)
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        fetched = list(
+            executor.map(lambda r: (r, infra.fetch_volumes(region=r)), regions)
+        )
+
+    counts = {"volumes": 0, "changed": 0, "removed": 0}
+    with db:
+        for region, volumes in fetched:
+            ids = {v["volume_id"] for v in volumes}
+            stale = [
+                row["volume_id"]
+                for row in db.execute(
+                    "SELECT volume_id FROM volumes WHERE region = ?", (region,)
+                )
+                if row["volume_id"] not in ids
+            ]
+            db.executemany(
+                "DELETE FROM volumes WHERE volume_id = ?",
+                [(volume_id,) for volume_id in stale],
+            )
+            rows = []
+            for v in volumes:
+                attached = int(len(v["attachments"]) > 0)
+                if known.get(v["volume_id"]) != (v["state"], attached):
+                    counts["changed"] += 1
+                rows.append(
+                    (
+                        v["volume_id"],
+                        region,
+                        v["name"],
+                        v["state"],
+                        timestamp(v["create_time"]),
+                        attached,
+                        pickle.dumps(v),
+                    )
+                )
+            db.executemany(
+                "INSERT OR REPLACE INTO volumes VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            mark_refreshed(db, "volumes", region)
+            counts["volumes"] += len(volumes)
+            counts["removed"] += len(stale)
+    print(
+        f"Refreshed {counts['volumes']} volumes "
+        f"({counts['changed']} changed, {counts['removed']} removed)."
+    )
+    return counts
+
+
+def refresh_buckets(db, full=False):
+    # bucket names are global; the details (five calls per bucket) are only
+    # read for buckets that are new or were re-created since the last refresh
+    known = {
+        row["name"]: row["creation_date"]
+        for row in db.execute("SELECT name, creation_date FROM buckets")
+    }
+    listed = infra.fetch_buckets(fields=())
+    changed = [
+        b
+        for b in listed
+        if full or known.get(b["name"]) != timestamp(b["creation_date"])
+    ]
+    details = list(
+        infra.iter_bucket_details(changed, fields=tuple(infra.BUCKET_FIELDS))
+    )
+
+    names = {b["name"] for b in listed}
+    stale = [name for name in known if name not in names]
+    with db:
+        db.executemany(
+            "DELETE FROM buckets WHERE name = ?", [(name,) for name in stale]
+        )
+        db.executemany(
+            "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+            [
+                (
+                    b["name"],
+                    b["region"],
+                    timestamp(b["creation_date"]),
+                    pickle.dumps(b),
+                )
+                for b in details
+            ],
+        )
+        mark_refreshed(db, "buckets", "global")
+    counts = {"buckets": len(listed), "changed": len(details), "removed": len(stale)}
+    print(
+        f"Refreshed {counts['buckets']} buckets "
+        f"({counts['changed']} changed, {counts['removed']} removed)."
+    )
+    return counts
+
+
+def refresh(db, kinds=("instances", "volumes", "buckets"), regions=None, full=False):
+    counts = {}
+    if "instances" in kinds:
+        counts["instances"] = refresh_instances(db, regions=regions, full=full)
+    if "volumes" in kinds:
+        counts["volumes"] = refresh_volumes(db, regions=regions)
+    if "buckets" in kinds:
+        counts["buckets"] = refresh_buckets(db, full=full)
+    return counts
+
+
+# queries -- these only read the index and never call AWS
+def select_records(db, table, conditions, order):
+    where = " AND ".join(c for c, _ in conditions) or "1"
+    values = [v for _, values in conditions for v in values]
+    rows = db.execute(
+        f"SELECT record FROM {table} WHERE {where} ORDER BY {order}", values
+    )
+    return [pickle.loads(row["record"]) for row in rows]
+
+
+def in_condition(column, values):
+    if type(values) is str:
+        values = [values]
+    return (f"{column} IN ({', '.join('?' * len(values))})", list(values))
+
+
+def query_instances(
+    db, name=None, name_prefix=None, states=None, regions=None, launched_before=None
+):
+    conditions = []
+    if name is not None:
+        conditions.append(("name = ?", [name]))
+    if name_prefix is not None:
+        # a range instead of LIKE, so the name index is used
+        conditions.append(
+            ("name >= ? AND name < ?", [name_prefix, name_prefix + "\uffff"])
+        )
+    if states is not None:
+        conditions.append(in_condition("state", states))
+    if regions is not None:
+        conditions.append(in_condition("region", regions))
+    if launched_before is not None:
+        conditions.append(("launch_time < ?", [timestamp(launched_before)]))
+    return select_records(db, "instances", conditions, "name, instance_id")
+
+
+def query_volumes(db, states=None, attached=None, regions=None):
+    conditions = []
+    if states is not None:
+        conditions.append(in_condition("state", states))
+    if attached is not None:
+        conditions.append(("attached = ?", [int(attached)]))
+    if regions is not None:
+        conditions.append(in_condition("region", regions))
+    return select_records(db, "volumes", conditions, "volume_id")
+
+
+def query_buckets(db, name_prefix=None, regions=None):
+    conditions = []
+    if name_prefix is not None:
+        conditions.append(
+            ("name >= ? AND name < ?", [name_prefix, name_prefix + "\uffff"])
+        )
+    if regions is not None:
+        conditions.append(in_condition("region", regions))
+    return select_records(db, "buckets", conditions, "name")
+
+
+# test libraries
+import random
+
+
+def test_refresh():
+    print("test_refresh")
+    path = f"/tmp/test-inventory-{random.randint(10000000, 99999999)}.db"
+    db = open_inventory(path)
+    try:
+        assert inventory_age(db, "instances") is None
+        counts = refresh(db)
+        assert inventory_age(db, "instances") < 60
+        instances = infra.list_instances(refresh=True)
+        assert counts["instances"]["instances"] == len(instances)
+        assert counts["instances"]["changed"] == len(instances)
+        indexed = {i["instance_id"]: i for i in query_instances(db)}
+        assert set(indexed) == {i["instance_id"] for i in instances}
+        for instance in instances:
+            for key in ["name", "state", "region", "termination_protection"]:
+                assert indexed[instance["instance_id"]][key] == instance[key]
+        volumes = infra.list_volumes(refresh=True)
+        assert len(query_volumes(db)) == len(volumes)
+        assert len(query_buckets(db)) == len(infra.list_buckets(fields=()))
+        # a second refresh only re-reads what changed
+        counts = refresh(db)
+        unchanged = counts["instances"]["instances"] - counts["instances"]["changed"]
+        print(f"{unchanged} of {counts['instances']['instances']} instances unchanged.")
+        assert counts["buckets"]["changed"] == 0
+        # protection changed through infra is read again without full=True
+        instance = next(i for i in instances if i["state"] == "running")
+        value = not instance["termination_protection"]
+        infra.set_termination_protection(instance["instance_id"], value)
+        try:
+            counts = refresh_instances(db)
+            assert counts["changed"] >= 1
+            indexed = {i["instance_id"]: i for i in query_instances(db)}
+            assert indexed[instance["instance_id"]]["termination_protection"] == value
+        finally:
+            infra.set_termination_protection(instance["instance_id"], not value)
+        # details are read for the listed buckets, without listing them again
+        with infra.metrics() as m:
+            refresh_buckets(db, full=True)
+        assert m.calls().get("s3.ListBuckets") == 1, m.calls()
+    finally:
+        db.close()
+        os.remove(path)
+
+
+def test_queries():
+    print("test_queries")
+    path = f"/tmp/test-inventory-{random.randint(10000000, 99999999)}.db"
+    db = open_inventory(path)
+    try:
+        refresh(db, kinds=["instances", "volumes"])
+        instances = query_instances(db)
+        assert len(instances) > 0
+        # queries are answered offline, without any AWS client
+        infra.clients.clear()
+        start = time.time()
+        instance = instances[0]
+        assert query_instances(db, name=instance["name"])[0]["name"] == instance["name"]
+        prefix = instance["name"][:3]
+        matches = query_instances(db, name_prefix=prefix)
+        assert matches == [i for i in instances if i["name"].startswith(prefix)]
+        running = query_instances(db, states=["running"])
+        assert running == [i for i in instances if i["state"] == "running"]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cutoff = now - datetime.timedelta(days=2)
+        old = query_instances(db, launched_before=cutoff)
+        assert old == [i for i in instances if i["launch_time"] < cutoff]
+        assert (
+            query_instances(db, launched_before=now + datetime.timedelta(1))
+            == instances
+        )
+        unattached = query_volumes(db, attached=False)
+        assert all(len(v["attachments"]) == 0 for v in unattached)
+        assert query_instances(db, regions=["nowhere-1"]) == []
+        seconds = time.time() - start
+        print(f"Queries took {seconds * 1000:.1f} msec.")
+        assert len(infra.clients) == 0
+        assert seconds < 0.1
+    finally:
+        db.close()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    test_refresh()
+    test_queries()
+    print("done.")
@@ -0,0 +1,426 @@
+# tracker.py -- shared instance state tracking: one poller per region, many waiters
+
+# libraries
+import os, time
+import queue, threading
+from concurrent.futures import Future
+import infra
+
+# global variables
+
+# seconds between polls of a region while anything there is watched
+POLL_INTERVAL = 5
+
+# with an event source, polls only catch missed events (and health checks,
+# which EC2 sends no state-change events for)
+RECONCILE_INTERVAL = 60
+
+# a waiter fails as soon as its instance reaches one of these states
+FAILED_STATES = {"running": ["shutting-down", "terminated"], "stopped": ["terminated"]}
+
+# the process-wide tracker, see get_tracker()
+shared_tracker = None
+shared_tracker_lock = threading.Lock()
+
+
+# event sources
+class QueueEventSource:
+    # a local stand-in for an EventBridge rule that delivers "EC2 Instance
+    # State-change Notification" events (e.g. through an SQS queue); anything
+    # with the same get(timeout) method can be used instead
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def put(self, event):
+        self.queue.put(event)
+
+    def get(self, timeout=None):
+        # the next event, or None if there was none within timeout seconds
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def state_change_event(instance_id, state, region=None):
+    # the EventBridge event EC2 sends when an instance changes state
+    return {
+        "source": "aws.ec2",
+        "detail-type": "EC2 Instance State-change Notification",
+        "region": region or os.environ["AWS_REGION"],
+        "detail": {"instance-id": instance_id, "state": state},
+    }
+
+
+# tracking
+class StateTracker:
+    # watches instances for any number of waiters and subscribers. A
+    # background thread per region polls all instances watched there with
+    # batched describe calls (and applies events from an optional event
+    # source), then settles waiters' futures and calls subscribers. Pollers
+    # stop when nothing in their region is watched any more.
+    def __init__(self, interval=POLL_INTERVAL, source=None):
+        self.interval = interval
+        self.source = source
+        self.lock = threading.Lock()
+        self.observed = {}  # region -> instance ID -> observation
+        self.observed_at = {}  # region -> instance ID -> when it was observed
+        self.waiters = {}  # region -> list of waiters
+        self.subscribers = {}  # region -> list of subscriptions
+        self.pollers = {}  # region -> wake-up event of the running poller
+        self.closed = False
+        if source is not None:
+            threading.Thread(target=self.listen, daemon=True).start()
+
+    def watch(
+        self, instance_id, state="running", status_ok=False, region=None, timeout=None
+    ):
+        # returns a Future for the instance's observation once it is in
+        # `state` (and, with status_ok, passes both health checks). The future
+        # fails if the instance can no longer get there, or with TimeoutError.
+        region = region or os.environ["AWS_REGION"]
+        waiter = {
+            "instance_id": instance_id,
+            "state": state,
+            "status_ok": status_ok,
+            "deadline": time.time() + timeout if timeout is not None else None,
+            "future": Future(),
+        }
+        with self.lock:
+            assert not self.closed, "The tracker is closed."
+            observation = self.observed.get(region, {}).get(instance_id)
+            outcome = self.outcome(waiter, observation, time.time())
+            if outcome is None:
+                wake = status_ok and not self.needs_health(region)
+                self.waiters.setdefault(region, []).append(waiter)
+                self.start_poller(region, wake=wake)
+        if outcome is not None:
+            self.settle(waiter, outcome)
+        return waiter["future"]
+
+    def wait(
+        self, instance_ids, state="running", status_ok=False, region=None, timeout=300
+    ):
+        # blocks until every instance is in `state`; returns their observations
+        futures = {
+            i: self.watch(i, state, status_ok, region, timeout) for i in instance_ids
+        }
+        return {i: f.result() for i, f in futures.items()}
+
+    def subscribe(self, callback, instance_ids, region=None, health=False):
+        # calls callback(observation, previous) whenever one of the instances
+        # changes; with health, health check changes are polled for as well.
+        # Returns a function that ends the subscription.
+        region = region or os.environ["AWS_REGION"]
+        subscription = {
+            "callback": callback,
+            "instance_ids": set(instance_ids),
+            "health": health,
+        }
+        with self.lock:
+            assert not self.closed, "The tracker is closed."
+            wake = health and not self.needs_health(region)
+            self.subscribers.setdefault(region, []).append(subscription)
+            self.start_poller(region, wake=wake)
+
+        def unsubscribe():
+            # a no-op once the tracker is closed or after a first call; by
+            # identity, as equal subscriptions may belong to other callers
+            with self.lock:
+                subscriptions = self.subscribers.get(region, [])
+                subscriptions[:] = [s for s in subscriptions if s is not subscription]
+
+        return unsubscribe
+
+    def close(self):
+        # pollers and the listener stop; pending waiters are cancelled
+        with self.lock:
+            self.closed = True
+            waiters = [w for ws in self.waiters.values() for w in ws]
+            self.waiters = {}
+            self.subscribers = {}
+            for wakeup in self.pollers.values():
+                wakeup.set()
+        for waiter in waiters:
+            waiter["future"].cancel()
+
+    # called with the lock held
+    def start_poller(self, region, wake=False):
+        if region in self.pollers:
+            if wake:
+                # the first to need health checks, which are only polled for
+                self.pollers[region].set()
+            return
+        self.pollers[region] = threading.Event()
+        threading.Thread(target=self.poll, args=(region,), daemon=True).start()
+
+    def watched(self, region):
+        ids = {w["instance_id"] for w in self.waiters.get(region, [])}
+        for s in self.subscribers.get(region, []):
+            ids.update(s["instance_ids"])
+        return ids
+
+    def needs_health(self, region):
+        return any(w["status_ok"] for w in self.waiters.get(region, [])) or any(
+            s["health"] for s in self.subscribers.get(region, [])
+        )
+
+    def outcome(self, waiter, observation, now):
+        # None while the waiter has to keep waiting, otherwise (result, error)
+        instance_id = waiter["instance_id"]
+        if waiter["future"].done():
+            return (None, None)
+        if observation is not None:
+            state = observation["state"]
+            if state in FAILED_STATES.get(waiter["state"], []):
+                message = f"Instance {instance_id} is {state}, not {waiter['state']}."
+                return (None, Exception(message))
+            healthy = (observation["instance_status"], observation["system_status"])
+            if state == waiter["state"] and (
+                not waiter["status_ok"] or healthy == ("ok", "ok")
+            ):
+                return (observation, None)
+        if waiter["deadline"] is not None and now >= waiter["deadline"]:
+            message = (
+                f"Instance {instance_id} did not become {waiter['state']} in time."
+            )
+            return (None, TimeoutError(message))
+        return None
+
+    # called without the lock
+    def settle(self, waiter, outcome):
+        result, error = outcome
+        future = waiter["future"]
+        if future.done() or not future.set_running_or_notify_cancel():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def update(self, region, observations, observed_at):
+        # records new observations, then calls subscribers about the changes
+        # and settles the waiters that are done. observed_at is when the
+        # observations were made (a poll's start); ones older than what is
+        # recorded, such as a slow poll overtaken by an event, are dropped.
+        changes = []
+        settled = []
+        with self.lock:
+            watched = self.watched(region)
+            observed = self.observed.setdefault(region, {})
+            stamps = self.observed_at.setdefault(region, {})
+            for observation in observations:
+                instance_id = observation["instance_id"]
+                previous = observed.get(instance_id)
+                if instance_id not in watched:
+                    continue
+                if observed_at < stamps.get(instance_id, observed_at):
+                    continue
+                stamps[instance_id] = observed_at
+                if observation == previous:
+                    continue
+                observed[instance_id] = observation
+                for s in self.subscribers.get(region, []):
+                    if instance_id in s["instance_ids"]:
+                        changes.append((s["callback"], observation, previous))
+            now = time.time()
+            pending = []
+            for waiter in self.waiters.get(region, []):
+                outcome = self.outcome(waiter, observed.get(waiter["instance_id"]), now)
+                if outcome is None:
+                    pending.append(waiter)
+                else:
+                    settled.append((waiter, outcome))
+            self.waiters[region] = pending
+        for callback, observation, previous in changes:
+            try:
+                callback(observation, previous)
+            except Exception as e:
+                print(f"Error in state tracker callback: {e}")
+        for waiter, outcome in settled:
+            self.settle(waiter, outcome)
+
+    def describe(self, instance_ids, health, region):
+        # one call per 200 instances, plus one per 100 running instances for
+        # the health checks
+        observations = []
+        for results in infra.describe_instance_pages(
+            instance_ids=sorted(instance_ids), region=region
+        ):
+            for result in results:
+                observations.append(
+                    {
+                        "instance_id": result["InstanceId"],
+                        "state": result["State"]["Name"],
+                        "instance_status": "-",
+                        "system_status": "-",
+                    }
+                )
+        if health:
+            running = [
+                o["instance_id"] for o in observations if o["state"] == "running"
+            ]
+            statuses = infra.get_instance_statuses(running, region=region)
+            observations = [
+                {**o, **statuses.get(o["instance_id"], {})} for o in observations
+            ]
+        return observations
+
+    def poll(self, region):
+        while True:
+            with self.lock:
+                instance_ids = self.watched(region)
+                if self.closed or len(instance_ids) == 0:
+                    # forget what was seen, it is stale by the next start
+                    del self.pollers[region]
+                    self.observed.pop(region, None)
+                    self.observed_at.pop(region, None)
+                    return
+                health = self.needs_health(region)
+                wakeup = self.pollers[region]
+                wakeup.clear()
+            try:
+                started = time.time()
+                observations = self.describe(instance_ids, health, region)
+                self.update(region, observations, started)
+            except Exception as e:
+                # keep tracking; the next poll may succeed
+                print(f"Error polling instance states in {region}: {e}")
+            interval = self.interval
+            if self.source is not None and not health:
+                interval = RECONCILE_INTERVAL
+            with self.lock:
+                # wake up in time for the earliest timeout
+                deadlines = [
+                    w["deadline"]
+                    for w in self.waiters.get(region, [])
+                    if w["deadline"] is not None
+                ]
+            if deadlines:
+                interval = max(0, min(interval, min(deadlines) - time.time()))
+            wakeup.wait(interval)
+
+    def listen(self):
+        # applies state-change events as they arrive; health checks are kept
+        # from the last poll while the instance stays running
+        while not self.closed:
+            event = self.source.get(timeout=1)
+            if event is None:
+                continue
+            if event.get("detail-type") != "EC2 Instance State-change Notification":
+                continue
+            received = time.time()
+            region = event["region"]
+            instance_id = event["detail"]["instance-id"]
+            state = event["detail"]["state"]
+            with self.lock:
+                previous = self.observed.get(region, {}).get(instance_id)
+            observation = {
+                "instance_id": instance_id,
+                "state": state,
+                "instance_status": "-",
+                "system_status": "-",
+            }
+            if previous is not None and previous["state"] == state == "running":
+                observation = {**previous, "state": state}
+            self.update(region, [observation], received)
+
+
+def get_tracker():
+    # the tracker shared by all callers in the process
+    global shared_tracker
+    with shared_tracker_lock:
+        if shared_tracker is None:
+            shared_tracker = StateTracker()
+        return shared_tracker
+
+
+# tests
+def test_shared_polling():
+    import fixtures
+
+    print("test_shared_polling")
+    region = os.environ["AWS_REGION"]
+    with fixtures.synthetic(instances=200, volumes=0, buckets=0, limits=False) as aws:
+        with aws.lock:
+            instance_ids = [aws.launch(region) for _ in range(50)]
+        tracker = StateTracker(interval=0.2)
+        with infra.metrics() as m:
+            futures = [
+                tracker.watch(i, status_ok=True, timeout=10) for i in instance_ids
+            ]
+            time.sleep(1)
+            assert not any(f.done() for f in futures)
+            with aws.lock:
+                for instance_id in instance_ids:
+                    aws.statuses[instance_id] = "ok"
+            for f in futures:
+                assert f.result()["instance_status"] == "ok"
+        tracker.close()
+        # one describe per poll for all 50 waiters, not one per waiter
+        calls = m.calls()
+        assert calls["ec2.DescribeInstances"] < 15, calls
+        assert calls["ec2.DescribeInstanceStatus"] == calls["ec2.DescribeInstances"]
+
+
+def test_failures_and_timeouts():
+    import fixtures
+
+    print("test_failures_and_timeouts")
+    region = os.environ["AWS_REGION"]
+    with fixtures.synthetic(instances=0, volumes=0, buckets=0, limits=False) as aws:
+        with aws.lock:
+            running, terminated = aws.launch(region), aws.launch(region)
+            aws.terminate(region, terminated)
+        tracker = StateTracker(interval=0.2)
+        future = tracker.watch(terminated, state="running")
+        assert "is terminated" in str(future.exception(timeout=5))
+        future = tracker.watch(running, state="stopped", timeout=0.5)
+        assert type(future.exception(timeout=5)) is TimeoutError
+        future = tracker.watch(running, state="stopped")
+        future.cancel()
+        assert tracker.wait([running], timeout=5)[running]["state"] == "running"
+        tracker.close()
+
+
+def test_event_source():
+    import fixtures
+
+    print("test_event_source")
+    region = os.environ["AWS_REGION"]
+    with fixtures.synthetic(instances=0, volumes=0, buckets=0, limits=False) as aws:
+        with aws.lock:
+            instance_id = aws.launch(region)
+        source = QueueEventSource()
+        tracker = StateTracker(source=source)
+        changes = []
+        unsubscribe = tracker.subscribe(
+            lambda o, p: changes.append(o["state"]), [instance_id]
+        )
+        future = tracker.watch(instance_id, state="stopped")
+        time.sleep(0.5)
+        assert changes == ["running"]
+        # the event arrives long before the next reconciling poll
+        start = time.time()
+        with aws.lock:
+            aws.set_state(region, instance_id, "stopped")
+        source.put(state_change_event(instance_id, "stopped"))
+        assert future.result(timeout=5)["state"] == "stopped"
+        assert time.time() - start < 2
+        assert changes == ["running", "stopped"]
+        # a poll that started before the event and finished after it is older
+        # than what the event told, and does not undo it
+        tracker.update(region, [{**future.result(), "state": "running"}], start - 1)
+        assert changes == ["running", "stopped"]
+        assert tracker.observed[region][instance_id]["state"] == "stopped"
+        tracker.close()
+        unsubscribe()
+        unsubscribe()
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("AWS_REGION", "us-east-2")
+    test_shared_polling()
+    test_failures_and_timeouts()
+    test_event_source()
+    print("done.")
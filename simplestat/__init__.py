@@ -3,6 +3,9 @@ SimpleStat - A simple statistics package
 """
 
 from .stats import mean, median, mode, variance, standard_deviation, range_of_values
+from .columns import describe_columns
+from .cache import StatCache
+from .profiling import profile
 
 __version__ = "1.0.0"
 __all__ = [
@@ -12,4 +15,7 @@ __all__ = [
     "variance",
     "standard_deviation",
     "range_of_values",
+    "describe_columns",
+    "StatCache",
+    "profile",
 ]
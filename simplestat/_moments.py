@@ -0,0 +1,94 @@
+"""
+Mergeable running moments shared by the multi-value helpers.
+
+A moments tuple is ``(count, mean, m2, minimum, maximum)`` where ``m2`` is the
+sum of squared deviations from the mean. Tuples computed over disjoint chunks
+can be merged exactly (Chan et al.), so data never has to be held in memory
+all at once.
+"""
+
+import math
+from typing import Optional, Sequence, Tuple, Union
+
+Number = Union[int, float]
+Moments = Tuple[int, float, float, Number, Number]
+
+
+def moments(numbers: Sequence[Number]) -> Optional[Moments]:
+    """
+    Calculate the moments tuple of a chunk of numbers.
+
+    Args:
+        numbers: A sequence of numeric values
+
+    Returns:
+        The moments tuple, or None if the chunk is empty
+    """
+    count = len(numbers)
+    if count == 0:
+        return None
+    avg = sum(numbers) / count
+    m2 = sum([(x - avg) ** 2 for x in numbers])
+    return (count, avg, m2, min(numbers), max(numbers))
+
+
+def merge(a: Optional[Moments], b: Optional[Moments]) -> Optional[Moments]:
+    """
+    Merge two moments tuples computed over disjoint chunks.
+
+    Args:
+        a: A moments tuple, or None for an empty chunk
+        b: A moments tuple, or None for an empty chunk
+
+    Returns:
+        The moments tuple of the combined chunks
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    count_a, mean_a, m2_a, min_a, max_a = a
+    count_b, mean_b, m2_b, min_b, max_b = b
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    avg = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta * delta * count_a * count_b / count
+    return (count, avg, m2, min(min_a, min_b), max(max_a, max_b))
+
+
+def summary(m: Optional[Moments], sample: bool = True) -> dict:
+    """
+    Turn a moments tuple into a dictionary of descriptive statistics.
+
+    Args:
+        m: A moments tuple, or None for no data
+        sample: If True, use the sample variance (n-1), otherwise population variance (n)
+
+    Returns:
+        A dictionary with count, mean, variance, standard_deviation, min, max
+        and range. Values that are undefined for the amount of data seen so
+        far are None.
+    """
+    if m is None:
+        return {
+            "count": 0,
+            "mean": None,
+            "variance": None,
+            "standard_deviation": None,
+            "min": None,
+            "max": None,
+            "range": None,
+        }
+    count, avg, m2, minimum, maximum = m
+    divisor = count - 1 if sample else count
+    var = m2 / divisor if divisor > 0 else None
+    return {
+        "count": count,
+        "mean": avg,
+        "variance": var,
+        # math.sqrt also takes Decimal, which ** 0.5 does not
+        "standard_deviation": math.sqrt(var) if var is not None else None,
+        "min": minimum,
+        "max": maximum,
+        "range": maximum - minimum,
+    }
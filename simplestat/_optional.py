@@ -0,0 +1,40 @@
+"""
+Lazy access to optional dependencies.
+
+numpy takes around 100 ms to import, so it is imported the first time a fast
+path needs it rather than when simplestat is imported.
+"""
+
+import sys
+from typing import Any
+
+# None until the first lookup, False if numpy is not installed
+_numpy: Any = None
+
+
+def numpy() -> Any:
+    """
+    Import numpy on first use.
+
+    Returns:
+        The numpy module, or None if numpy is not installed
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy as np
+        except ImportError:  # numpy is optional
+            np = False
+        _numpy = np
+    return _numpy or None
+
+
+def is_ndarray(obj: Any) -> bool:
+    """
+    Check whether obj is a numpy array without importing numpy.
+
+    An array can only exist once numpy has been imported, so if it has not
+    been, obj is not one.
+    """
+    np = sys.modules.get("numpy")
+    return np is not None and isinstance(obj, np.ndarray)
@@ -0,0 +1,190 @@
+"""
+Asyncio helpers for computing statistics over streams of numbers.
+"""
+
+import asyncio
+import numbers
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    Union,
+)
+
+from . import _moments
+
+Number = Union[int, float]
+
+
+class Aggregator:
+    """
+    Streaming statistics over an async iterator of numbers.
+
+    Values are collected into batches, and each batch is folded into running
+    moments (count, mean, variance, min, max). Small batches are folded on the
+    event loop; batches of at least ``offload_threshold`` values are folded in
+    an executor so the loop keeps serving other tasks. While the source is
+    being consumed, a snapshot of the statistics is passed to ``on_snapshot``
+    every ``interval`` seconds, and once more when the source is exhausted.
+
+    Args:
+        source: An async iterator yielding numbers or iterables of numbers
+        batch_size: Number of values collected before a batch is folded in
+        interval: Seconds between snapshots, or None for no periodic snapshots
+        on_snapshot: Async callback receiving each snapshot dictionary
+        sample: If True, report sample variance (n-1), otherwise population variance (n)
+        reset: If True, statistics restart after every snapshot (per-interval stats)
+        executor: Executor for large batches; None uses the loop's default executor
+        offload_threshold: Batches at least this large are folded in the executor
+
+    Example:
+        >>> async def numbers():
+        ...     for n in [1, 2, 3]:
+        ...         yield n
+        >>> async def publish(snapshot):
+        ...     print(snapshot["count"], snapshot["mean"])
+        >>> final = asyncio.run(Aggregator(numbers(), on_snapshot=publish).run())
+        3 2.0
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[Union[Number, Iterable[Number]]],
+        batch_size: int = 1024,
+        interval: Optional[float] = 1.0,
+        on_snapshot: Optional[Callable[[dict], Awaitable[Any]]] = None,
+        sample: bool = True,
+        reset: bool = False,
+        executor: Any = None,
+        offload_threshold: int = 10000,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.source = source
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_snapshot = on_snapshot
+        self.sample = sample
+        self.reset = reset
+        self.executor = executor
+        self.offload_threshold = offload_threshold
+        self._moments: Optional[_moments.Moments] = None
+
+    def snapshot(self) -> dict:
+        """
+        Return the statistics of the values folded in so far.
+
+        Returns:
+            A dictionary with count, mean, variance, standard_deviation, min,
+            max and range. Values that are still undefined are None.
+        """
+        return _moments.summary(self._moments, self.sample)
+
+    async def update(self, numbers: Iterable[Number]) -> None:
+        """
+        Fold a batch of numbers into the running statistics.
+
+        Args:
+            numbers: The batch of numeric values
+        """
+        if not isinstance(numbers, (list, tuple)):
+            numbers = list(numbers)
+        if len(numbers) >= self.offload_threshold:
+            loop = asyncio.get_running_loop()
+            batch = await loop.run_in_executor(self.executor, _moments.moments, numbers)
+        else:
+            batch = _moments.moments(numbers)
+            # let other tasks run between back-to-back inline batches
+            await asyncio.sleep(0)
+        self._moments = _moments.merge(self._moments, batch)
+
+    async def run(self) -> dict:
+        """
+        Consume the source until it is exhausted.
+
+        Returns:
+            The final snapshot, which is also passed to ``on_snapshot``
+        """
+        publisher = None
+        if self.on_snapshot is not None and self.interval:
+            publisher = asyncio.create_task(self._publish_periodically())
+        try:
+            batch = []
+            async for item in self.source:
+                # any scalar the synchronous functions take: ints, floats,
+                # Decimal, Fraction, numpy scalars
+                if isinstance(item, numbers.Number):
+                    batch.append(item)
+                else:
+                    batch.extend(item)
+                if len(batch) >= self.batch_size:
+                    await self.update(batch)
+                    batch = []
+            if batch:
+                await self.update(batch)
+        finally:
+            if publisher is not None:
+                publisher.cancel()
+                try:
+                    await publisher
+                except asyncio.CancelledError:
+                    pass
+        return await self._publish()
+
+    async def _publish(self) -> dict:
+        snapshot = self.snapshot()
+        if self.reset:
+            self._moments = None
+        if self.on_snapshot is not None:
+            await self.on_snapshot(snapshot)
+        return snapshot
+
+    async def _publish_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._publish()
+
+
+async def iter_queue(queue: asyncio.Queue, sentinel: Any = None) -> AsyncIterator[Any]:
+    """
+    Yield items from an asyncio queue until the sentinel is received.
+
+    Args:
+        queue: The queue producers put numbers (or lists of numbers) on
+        sentinel: The item that marks the end of the stream
+
+    Example:
+        >>> async def main():
+        ...     queue = asyncio.Queue()
+        ...     for item in [1, [2, 3], None]:
+        ...         queue.put_nowait(item)
+        ...     return await Aggregator(iter_queue(queue)).run()
+        >>> asyncio.run(main())["mean"]
+        2.0
+    """
+    while True:
+        item = await queue.get()
+        if item is sentinel:
+            return
+        yield item
+
+
+async def iter_lines(reader: asyncio.StreamReader) -> AsyncIterator[float]:
+    """
+    Yield one number per line from an asyncio stream until end of file.
+
+    Blank lines are skipped.
+
+    Args:
+        reader: The stream, e.g. from asyncio.open_connection()
+
+    Raises:
+        ValueError: If a line is not a number
+    """
+    async for line in reader:
+        line = line.strip()
+        if line:
+            yield float(line)
@@ -0,0 +1,175 @@
+"""
+Opt-in memoization of statistics results, keyed by a fingerprint of the data.
+"""
+
+import functools
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+try:
+    import xxhash as _xxhash
+except ImportError:  # xxhash is optional, blake2b is used instead
+    _xxhash = None
+
+
+def fingerprint(numbers: Any) -> Hashable:
+    """
+    Calculate a cheap key that identifies the contents of a dataset.
+
+    Tuples are immutable, so they are identified by object identity. Buffers
+    (bytes, array.array, memoryview, numpy arrays) are hashed over their raw
+    memory, and any other sequence over its pickled contents, which keeps
+    values of different types (1 and 1.0) apart. Hashing a list costs a few
+    passes over it: cheaper than sorting it, dearer than summing it.
+
+    Args:
+        numbers: The dataset
+
+    Returns:
+        A hashable fingerprint
+
+    Example:
+        >>> fingerprint([1, 2, 3]) == fingerprint([1, 2, 3])
+        True
+    """
+    if type(numbers) is tuple:
+        return ("id", id(numbers))
+    try:
+        view = memoryview(numbers)
+    except TypeError:
+        pass
+    else:
+        data = view.cast("B") if view.c_contiguous else view.tobytes()
+        return ("buffer", view.format, view.shape, _digest(data))
+    try:
+        data = pickle.dumps(numbers, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return ("repr", len(numbers), _digest(repr(numbers).encode()))
+    return ("pickle", len(numbers), _digest(data))
+
+
+def _digest(data: Any) -> bytes:
+    if _xxhash is not None:
+        return _xxhash.xxh3_128_digest(data)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class StatCache:
+    """
+    LRU cache of statistics results with optional time-to-live.
+
+    Repeated calls with the same function, the same data and the same
+    arguments return the stored result after hashing the data once. Results
+    are shared between callers, so mutable results (such as the dictionaries
+    from describe_columns) must not be modified.
+
+    Args:
+        maxsize: Maximum number of results kept; the least recently used is evicted
+        ttl: Seconds a result stays valid, or None for no expiry
+
+    Example:
+        >>> from simplestat import mean
+        >>> cache = StatCache(maxsize=256, ttl=60)
+        >>> cached_mean = cache.wrap(mean)
+        >>> cached_mean([1, 2, 3])
+        2.0
+        >>> cache.info()["misses"]
+        1
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def call(self, func: Callable, numbers: Any, *args: Any, **kwargs: Any) -> Any:
+        """
+        Call ``func(numbers, *args, **kwargs)``, reusing a stored result if possible.
+
+        Args:
+            func: A statistics function taking the dataset as first argument
+            numbers: The dataset
+            *args: Further positional arguments for func
+            **kwargs: Further keyword arguments for func
+
+        Returns:
+            The result of the function
+        """
+        key = (func, fingerprint(numbers), args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, source, expires = entry
+                # identity keys are only valid while the same object is alive
+                if (expires is None or expires > now) and (
+                    source is None or source is numbers
+                ):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+            self.misses += 1
+
+        result = func(numbers, *args, **kwargs)
+
+        source = numbers if type(numbers) is tuple else None
+        expires = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (result, source, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def wrap(self, func: Callable) -> Callable:
+        """
+        Return a memoized version of a statistics function.
+
+        Args:
+            func: A statistics function taking the dataset as first argument
+
+        Returns:
+            A function with the same signature that goes through this cache
+        """
+
+        @functools.wraps(func)
+        def wrapper(numbers, *args, **kwargs):
+            return self.call(func, numbers, *args, **kwargs)
+
+        return wrapper
+
+    def info(self) -> dict:
+        """
+        Return the cache counters.
+
+        Returns:
+            A dictionary with hits, misses, evictions, size and maxsize
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self) -> None:
+        """
+        Remove all stored results and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
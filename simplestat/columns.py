@@ -0,0 +1,232 @@
+"""
+Column-wise statistics for two-dimensional data.
+"""
+
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from . import _moments, _optional
+from .profiling import note_path, profiled
+
+
+@profiled
+def describe_columns(
+    matrix: Any,
+    layout: str = "rows",
+    columns: Optional[int] = None,
+    sample: bool = True,
+    chunk_size: int = 65536,
+    workers: Optional[int] = None,
+) -> List[dict]:
+    """
+    Calculate descriptive statistics for every column of a matrix in one pass.
+
+    The matrix is read in chunks of rows and the per-chunk results are merged,
+    so memory use is proportional to the number of columns and the chunk size,
+    not to the number of rows. Order statistics (median, mode) need every value
+    and are therefore not included.
+
+    Args:
+        matrix: The data. Either a sequence of rows (layout="rows"), a sequence
+            of columns (layout="columns"), a flat buffer such as array.array or
+            memoryview together with ``columns``, or a 2-D numpy array
+        layout: "rows" for row-major data, "columns" for column-major data
+        columns: Number of columns when ``matrix`` is a flat buffer
+        sample: If True, calculate sample variance (n-1), otherwise population variance (n)
+        chunk_size: Number of rows processed per chunk
+        workers: If set, spread the row chunks over this many worker processes
+            (threads for numpy input, which releases the GIL)
+
+    Returns:
+        One dictionary per column with count, mean, variance,
+        standard_deviation, min, max and range
+
+    Raises:
+        ValueError: If the matrix is empty, ragged, or has only one row when sample=True
+
+    Example:
+        >>> [c["mean"] for c in describe_columns([[1, 10], [2, 20], [3, 30]])]
+        [2.0, 20.0]
+    """
+    if layout not in ("rows", "columns"):
+        raise ValueError(f"Unknown layout {layout!r}, expected 'rows' or 'columns'")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    if _optional.is_ndarray(matrix) or (
+        columns is not None and _is_buffer(matrix) and _optional.numpy() is not None
+    ):
+        note_path("numpy-threads" if workers else "numpy")
+        return _describe_ndarray(matrix, layout, columns, sample, chunk_size, workers)
+
+    height, width = _shape(matrix, layout, columns)
+    if height == 0 or width == 0:
+        raise ValueError("Cannot describe columns of an empty matrix")
+    if sample and height < 2:
+        raise ValueError("Sample variance requires at least 2 values")
+
+    chunks = _row_chunks(matrix, layout, columns, height, width, chunk_size)
+    totals: List[Optional[_moments.Moments]] = [None] * width
+    if workers:
+        # concurrent.futures and multiprocessing take ~30 ms to import, so
+        # they are only loaded when workers are asked for
+        from concurrent.futures import ProcessPoolExecutor
+
+        note_path("python-processes")
+        # memoryview slices cannot be pickled across to the worker processes
+        chunks = (
+            [list(c) if isinstance(c, memoryview) else c for c in chunk]
+            for chunk in chunks
+        )
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = _map_bounded(executor, _chunk_moments, chunks, 2 * workers)
+            for result in results:
+                totals = [_moments.merge(t, m) for t, m in zip(totals, result)]
+    else:
+        for chunk in chunks:
+            result = _chunk_moments(chunk)
+            totals = [_moments.merge(t, m) for t, m in zip(totals, result)]
+    return [_moments.summary(t, sample) for t in totals]
+
+
+def _is_buffer(obj: Any) -> bool:
+    try:
+        memoryview(obj)
+    except TypeError:
+        return False
+    return True
+
+
+def _shape(matrix: Any, layout: str, columns: Optional[int]):
+    if columns is not None:
+        if columns < 1:
+            raise ValueError("columns must be at least 1")
+        if len(matrix) % columns:
+            raise ValueError(
+                f"Buffer of length {len(matrix)} does not divide into {columns} columns"
+            )
+        return len(matrix) // columns, columns
+    if len(matrix) == 0:
+        return 0, 0
+    if layout == "rows":
+        return len(matrix), len(matrix[0])
+    height = len(matrix[0])
+    if any(len(column) != height for column in matrix):
+        raise ValueError("All columns must have the same length")
+    return height, len(matrix)
+
+
+def _row_chunks(
+    matrix: Any,
+    layout: str,
+    columns: Optional[int],
+    height: int,
+    width: int,
+    chunk_size: int,
+) -> Iterator[list]:
+    # yields each chunk of rows as a list of per-column slices
+    for start in range(0, height, chunk_size):
+        stop = min(start + chunk_size, height)
+        if columns is not None and layout == "rows":
+            chunk = [
+                matrix[start * width + k : stop * width : width] for k in range(width)
+            ]
+        elif columns is not None:
+            chunk = [
+                matrix[k * height + start : k * height + stop] for k in range(width)
+            ]
+        elif layout == "rows":
+            rows = matrix[start:stop]
+            if any(len(row) != width for row in rows):
+                raise ValueError("All rows must have the same length")
+            chunk = list(zip(*rows))
+        else:
+            chunk = [column[start:stop] for column in matrix]
+        yield chunk
+
+
+def _chunk_moments(chunk: list) -> list:
+    return [_moments.moments(column) for column in chunk]
+
+
+def _map_bounded(
+    executor: Any, fn: Callable, items: Iterable, window: int
+) -> Iterator[Any]:
+    # like executor.map, but keeps at most `window` items in flight so that a
+    # large input is never materialized all at once; results are unordered
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    pending = set()
+    for item in items:
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(executor.submit(fn, item))
+    for future in pending:
+        yield future.result()
+
+
+def _describe_ndarray(matrix, layout, columns, sample, chunk_size, workers):
+    np = _optional.numpy()
+    if isinstance(matrix, np.ndarray):
+        array = matrix
+    else:
+        array = np.asarray(memoryview(matrix))
+    if array.ndim == 1:
+        if columns is None:
+            raise ValueError("columns is required for a flat buffer")
+        if array.size % columns:
+            raise ValueError(
+                f"Buffer of length {array.size} does not divide into {columns} columns"
+            )
+        if layout == "rows":
+            array = array.reshape(-1, columns)
+        else:
+            array = array.reshape(columns, -1)
+    elif array.ndim != 2:
+        raise ValueError(f"Expected a 2-D array, got {array.ndim} dimensions")
+    if layout == "columns":
+        array = array.T
+    height, width = array.shape
+    if height == 0 or width == 0:
+        raise ValueError("Cannot describe columns of an empty matrix")
+    if sample and height < 2:
+        raise ValueError("Sample variance requires at least 2 values")
+
+    blocks = (
+        array[start : start + chunk_size] for start in range(0, height, chunk_size)
+    )
+    total = None
+    if workers:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for result in _map_bounded(executor, _block_moments, blocks, 2 * workers):
+                total = _merge_blocks(total, result)
+    else:
+        for block in blocks:
+            total = _merge_blocks(total, _block_moments(block))
+
+    count, avg, m2, minimum, maximum = total
+    columns = zip(avg.tolist(), m2.tolist(), minimum.tolist(), maximum.tolist())
+    return [_moments.summary((count, a, m, lo, hi), sample) for a, m, lo, hi in columns]
+
+
+def _block_moments(block):
+    avg = block.mean(axis=0)
+    m2 = ((block - avg) ** 2).sum(axis=0)
+    return (block.shape[0], avg, m2, block.min(axis=0), block.max(axis=0))
+
+
+def _merge_blocks(a, b):
+    # vectorized version of _moments.merge across all columns at once
+    if a is None:
+        return b
+    np = _optional.numpy()
+    count_a, mean_a, m2_a, min_a, max_a = a
+    count_b, mean_b, m2_b, min_b, max_b = b
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    avg = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta * delta * count_a * count_b / count
+    return (count, avg, m2, np.minimum(min_a, min_b), np.maximum(max_a, max_b))
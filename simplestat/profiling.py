@@ -0,0 +1,142 @@
+"""
+Opt-in instrumentation of simplestat calls.
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List
+
+# profiles currently collecting; when empty, instrumented calls go straight
+# through after a single truthiness check
+_active: List["Profile"] = []
+_active_lock = threading.Lock()
+
+# the path notes of the innermost instrumented call in this thread/task
+_paths: contextvars.ContextVar = contextvars.ContextVar(
+    "simplestat_paths", default=None
+)
+
+
+class Profile:
+    """
+    Statistics collected by profile() about simplestat calls.
+
+    ``stats`` maps each function name to a dictionary with the number of
+    calls, the number of input elements, the total wall time in seconds and
+    how often each implementation path was taken (e.g. "sort" or "counting"
+    for median, "numpy" or "python" for mean).
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, elements: int, seconds: float, path: str) -> None:
+        """
+        Add one call to the statistics.
+
+        Args:
+            name: The function name
+            elements: The number of input elements
+            seconds: The wall time of the call
+            path: The implementation path that was taken
+        """
+        with self._lock:
+            entry = self.stats.get(name)
+            if entry is None:
+                entry = {"calls": 0, "elements": 0, "seconds": 0.0, "paths": {}}
+                self.stats[name] = entry
+            entry["calls"] += 1
+            entry["elements"] += elements
+            entry["seconds"] += seconds
+            entry["paths"][path] = entry["paths"].get(path, 0) + 1
+
+    def report(self) -> str:
+        """
+        Format the statistics as a table, slowest function first.
+
+        Returns:
+            The table as a string
+        """
+        header = f"{'function':<20} {'calls':>8} {'elements':>12} {'seconds':>10}"
+        lines = [header + "  paths"]
+        with self._lock:
+            items = sorted(self.stats.items(), key=lambda i: -i[1]["seconds"])
+            for name, entry in items:
+                paths = ", ".join(f"{p}={n}" for p, n in entry["paths"].items())
+                lines.append(
+                    f"{name:<20} {entry['calls']:>8} {entry['elements']:>12} "
+                    f"{entry['seconds']:>10.6f}  {paths}"
+                )
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile() -> Iterator[Profile]:
+    """
+    Collect call counts, element counts, wall time and implementation paths.
+
+    Profiles may be nested or used from several threads; every active profile
+    sees every instrumented call.
+
+    Example:
+        >>> from simplestat import median
+        >>> with profile() as p:
+        ...     median([1, 2, 3])
+        2
+        >>> p.stats["median"]["calls"]
+        1
+    """
+    p = Profile()
+    with _active_lock:
+        _active.append(p)
+    try:
+        yield p
+    finally:
+        with _active_lock:
+            _active.remove(p)
+
+
+def profiled(func: Callable) -> Callable:
+    """
+    Instrument a function whose first argument is the dataset.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(numbers, *args, **kwargs):
+        if not _active:
+            return func(numbers, *args, **kwargs)
+        paths = []
+        token = _paths.set(paths)
+        start = time.perf_counter()
+        try:
+            return func(numbers, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            _paths.reset(token)
+            path = paths[-1] if paths else "python"
+            for p in list(_active):
+                p.record(name, _length(numbers), seconds, path)
+
+    return wrapper
+
+
+def note_path(path: str) -> None:
+    """
+    Record which implementation path the current instrumented call takes.
+    """
+    if _active:
+        paths = _paths.get()
+        if paths is not None:
+            paths.append(path)
+
+
+def _length(numbers: Any) -> int:
+    try:
+        return len(numbers)
+    except TypeError:
+        return 0
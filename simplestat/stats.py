@@ -2,9 +2,29 @@
 Simple statistics functions for basic data analysis.
 """
 
+import operator
+from array import array
+from collections import Counter
 from typing import List, Union
 
+from ._optional import is_ndarray, numpy
+from .profiling import note_path, profiled
 
+# array.array typecodes holding integers
+_INT_TYPECODES = "bBhHiIlLqQ"
+
+# integer data whose value range is below len(numbers) // _COUNTING_RATIO is
+# counted instead of sorted; counting wins by 2-3x at ranges below n / 32,
+# still by 1.3x at n / 16 on 1M values, and breaks even around n / 8
+# (benchmarks/benchmark-stats.py)
+_COUNTING_RATIO = 16
+
+# values looked at before committing to a full pass over the data; turning
+# away wide ranges this way costs under 0.1% of a sort, a full type scan ~6%
+_SAMPLE_SIZE = 1024
+
+
+@profiled
 def mean(numbers: List[Union[int, float]]) -> float:
     """
     Calculate the arithmetic mean (average) of a list of numbers.
@@ -22,11 +42,16 @@ def mean(numbers: List[Union[int, float]]) -> float:
         >>> mean([1, 2, 3, 4, 5])
         3.0
     """
-    if not numbers:
+    if len(numbers) == 0:
         raise ValueError("Cannot calculate mean of empty list")
+    ints = _int_ndarray(numbers)
+    if ints is not None:
+        note_path("numpy")
+        return _exact_sum(ints) / len(ints)
     return sum(numbers) / len(numbers)
 
 
+@profiled
 def median(numbers: List[Union[int, float]]) -> float:
     """
     Calculate the median (middle value) of a list of numbers.
@@ -46,19 +71,36 @@ def median(numbers: List[Union[int, float]]) -> float:
         >>> median([1, 2, 3, 4])
         2.5
     """
-    if not numbers:
+    if len(numbers) == 0:
         raise ValueError("Cannot calculate median of empty list")
 
-    sorted_numbers = sorted(numbers)
-    n = len(sorted_numbers)
+    n = len(numbers)
     mid = n // 2
 
+    ints = _int_ndarray(numbers)
+    if ints is not None:
+        note_path("numpy-partition")
+        np = numpy()
+        if n % 2 == 0:
+            partitioned = np.partition(ints, [mid - 1, mid])
+            return (int(partitioned[mid - 1]) + int(partitioned[mid])) / 2
+        return int(np.partition(ints, mid)[mid])
+
+    counts = _dense_int_counts(numbers)
+    if counts is not None:
+        note_path("counting")
+        return _counting_median(counts, n)
+
+    note_path("sort")
+    sorted_numbers = sorted(numbers)
+
     if n % 2 == 0:
         return (sorted_numbers[mid - 1] + sorted_numbers[mid]) / 2
     else:
         return sorted_numbers[mid]
 
 
+@profiled
 def mode(numbers: List[Union[int, float]]) -> Union[int, float]:
     """
     Calculate the mode (most frequent value) of a list of numbers.
@@ -76,13 +118,16 @@ def mode(numbers: List[Union[int, float]]) -> Union[int, float]:
         >>> mode([1, 2, 2, 3, 4])
         2
     """
-    if not numbers:
+    if len(numbers) == 0:
         raise ValueError("Cannot calculate mode of empty list")
 
-    frequency = {}
-    for num in numbers:
-        frequency[num] = frequency.get(num, 0) + 1
+    ints = _int_ndarray(numbers)
+    if ints is not None:
+        return _ndarray_mode(ints)
 
+    # Counter keeps first-seen order, so ties still resolve to the first value
+    note_path("counter")
+    frequency = Counter(numbers)
     max_freq = max(frequency.values())
     modes = [num for num, freq in frequency.items() if freq == max_freq]
 
@@ -92,6 +137,7 @@ def mode(numbers: List[Union[int, float]]) -> Union[int, float]:
     return modes[0]
 
 
+@profiled
 def variance(numbers: List[Union[int, float]], sample: bool = True) -> float:
     """
     Calculate the variance of a list of numbers.
@@ -110,19 +156,35 @@ def variance(numbers: List[Union[int, float]], sample: bool = True) -> float:
         >>> variance([1, 2, 3, 4, 5])
         2.5
     """
-    if not numbers:
+    if len(numbers) == 0:
         raise ValueError("Cannot calculate variance of empty list")
 
     if sample and len(numbers) < 2:
         raise ValueError("Sample variance requires at least 2 values")
 
-    avg = mean(numbers)
+    n = len(numbers)
+    divisor = n - 1 if sample else n
+
+    # integers: exact sums, so the only rounding is the final division
+    ints = _int_ndarray(numbers)
+    if ints is not None:
+        note_path("numpy-exact")
+        total = _exact_sum(ints)
+        return (n * _exact_sum_of_squares(ints) - total * total) / (n * divisor)
+    # the sum only stays an int if every value is one
+    total = sum(numbers)
+    if type(total) is int:
+        note_path("integer")
+        squares = sum(map(operator.mul, numbers, numbers))
+        return (n * squares - total * total) / (n * divisor)
+
+    avg = total / n
     squared_diffs = [(x - avg) ** 2 for x in numbers]
 
-    divisor = len(numbers) - 1 if sample else len(numbers)
     return sum(squared_diffs) / divisor
 
 
+@profiled
 def standard_deviation(numbers: List[Union[int, float]], sample: bool = True) -> float:
     """
     Calculate the standard deviation of a list of numbers.
@@ -144,6 +206,7 @@ def standard_deviation(numbers: List[Union[int, float]], sample: bool = True) ->
     return variance(numbers, sample) ** 0.5
 
 
+@profiled
 def range_of_values(numbers: List[Union[int, float]]) -> float:
     """
     Calculate the range (max - min) of a list of numbers.
@@ -161,7 +224,106 @@ def range_of_values(numbers: List[Union[int, float]]) -> float:
         >>> range_of_values([1, 2, 3, 4, 5])
         4
     """
-    if not numbers:
+    if len(numbers) == 0:
         raise ValueError("Cannot calculate range of empty list")
 
+    ints = _int_ndarray(numbers)
+    if ints is not None:
+        note_path("numpy")
+        return int(ints.max()) - int(ints.min())
     return max(numbers) - min(numbers)
+
+
+# integer fast paths
+
+
+def _int_ndarray(numbers):
+    # a 1-D integer numpy view of numbers, or None if numpy can't be used;
+    # integer array.array buffers are wrapped without copying
+    if is_ndarray(numbers):
+        if numbers.ndim == 1 and numbers.dtype.kind in "iu":
+            return numbers
+        return None
+    if isinstance(numbers, array) and numbers.typecode in _INT_TYPECODES:
+        np = numpy()
+        if np is not None:
+            return np.frombuffer(numbers, dtype=numbers.typecode)
+    return None
+
+
+def _dense_int_counts(numbers):
+    # a Counter of numbers if they are all ints within a range narrow enough
+    # for counting, else None. A strided sample turns away floats and wide
+    # ranges before any full pass; the type check runs over distinct values
+    n = len(numbers)
+    if not isinstance(numbers, (list, tuple, array)) or type(numbers[0]) is not int:
+        return None
+    limit = n // _COUNTING_RATIO
+    sample = numbers[:: max(1, n // _SAMPLE_SIZE)]
+    if any(type(x) is not int for x in sample) or max(sample) - min(sample) >= limit:
+        return None
+    counts = Counter(numbers)
+    if len(counts) > limit or any(type(x) is not int for x in counts):
+        return None
+    if max(counts) - min(counts) >= limit:
+        return None
+    return counts
+
+
+def _fits_int64(ints, power: int) -> bool:
+    # True if summing the power-th powers of ints cannot overflow int64
+    bound = max(-int(ints.min()), int(ints.max()))
+    return len(ints) * bound**power < 2**63
+
+
+def _exact_sum(ints) -> int:
+    if _fits_int64(ints, 1):
+        return int(ints.sum(dtype=numpy().int64))
+    return sum(ints.tolist())
+
+
+def _exact_sum_of_squares(ints) -> int:
+    if _fits_int64(ints, 2):
+        np = numpy()
+        ints = ints.astype(np.int64, copy=False)
+        return int(np.dot(ints, ints))
+    values = ints.tolist()
+    return sum(map(operator.mul, values, values))
+
+
+def _counting_median(counts: Counter, n: int) -> float:
+    # walk the value range in order instead of sorting the values
+    mid = n // 2
+    seen = 0
+    below = None
+    for value in range(min(counts), max(counts) + 1):
+        seen += counts.get(value, 0)
+        if below is None and seen >= mid:
+            below = value
+        if seen > mid:
+            break
+    if n % 2 == 0:
+        return (below + value) / 2
+    return value
+
+
+def _ndarray_mode(ints) -> int:
+    np = numpy()
+    low, high = int(ints.min()), int(ints.max())
+    if high - low <= len(ints):
+        if ints.dtype.kind == "u":
+            offsets = ints - ints.min()
+        else:
+            offsets = ints.astype(np.int64) - low
+        note_path("numpy-bincount")
+        counts = np.bincount(offsets)
+        value_counts = counts[offsets]
+    else:
+        note_path("numpy-unique")
+        _, inverse, counts = np.unique(ints, return_inverse=True, return_counts=True)
+        value_counts = counts[inverse.reshape(-1)]
+    max_freq = counts.max()
+    if np.count_nonzero(counts == max_freq) == np.count_nonzero(counts):
+        raise ValueError("No unique mode found")
+    # the first value reaching the top count, matching the pure Python path
+    return int(ints[np.argmax(value_counts == max_freq)])
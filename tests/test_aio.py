@@ -0,0 +1,163 @@
+import asyncio
+import math
+import random
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+
+from simplestat import _optional, mean, variance
+from simplestat.aio import Aggregator, iter_lines, iter_queue
+
+random.seed(27)
+NUMBERS = [random.uniform(-100, 100) for _ in range(5000)]
+
+
+async def iterate(items, delay=0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+def check(snapshot, numbers=NUMBERS, sample=True):
+    assert snapshot["count"] == len(numbers)
+    assert math.isclose(snapshot["mean"], mean(numbers), abs_tol=1e-9)
+    assert math.isclose(snapshot["variance"], variance(numbers, sample), rel_tol=1e-9)
+    assert snapshot["min"] == min(numbers)
+    assert snapshot["max"] == max(numbers)
+
+
+def test_numbers_and_batches():
+    # single numbers and lists of numbers can be mixed
+    items = NUMBERS[:1000] + [NUMBERS[i : i + 100] for i in range(1000, 5000, 100)]
+    final = asyncio.run(Aggregator(iterate(items), batch_size=256).run())
+    check(final)
+    final = asyncio.run(Aggregator(iterate(NUMBERS), sample=False).run())
+    check(final, sample=False)
+
+
+def test_scalar_types():
+    items = [Decimal("1.5"), Decimal(2), Decimal("4.5")]
+    final = asyncio.run(Aggregator(iterate(items)).run())
+    assert final["count"] == 3 and final["mean"] == Decimal(8) / 3
+    final = asyncio.run(Aggregator(iterate([Fraction(1, 2), 1, True])).run())
+    assert final["count"] == 3 and final["mean"] == Fraction(5, 6)
+
+
+@pytest.mark.skipif(_optional.numpy() is None, reason="numpy is not installed")
+def test_numpy_scalars():
+    np = _optional.numpy()
+    items = [np.int64(n) for n in range(10)] + [np.float32(10)]
+    final = asyncio.run(Aggregator(iterate(items)).run())
+    assert final["count"] == 11 and final["mean"] == 5.0
+
+
+def test_offloaded_batches():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        aggregator = Aggregator(
+            iterate([NUMBERS[:2500], NUMBERS[2500:]]),
+            executor=executor,
+            offload_threshold=1000,
+        )
+        check(asyncio.run(aggregator.run()))
+
+
+def test_periodic_snapshots():
+    snapshots = []
+
+    async def on_snapshot(snapshot):
+        snapshots.append(snapshot)
+
+    items = [NUMBERS[i : i + 10] for i in range(0, 500, 10)]
+    aggregator = Aggregator(
+        iterate(items, delay=0.002),
+        batch_size=10,
+        interval=0.02,
+        on_snapshot=on_snapshot,
+    )
+    final = asyncio.run(aggregator.run())
+    assert len(snapshots) > 1 and snapshots[-1] is final
+    counts = [s["count"] for s in snapshots]
+    assert counts == sorted(counts)
+    check(final, NUMBERS[:500])
+
+
+def test_reset_after_every_snapshot():
+    snapshots = []
+
+    async def on_snapshot(snapshot):
+        snapshots.append(snapshot)
+
+    aggregator = Aggregator(
+        iterate(NUMBERS[:500], delay=0.0005),
+        batch_size=1,
+        interval=0.02,
+        on_snapshot=on_snapshot,
+        reset=True,
+    )
+    asyncio.run(aggregator.run())
+    # per-interval statistics add up to the whole stream
+    assert len(snapshots) > 1
+    assert sum(s["count"] for s in snapshots) == 500
+    assert aggregator.snapshot()["count"] == 0
+
+
+def test_publisher_stops_when_source_fails():
+    async def failing():
+        yield 1
+        raise RuntimeError("source failed")
+
+    async def on_snapshot(snapshot):
+        pass
+
+    async def main():
+        aggregator = Aggregator(failing(), interval=0.01, on_snapshot=on_snapshot)
+        with pytest.raises(RuntimeError):
+            await aggregator.run()
+        # only the test's own task is left
+        return len(asyncio.all_tasks())
+
+    assert asyncio.run(main()) == 1
+
+
+def test_empty_source():
+    final = asyncio.run(Aggregator(iterate([])).run())
+    assert final["count"] == 0 and final["mean"] is None
+
+
+def test_iter_queue():
+    async def main():
+        queue = asyncio.Queue()
+        aggregator = asyncio.create_task(Aggregator(iter_queue(queue)).run())
+        for item in NUMBERS[:100] + [NUMBERS[100:]]:
+            await queue.put(item)
+        await queue.put(None)
+        return await aggregator
+
+    check(asyncio.run(main()))
+
+
+def test_iter_lines():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"1\n2.5\n\n  4 \n")
+        reader.feed_eof()
+        return [x async for x in iter_lines(reader)]
+
+    assert asyncio.run(main()) == [1.0, 2.5, 4.0]
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError, match="batch_size"):
+        Aggregator(iterate([]), batch_size=0)
+
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"1\nnot a number\n")
+        reader.feed_eof()
+        return [x async for x in iter_lines(reader)]
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
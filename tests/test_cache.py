@@ -0,0 +1,47 @@
+from array import array
+from fractions import Fraction
+
+from simplestat import StatCache, mean, median, mode
+from simplestat.cache import fingerprint
+
+
+def test_fingerprint_lists():
+    assert fingerprint([1, 2, 3]) == fingerprint([1, 2, 3])
+    assert fingerprint([1, 2, 3]) != fingerprint([1, 2, 4])
+    # equal values of different types give different results, e.g. for mode
+    assert fingerprint([1, 1, 2]) != fingerprint([1.0, 1.0, 2.0])
+    assert fingerprint([2**53 + 1, 0.5]) != fingerprint([2**53, 0.5])
+    assert fingerprint([Fraction(1, 3)]) == fingerprint([Fraction(1, 3)])
+
+
+def test_fingerprint_buffers_and_tuples():
+    assert fingerprint(array("d", [1, 2])) == fingerprint(array("d", [1, 2]))
+    assert fingerprint(array("d", [1, 2])) != fingerprint(array("q", [1, 2]))
+    numbers = (1, 2, 3)
+    assert fingerprint(numbers) == fingerprint(numbers)
+    assert fingerprint(numbers) != fingerprint((1, 2, 3, 4))
+
+
+def test_hits_and_misses():
+    cache = StatCache()
+    cached_median = cache.wrap(median)
+    numbers = [3, 1, 2]
+    assert cached_median(numbers) == 2
+    assert cached_median([3, 1, 2]) == 2
+    numbers.append(10)
+    assert cached_median(numbers) == 2.5
+    assert cache.call(mode, [1.0, 1.0, 2.0]) == 1.0
+    assert type(cache.call(mode, [1, 1, 2])) is int
+    assert cache.info()["hits"] == 1
+    assert cache.info()["misses"] == 4
+
+
+def test_eviction_and_ttl():
+    cache = StatCache(maxsize=2)
+    for n in range(3):
+        cache.call(mean, [n, n + 1])
+    assert cache.info()["evictions"] == 1 and cache.info()["size"] == 2
+    cache = StatCache(ttl=0)
+    cache.call(mean, [1, 2])
+    cache.call(mean, [1, 2])
+    assert cache.info()["hits"] == 0
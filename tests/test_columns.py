@@ -0,0 +1,102 @@
+import math
+import random
+from array import array
+
+import pytest
+
+from simplestat import _optional, describe_columns, mean, profile, variance
+
+np = _optional.numpy()
+needs_numpy = pytest.mark.skipif(np is None, reason="numpy is not installed")
+
+random.seed(26)
+ROWS = [[random.uniform(-100, 100) for _ in range(4)] for _ in range(1000)]
+COLUMNS = [list(column) for column in zip(*ROWS)]
+
+
+@pytest.fixture
+def without_numpy(monkeypatch):
+    monkeypatch.setattr(_optional, "_numpy", False)
+
+
+def check(result, columns=COLUMNS, sample=True):
+    assert len(result) == len(columns)
+    for stats, column in zip(result, columns):
+        assert stats["count"] == len(column)
+        assert math.isclose(stats["mean"], mean(column), abs_tol=1e-9)
+        assert math.isclose(stats["variance"], variance(column, sample), rel_tol=1e-9)
+        assert math.isclose(
+            stats["standard_deviation"], variance(column, sample) ** 0.5, rel_tol=1e-9
+        )
+        assert stats["min"] == min(column)
+        assert stats["max"] == max(column)
+        assert stats["range"] == max(column) - min(column)
+
+
+def describe(matrix, path, **kwargs):
+    # describe_columns(), checking which implementation it used
+    with profile() as p:
+        result = describe_columns(matrix, **kwargs)
+    assert p.stats["describe_columns"]["paths"] == {path: 1}
+    return result
+
+
+def flat(layout):
+    # the matrix as one array.array, row-major or column-major
+    lines = ROWS if layout == "rows" else COLUMNS
+    return array("d", [x for line in lines for x in line])
+
+
+def test_rows_and_columns_layouts():
+    check(describe(ROWS, "python"))
+    check(describe(COLUMNS, "python", layout="columns"))
+    check(describe(ROWS, "python", sample=False), sample=False)
+
+
+def test_chunks_are_merged_exactly():
+    check(describe_columns(ROWS, chunk_size=7))
+    check(describe_columns(COLUMNS, layout="columns", chunk_size=1))
+
+
+@pytest.mark.parametrize("layout", ["rows", "columns"])
+def test_flat_buffer_pure_python(without_numpy, layout):
+    check(describe(flat(layout), "python", layout=layout, columns=4, chunk_size=64))
+    check(describe(memoryview(flat(layout)), "python", layout=layout, columns=4))
+
+
+@needs_numpy
+@pytest.mark.parametrize("layout", ["rows", "columns"])
+def test_flat_buffer_numpy(layout):
+    check(describe(flat(layout), "numpy", layout=layout, columns=4, chunk_size=64))
+
+
+@needs_numpy
+def test_ndarray():
+    check(describe(np.array(ROWS), "numpy", chunk_size=100))
+    check(describe(np.array(COLUMNS), "numpy", layout="columns"))
+    check(describe(np.array(ROWS), "numpy-threads", chunk_size=100, workers=3))
+
+
+def test_process_workers():
+    check(describe(ROWS, "python-processes", chunk_size=100, workers=2))
+
+
+def test_process_workers_with_buffer(without_numpy):
+    check(
+        describe(flat("rows"), "python-processes", columns=4, chunk_size=100, workers=2)
+    )
+
+
+def test_errors():
+    with pytest.raises(ValueError, match="same length"):
+        describe_columns([[1, 2], [3], [4, 5]])
+    with pytest.raises(ValueError, match="same length"):
+        describe_columns([[1, 2], [3]], layout="columns")
+    with pytest.raises(ValueError, match="empty"):
+        describe_columns([])
+    with pytest.raises(ValueError, match="at least 2"):
+        describe_columns([[1, 2]])
+    with pytest.raises(ValueError, match="divide"):
+        describe_columns(array("d", [1, 2, 3]), columns=2)
+    with pytest.raises(ValueError, match="layout"):
+        describe_columns(ROWS, layout="diagonal")
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from simplestat import median, mode, profile, standard_deviation, variance
+from simplestat.profiling import _active
+
+DENSE = [n % 10 for n in range(1000)]
+FLOATS = [n / 7 for n in range(1000)]
+
+
+def test_calls_and_paths():
+    with profile() as p:
+        median(DENSE)
+        median(FLOATS)
+        median(FLOATS[:11])
+        mode(DENSE + [3])
+        variance(DENSE)
+        variance(FLOATS)
+    assert p.stats["median"]["calls"] == 3
+    assert p.stats["median"]["elements"] == 2011
+    assert p.stats["median"]["paths"] == {"counting": 1, "sort": 2}
+    assert p.stats["mode"]["paths"] == {"counter": 1}
+    assert p.stats["variance"]["paths"] == {"integer": 1, "python": 1}
+    assert p.stats["variance"]["seconds"] > 0
+    report = p.report()
+    assert "median" in report and "counting=1, sort=2" in report
+
+
+def test_nested_calls_keep_their_own_paths():
+    with profile() as p:
+        standard_deviation(DENSE)
+    # the inner variance call notes its path on its own list
+    assert p.stats["standard_deviation"]["paths"] == {"python": 1}
+    assert p.stats["variance"]["paths"] == {"integer": 1}
+
+
+def test_nested_profiles_and_inactive():
+    median(DENSE)
+    with profile() as outer:
+        median(DENSE)
+        with profile() as inner:
+            median(FLOATS)
+    assert outer.stats["median"]["paths"] == {"counting": 1, "sort": 1}
+    assert inner.stats["median"]["paths"] == {"sort": 1}
+    assert _active == []
+
+
+def test_paths_across_threads():
+    barrier = threading.Barrier(8)
+
+    def call(numbers):
+        # all threads are inside a call at once
+        barrier.wait()
+        return median(numbers)
+
+    with profile() as p:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(call, [DENSE, FLOATS] * 4))
+    assert p.stats["median"]["paths"] == {"counting": 4, "sort": 4}
+
+
+def test_paths_across_tasks():
+    async def call(numbers):
+        await asyncio.sleep(0)
+        return median(numbers)
+
+    async def main():
+        await asyncio.gather(*(call(n) for n in [DENSE, FLOATS] * 4))
+
+    with profile() as p:
+        asyncio.run(main())
+    assert p.stats["median"]["paths"] == {"counting": 4, "sort": 4}
@@ -0,0 +1,169 @@
+import random
+from array import array
+from collections import Counter
+from fractions import Fraction
+
+import pytest
+
+from simplestat import _optional, mean, median, mode, profile, variance
+from simplestat import stats
+
+np = _optional.numpy()
+needs_numpy = pytest.mark.skipif(np is None, reason="numpy is not installed")
+
+random.seed(29)
+
+
+@pytest.fixture
+def without_numpy(monkeypatch):
+    monkeypatch.setattr(_optional, "_numpy", False)
+
+
+def run(func, numbers, *args):
+    # func(numbers), and the implementation path it took
+    with profile() as p:
+        result = func(numbers, *args)
+    (path,) = p.stats[func.__name__]["paths"]
+    return result, path
+
+
+# the plain paths the fast paths must agree with
+
+
+def sorted_median(numbers):
+    values = sorted(numbers)
+    mid = len(values) // 2
+    if len(values) % 2 == 0:
+        return (values[mid - 1] + values[mid]) / 2
+    return values[mid]
+
+
+def counter_mode(numbers):
+    frequency = Counter(numbers)
+    top = max(frequency.values())
+    modes = [value for value, count in frequency.items() if count == top]
+    if len(modes) == len(frequency):
+        raise ValueError("No unique mode found")
+    return modes[0]
+
+
+def exact_variance(numbers, sample=True):
+    values = [Fraction(x) for x in numbers]
+    avg = sum(values) / len(values)
+    divisor = len(values) - 1 if sample else len(values)
+    return float(sum((x - avg) ** 2 for x in values) / divisor)
+
+
+def ints(n, low, high):
+    return [random.randint(low, high) for _ in range(n)]
+
+
+@pytest.mark.parametrize("n", [4096, 4097])
+def test_counting_median_threshold(n):
+    limit = n // stats._COUNTING_RATIO
+    # a range just below the limit is counted, at the limit it is sorted
+    dense = ints(n, -50, -50 + limit - 1)
+    assert run(median, dense) == (sorted_median(dense), "counting")
+    wide = ints(n, -50, -50 + limit)
+    wide[0], wide[1] = -50, -50 + limit
+    assert run(median, wide) == (sorted_median(wide), "sort")
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 1000, 1001])
+def test_counting_median_lengths(n):
+    numbers = ints(n, -3, 3) * 64
+    assert run(median, numbers) == (sorted_median(numbers), "counting")
+    assert median(numbers[:-1]) == sorted_median(numbers[:-1])
+
+
+def test_counting_median_outside_the_sample():
+    n = 64 * stats._SAMPLE_SIZE
+    step = n // stats._SAMPLE_SIZE
+    # values the strided sample skips still decide the path
+    for odd in [10**9, 2.5]:
+        numbers = ints(n, 0, 10)
+        numbers[step // 2] = odd
+        assert run(median, numbers) == (sorted_median(numbers), "sort")
+    # a bool counts as the int it equals
+    numbers[step // 2] = True
+    assert median(numbers) == sorted_median(numbers)
+
+
+def test_median_of_other_types():
+    assert run(median, [True, False, True]) == (True, "sort")
+    floats = [random.random() for _ in range(5000)]
+    assert run(median, floats) == (sorted_median(floats), "sort")
+    assert run(median, (3, 1, 2) * 100) == (2, "counting")
+
+
+@needs_numpy
+@pytest.mark.parametrize("n", [999, 1000])
+def test_numpy_median(n):
+    for numbers in [ints(n, -(10**12), 10**12), ints(n, -5, 5)]:
+        assert run(median, np.array(numbers)) == (
+            sorted_median(numbers),
+            "numpy-partition",
+        )
+        result, path = run(median, array("q", numbers))
+        assert (result, path) == (sorted_median(numbers), "numpy-partition")
+    unsigned = np.array([2**64 - 1, 0, 2**63], dtype=np.uint64)
+    assert median(unsigned) == 2**63
+
+
+def test_array_median_without_numpy(without_numpy):
+    numbers = ints(5000, -20, 20)
+    assert run(median, array("q", numbers)) == (sorted_median(numbers), "counting")
+    numbers = ints(5000, -(10**6), 10**6)
+    assert run(median, array("q", numbers)) == (sorted_median(numbers), "sort")
+
+
+@needs_numpy
+def test_numpy_mode():
+    dense = ints(5000, -10, 10)
+    assert run(mode, np.array(dense)) == (counter_mode(dense), "numpy-bincount")
+    sparse = ints(50, -(10**15), 10**15) * 2 + [7, 7, 7]
+    assert run(mode, np.array(sparse)) == (counter_mode(sparse), "numpy-unique")
+    unsigned = np.array([2**64 - 1, 5, 2**64 - 1], dtype=np.uint64)
+    assert mode(unsigned) == 2**64 - 1
+    # ties go to the value seen first, as with Counter
+    for ties in [[3, 1, 1, 3, 2], [-(10**15), 5, 5, -(10**15), 1]]:
+        assert mode(np.array(ties)) == counter_mode(ties)
+    for no_mode in [[1, 2, 3], [4, 4, -(10**15), -(10**15)]]:
+        with pytest.raises(ValueError, match="No unique mode"):
+            mode(np.array(no_mode))
+
+
+def test_counter_mode():
+    assert run(mode, [3, 1, 1, 3, 2]) == (3, "counter")
+    assert mode([True, False, False]) is False
+    with pytest.raises(ValueError, match="No unique mode"):
+        mode([1, 2])
+
+
+@needs_numpy
+def test_exact_sums_and_int64_overflow():
+    for numbers in [
+        ints(1000, -100, 100),
+        # the sum overflows int64
+        [2**62, 2**62, 2**62 - 1, -5],
+        # the squares overflow int64, the sum does not
+        ints(1000, -(2**40), 2**40),
+    ]:
+        for data in [np.array(numbers), array("q", numbers)]:
+            assert run(mean, data) == (sum(numbers) / len(numbers), "numpy")
+            result, path = run(variance, data)
+            assert path == "numpy-exact"
+            assert result == exact_variance(numbers)
+            assert variance(data, False) == exact_variance(numbers, False)
+
+
+def test_integer_variance():
+    for numbers in [ints(1001, -(10**18), 10**18), [True, False, True, 2]]:
+        assert run(variance, numbers) == (exact_variance(numbers), "integer")
+    floats = [random.uniform(-1, 1) for _ in range(1000)]
+    result, path = run(variance, floats)
+    assert path == "python"
+    assert result == pytest.approx(exact_variance(floats))
+    # a float anywhere turns the integer path off
+    mixed = ints(1000, 0, 10) + [0.5]
+    assert run(variance, mixed)[1] == "python"